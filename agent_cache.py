@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import dspy
+import sql_engine
+from sql_agent import SQLAgent
+
+
+## Result cache around SQLAgent.
+## Maps (normalized question, history fingerprint, context) to the final
+## dspy.Prediction in a bounded LRU with a TTL. Every entry is tied to the
+## database version, so the cache empties itself when the SQLite data changes,
+## and to the program version when the wrapped agent is a program_store.LiveAgent.
+##   sql_agent.load_agent(cache=True), chat_server.py --result-cache
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+def fingerprint(value) -> str:
+    if not value:
+        return ""
+    payload = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class DataVersion:
+    """Tracks changes to a SQLite database file.
+
+    `PRAGMA data_version` changes whenever another connection commits, so one
+    long-lived connection is kept open to read it. The file's inode is included
+    so replacing the database file also counts as a change.
+    """
+
+    def __init__(self, db_path: str = sql_engine.DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._conn_stat = None
+        self._lock = threading.Lock()
+
+    def _stat_key(self):
+        try:
+            stat = os.stat(self.db_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
+    def current(self):
+        with self._lock:
+            stat_key = self._stat_key()
+            if stat_key is None:
+                return None
+            if self._conn is None or self._conn_stat != stat_key:
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+                self._conn_stat = stat_key
+            (data_version,) = self._conn.execute("PRAGMA data_version").fetchone()
+            return (stat_key, data_version)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CachedSQLAgent(dspy.Module):
+    def __init__(self, agent, maxsize: int = 1024, ttl: float = 3600, data_version: DataVersion = None):
+        super().__init__()
+        self.agent = agent
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data_version = data_version or DataVersion()
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @property
+    def retrieve(self):
+        return self.agent.retrieve
+
+    def cache_key(self, question, context=None, history=None):
+        return (normalize_question(question), fingerprint(history), fingerprint(context))
+
+    def _check_version(self):
+        # A program_store.LiveAgent swap changes the answers as much as new data does
+        version = (self.data_version.current(), getattr(self.agent, "version", None))
+        if version != self._version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+            self._entries.clear()
+            self._version = version
+
+    def lookup(self, key):
+        """(cached prediction or None, the version it was checked against)."""
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, prediction = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return prediction, self._version
+                del self._entries[key]
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+            return None, self._version
+
+    def store(self, key, prediction, version):
+        with self._lock:
+            # The data changed while the agent was running; the answer may be stale
+            if version != self._version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, prediction)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def forward(self, question, context=None, history=None):
+        key = self.cache_key(question, context, history)
+        # The version is read under the same lock as the entry, so an invalidation
+        # between the two cannot let a stale answer be stored as current
+        prediction, version = self.lookup(key)
+        if prediction is not None:
+            return prediction
+
+        prediction = self.agent(question=question, context=context, history=history)
+        if not prediction.answer.startswith("Error:"):
+            self.store(key, prediction, version)
+        return prediction
+
+    async def aforward(self, question, context=None, history=None):
+        key = self.cache_key(question, context, history)
+        prediction, version = self.lookup(key)
+        if prediction is not None:
+            return prediction
+
+        prediction = await self.agent.aforward(question=question, context=context, history=history)
+        if not prediction.answer.startswith("Error:"):
+            self.store(key, prediction, version)
+        return prediction
+
+    # SQLAgent's bounded-concurrency batching, with every question going through aforward above
+    abatch = SQLAgent.abatch
+    batch = SQLAgent.batch
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,71 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import dspy
+from agent_cache import CachedSQLAgent, DataVersion
+from bench_lm_cache import QUESTIONS
+from evaluate_agent import build_agent
+from fake_lm import FakeLM
+from metrics import latency_summary
+import sql_engine
+
+
+## Benchmark: CachedSQLAgent in front of the offline agent (FakeLM with
+## latency). Times the first pass over the questions (misses), repeat passes
+## with the questions re-cased and re-punctuated (hits after normalization),
+## one batch() of them (the async path), then a commit to the watched database
+## and one more pass, which must miss again. The commit goes to a copy of electrical_parts.db, so the seed data
+## is untouched. The agent itself still reads the real database.
+##   python bench_agent_cache.py --lm-latency-ms 20 --rounds 20
+
+
+def variant(question: str, round_number: int) -> str:
+    return question.upper() if round_number % 2 else f"  {question.lower().rstrip('?')} ?"
+
+
+def run_pass(agent, questions: list) -> list:
+    timings = []
+    for question in questions:
+        start = time.perf_counter()
+        agent(question=question)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--rounds", type=int, default=20, help="repeat passes after the first")
+    args = parser.parse_args()
+
+    dspy.configure(lm=FakeLM(QUESTIONS, latency_ms=args.lm_latency_ms))
+    questions = list(QUESTIONS)
+    with tempfile.TemporaryDirectory() as directory:
+        watched = os.path.join(directory, "watched.db")
+        shutil.copy(sql_engine.DEFAULT_DB_PATH, watched)
+        agent = CachedSQLAgent(build_agent(offline=True), data_version=DataVersion(watched))
+
+        misses = run_pass(agent, questions)
+        hits = [ms for n in range(args.rounds) for ms in run_pass(agent, [variant(q, n) for q in questions])]
+        start = time.perf_counter()
+        batched = agent.batch([variant(q, 0) for q in questions])
+        batch_ms = (time.perf_counter() - start) * 1000
+        assert [p.answer for p in batched] == [agent(question=q).answer for q in questions]
+        with sqlite3.connect(watched) as conn:
+            conn.execute("INSERT INTO categories (name) VALUES ('bench')")
+        after_write = run_pass(agent, questions)
+        agent.data_version.close()
+
+    print(f"{len(questions)} questions, FakeLM latency {args.lm_latency_ms:.0f}ms")
+    for name, timings in (("first pass (miss)", misses), ("repeats (hit)", hits), ("after a commit", after_write)):
+        summary = latency_summary(timings)
+        print(f"  {name:<18} p50={summary['p50']:9.3f}ms  p95={summary['p95']:9.3f}ms  n={len(timings)}")
+    print(f"  batch() of {len(questions)} cached questions {batch_ms:.1f}ms")
+    print(f"  stats {agent.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import time
+import dspy
+from chroma_setup import create_local_collection
+from fake_lm import FakeLM
+from intent_guard import READ_EXAMPLES
+from local_embedding import HashingEmbeddingFunction
+from schema_retrieval import RetrieveSchema
+from sql_agent import SQLAgent
+
+
+## Throughput benchmark for SQLAgent.batch.
+## Runs the full pipeline (async retrieval, ReAct, execute_sql) against a local
+## FakeLM whose per-call latency stands in for the provider round-trip, and
+## reports questions/s at increasing concurrency.
+##   python bench_batch.py --lm-latency-ms 200 --questions 64
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=64)
+    parser.add_argument("--lm-latency-ms", type=float, default=100.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    collection = create_local_collection(HashingEmbeddingFunction())
+    agent = SQLAgent(retrieve=RetrieveSchema(collection=collection))
+
+    questions = [READ_EXAMPLES[i % len(READ_EXAMPLES)] for i in range(args.questions)]
+    # Write requests are refused by the guard without any LM call
+    questions[1] = "Delete all orders"
+
+    lm = FakeLM(latency_ms=args.lm_latency_ms)
+    print(f"{args.questions} questions, fake LM latency {args.lm_latency_ms}ms")
+    baseline = None
+    with dspy.context(lm=lm):
+        for concurrency in args.concurrency:
+            lm.calls = 0
+            start = time.perf_counter()
+            results = agent.batch(questions, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            throughput = len(questions) / elapsed
+            baseline = baseline or throughput
+            errors = sum(result.answer.startswith("Error:") for result in results)
+            print(
+                f"concurrency={concurrency:<3} {throughput:7.1f} questions/s  "
+                f"scaling={throughput / baseline:5.1f}x (ideal {concurrency}x)  "
+                f"lm_calls={lm.calls} errors={errors}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import aiohttp
+import dspy
+from aiohttp import web
+import metrics
+from bench_lm_cache import QUESTIONS
+from chat_server import build_server
+from fake_lm import FakeLM
+
+
+## Load test: many concurrent chat sessions against chat_server, with FakeLM
+## (--lm-latency-ms per call) standing in for the hosted model. Each simulated
+## user opens a session and sends --turns questions over POST /chat (or one
+## WebSocket with --ws), reading the streamed events. Reports completed
+## sessions and turns per second, time to the first streamed step and to the
+## full answer (p50/p95/p99), and the server's session store counters.
+## Without --url the server runs in this process on a free port.
+##   python bench_chat_server.py --users 200 --concurrency 50 --turns 3 --lm-latency-ms 200
+##   python bench_chat_server.py --url http://127.0.0.1:8080 --ws
+
+
+async def http_session(client, url: str, user: str, questions: list, timings: dict):
+    session_id = None
+    for question in questions:
+        start = time.perf_counter()
+        first = None
+        async with client.post(f"{url}/chat", json={"session_id": session_id, "user": user, "message": question}) as r:
+            r.raise_for_status()
+            async for line in r.content:
+                event = json.loads(line)
+                if event["type"] == "session":
+                    session_id = event["session_id"]
+                elif first is None:
+                    first = time.perf_counter() - start
+                if event["type"] == "error":
+                    raise RuntimeError(event["message"])
+        timings["first"].append(first * 1000)
+        timings["turn"].append((time.perf_counter() - start) * 1000)
+
+
+async def ws_session(client, url: str, user: str, questions: list, timings: dict):
+    async with client.ws_connect(f"{url}/ws", params={"user": user}) as ws:
+        await ws.receive_json()  # session event
+        for question in questions:
+            start = time.perf_counter()
+            first = None
+            await ws.send_json({"message": question})
+            while True:
+                event = await ws.receive_json()
+                if first is None and event["type"] != "session":
+                    first = time.perf_counter() - start
+                if event["type"] == "error":
+                    raise RuntimeError(event["message"])
+                if event["type"] == "done":
+                    break
+            timings["first"].append(first * 1000)
+            timings["turn"].append((time.perf_counter() - start) * 1000)
+
+
+async def load(url: str, users: int, concurrency: int, turns: int, use_ws: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    questions = list(QUESTIONS)
+    timings = {"first": [], "turn": [], "session": []}
+    errors = []
+    limiter = asyncio.Semaphore(concurrency)
+    run_session = ws_session if use_ws else http_session
+
+    async def simulate(index):
+        async with limiter:
+            start = time.perf_counter()
+            try:
+                await run_session(client, url, f"Load User {index}", rng.sample(questions, turns), timings)
+                timings["session"].append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(simulate(index) for index in range(users)))
+        elapsed = time.perf_counter() - start
+        async with client.get(f"{url}/stats") as r:
+            stats = await r.json()
+    return {"elapsed": elapsed, "timings": timings, "errors": errors, "server": stats}
+
+
+async def run_local(args) -> dict:
+    dspy.configure(lm=FakeLM(QUESTIONS, latency_ms=args.lm_latency_ms))
+    server = build_server(offline=True, program_path=args.program, strategy=args.strategy, workers=args.workers,
+                          ttl=args.ttl, max_bytes=int(args.max_mb * 2**20))
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await load(f"http://127.0.0.1:{port}", args.users, args.concurrency, args.turns, args.ws, args.seed)
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="load an already running server instead of a local one")
+    parser.add_argument("--users", type=int, default=200, help="sessions to simulate")
+    parser.add_argument("--concurrency", type=int, default=50, help="sessions open at once")
+    parser.add_argument("--turns", type=int, default=3, help=f"questions per session (at most {len(QUESTIONS)})")
+    parser.add_argument("--ws", action="store_true", help="use the WebSocket endpoint instead of POST /chat")
+    parser.add_argument("--lm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--strategy", choices=["react", "one_shot"], default="react")
+    parser.add_argument("--program", default="optimized_agent.json")
+    parser.add_argument("--ttl", type=float, default=30 * 60)
+    parser.add_argument("--max-mb", type=float, default=256.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.turns = min(args.turns, len(QUESTIONS))
+
+    if args.url:
+        result = asyncio.run(load(args.url.rstrip("/"), args.users, args.concurrency, args.turns, args.ws, args.seed))
+    else:
+        result = asyncio.run(run_local(args))
+
+    timings, elapsed = result["timings"], result["elapsed"]
+    print(f"{args.users} sessions x {args.turns} turns, {args.concurrency} concurrent, "
+          f"{'websocket' if args.ws else 'http'}, FakeLM latency {args.lm_latency_ms}ms (local server only)")
+    print(f"  {len(timings['session']) / elapsed:8.2f} sessions/s  {len(timings['turn']) / elapsed:8.2f} turns/s  "
+          f"({elapsed:.2f}s, {len(result['errors'])} failed sessions)")
+    for name, label in (("first", "first event"), ("turn", "full turn"), ("session", "session")):
+        summary = metrics.latency_summary(timings[name])
+        print(f"  {label:<12} p50={summary['p50']:9.1f}ms  p95={summary['p95']:9.1f}ms  p99={summary['p99']:9.1f}ms")
+    print(f"  server sessions: {result['server']['sessions']}")
+    for error in sorted(set(result["errors"]))[:5]:
+        print(f"  error: {error}")
+
+
+if __name__ == "__main__":
+    main()
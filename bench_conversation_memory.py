@@ -0,0 +1,55 @@
+import argparse
+import time
+from conversation_memory import ConversationMemory, count_tokens
+
+
+## Benchmark: prompt history size and per-turn bookkeeping cost over a long
+## session, for the old unbounded list (before) and ConversationMemory (after).
+## No LM involved: it measures what the chatbot would send to GenerateSQL.
+##   python bench_conversation_memory.py --turns 2000
+
+QUESTIONS = [
+    ("How many orders did customer Alice Cooper place?",
+     "SELECT COUNT(*) FROM orders o JOIN customers c ON o.customer_id = c.customer_id WHERE c.name = 'Alice Cooper'"),
+    ("What is the tax rate for customers in california?", "SELECT tax_rate FROM taxes WHERE state = 'california'"),
+    ("Show me the items in order 2", "SELECT * FROM order_items WHERE order_id = 2"),
+    ("How many transformers are in stock?",
+     "SELECT stock_quantity FROM products WHERE name = 'Mini Transformer 220V-110V'"),
+]
+ANSWER = "Sure! Based on the database, the result for your question is 42, which covers every matching row."
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--max-turns", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    args = parser.parse_args()
+
+    unbounded = []
+    memory = ConversationMemory(max_turns=args.max_turns, max_tokens=args.max_tokens)
+    checkpoints = {10, 100, 1000, args.turns}
+    print(f"{'turn':>6} {'before tokens':>14} {'before us/turn':>15} {'after tokens':>13} {'after us/turn':>14}")
+    for turn in range(1, args.turns + 1):
+        question, sql = QUESTIONS[turn % len(QUESTIONS)]
+
+        start = time.perf_counter()
+        history = list(unbounded)  # what SQLChatbot passed to GenerateSQL
+        unbounded.append(f"User: {question}")
+        unbounded.append(f"Bot: {ANSWER}")
+        before_us = (time.perf_counter() - start) * 1e6
+
+        start = time.perf_counter()
+        history = memory.history()
+        memory.add_turn(question, ANSWER, sql)
+        after_us = (time.perf_counter() - start) * 1e6
+
+        if turn in checkpoints:
+            before_tokens = sum(count_tokens(line) for line in unbounded)
+            print(f"{turn:>6} {before_tokens:>14} {before_us:>15.1f} {memory.token_count:>13} {after_us:>14.1f}")
+    print("final memory:")
+    print("\n".join(history))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import contextlib
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text
+import sql_engine
+
+
+## Micro-benchmark: per-call latency of execute_sql before and after the shared
+## engine. "before" reproduces the old behaviour (a fresh echo=True engine per
+## call), "after" goes through sql_engine.execute_sql.
+##   python bench_execute_sql.py --calls 500 --threads 8
+
+QUERIES = [
+    "SELECT stock_quantity FROM products WHERE name LIKE '%Transformer%'",
+    "SELECT price FROM products WHERE name = 'LED Light Bulb 10W'",
+    "SELECT name FROM categories",
+    "SELECT COUNT(*) FROM orders JOIN customers ON orders.customer_id = customers.customer_id WHERE customers.name = 'Alice Cooper'",
+]
+
+
+def execute_sql_before(query: str):
+    engine = create_engine(f"sqlite:///{sql_engine.DEFAULT_DB_PATH}", echo=True)
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(text(query)).fetchall()
+        return result
+    except Exception as e:
+        return {"error": str(e), "valid": False}
+
+
+def measure(fn, calls: int):
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(QUERIES[i % len(QUERIES)])
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, timings: list):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<22} mean={statistics.mean(timings):8.3f}ms  p50={statistics.median(timings):8.3f}ms  p95={p95:8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if not os.path.exists(sql_engine.DEFAULT_DB_PATH):
+        from db_setup import create_db
+        create_db()
+
+    # echo=True logs every statement to stdout; keep it out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        before = measure(execute_sql_before, args.calls)
+    sql_engine.execute_sql(QUERIES[0])  # warm the pool
+    after = measure(sql_engine.execute_sql, args.calls)
+
+    print(f"{args.calls} calls against {sql_engine.DEFAULT_DB_PATH}")
+    report("before (engine/call)", before)
+    report("after (shared pool)", after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.1f}x")
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(sql_engine.execute_sql, QUERIES * (args.calls // len(QUERIES))))
+        elapsed = time.perf_counter() - start
+    errors = sum(isinstance(r, dict) for r in results)
+    print(f"after, {args.threads} threads: {len(results) / elapsed:.0f} queries/s, {errors} errors")
+
+
+if __name__ == "__main__":
+    main()
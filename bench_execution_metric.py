@@ -0,0 +1,117 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import dspy
+from bench_lm_cache import QUESTIONS
+from execution_metric import ExecutionMetric, normalize_sql
+from query_guard import QueryBudget
+import sql_engine
+
+
+## Benchmark: exact-text vs execution-equivalence scoring of predicted SQL.
+## Each gold query from bench_lm_cache.QUESTIONS gets a rewritten equivalent
+## (aliases, subqueries, row order) and a wrong variant. Reports how many
+## each metric accepts, the cost of a cold vs memoized check, gold hashing
+## with a cold vs warm gold cache file, and a runaway query hitting the budget.
+## Finally a row is committed to a copy of electrical_parts.db: the gold hashes
+## (in memory and in the gold cache file) must be recomputed, not reused.
+##   python bench_execution_metric.py --rounds 20
+
+EQUIVALENT = [
+    "select sum(p.stock_quantity) as total from products p where p.name like '%Transformer%'",
+    "SELECT p.price FROM products AS p WHERE p.name = 'LED Light Bulb 10W'",
+    "SELECT name FROM categories ORDER BY name DESC",
+    "SELECT COUNT(order_id) FROM orders WHERE customer_id IN (SELECT customer_id FROM customers WHERE name = 'Alice Cooper')",
+    "SELECT t.tax_rate FROM taxes t WHERE t.state = 'california'",
+    "SELECT products.name FROM suppliers JOIN products ON products.supplier_id = suppliers.supplier_id "
+    "WHERE suppliers.name = 'ElectroSupply Inc.'",
+]
+WRONG = [
+    "SELECT SUM(stock_quantity) FROM products",
+    "SELECT price FROM products WHERE name = 'LED Light Bulb 20W'",
+    "SELECT name FROM categories LIMIT 2",
+    "SELECT COUNT(*) FROM orders",
+    "SELECT tax_rate FROM taxes WHERE state = 'texas'",
+    "SELECT name FROM products",
+]
+# Never finishes on its own
+RUNAWAY = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT COUNT(*) FROM n"
+
+
+def text_match(example, pred, trace=None):
+    """The previous metric: exact (case-insensitive) SQL text."""
+    return example.sql_query.lower().strip() == pred.sql_query.lower().strip()
+
+
+def check_database_change(directory: str, example, equivalent: str) -> str:
+    """Scores `equivalent` against a copy of the database before and after a commit."""
+    path = os.path.join(directory, "changed.db")
+    gold_path = os.path.join(directory, "changed_gold.json")
+    with sqlite3.connect(f"file:{sql_engine.DEFAULT_DB_PATH}?mode=ro", uri=True) as source, sqlite3.connect(path) as copy:
+        source.backup(copy)
+    url, key = sql_engine.sqlite_url(path), normalize_sql(example.sql_query)
+    metric = ExecutionMetric([example], url=url, gold_cache_path=gold_path)
+    before = metric.gold[key]
+    assert metric(example, dspy.Prediction(sql_query=equivalent, answer=""))
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO categories (name) VALUES ('zzz bench')")
+    executions = metric.stats["executions"]
+    assert metric(example, dspy.Prediction(sql_query=equivalent, answer=""))
+    after = metric.gold[key]
+    assert after != before and metric.stats["executions"] == executions + 2, "stale gold or memo reused"
+    reloaded = ExecutionMetric([example], url=url, gold_cache_path=gold_path)
+    assert reloaded.gold[key] == after and reloaded.stats["executions"] == 0
+    return f"gold {before[0]} -> {after[0]}, gold and predicted query re-executed"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20, help="times each prediction is scored (memoized after the first)")
+    args = parser.parse_args()
+
+    examples = [dspy.Example(question=q, sql_query=sql, answer="").with_inputs("question") for q, sql in QUESTIONS.items()]
+    with tempfile.TemporaryDirectory() as directory:
+        gold_path = os.path.join(directory, "gold.json")
+        start = time.perf_counter()
+        metric = ExecutionMetric(examples, gold_cache_path=gold_path)
+        cold_gold_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        warm = ExecutionMetric(examples, gold_cache_path=gold_path)
+        warm_gold_ms = (time.perf_counter() - start) * 1000
+        assert warm.gold == metric.gold and warm.stats["executions"] == 0
+
+        rows = []
+        for name, variants in (("equivalent", EQUIVALENT), ("wrong", WRONG)):
+            predictions = [dspy.Prediction(sql_query=sql, answer="") for sql in variants]
+            text = sum(text_match(example, pred) for example, pred in zip(examples, predictions))
+            start = time.perf_counter()
+            executed = sum(metric(example, pred) for example, pred in zip(examples, predictions))
+            cold_ms = (time.perf_counter() - start) * 1000 / len(examples)
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                for example, pred in zip(examples, predictions):
+                    metric(example, pred)
+            memo_ms = (time.perf_counter() - start) * 1000 / (len(examples) * args.rounds)
+            rows.append((name, text, executed, cold_ms, memo_ms))
+
+        slow = ExecutionMetric(budget=QueryBudget(max_seconds=0.2), gold_cache_path=None)
+        start = time.perf_counter()
+        timeout = slow.run(RUNAWAY)
+        timeout_ms = (time.perf_counter() - start) * 1000
+
+        changed = check_database_change(directory, examples[2], EQUIVALENT[2])
+
+    print(f"{len(examples)} gold queries; gold hashing cold {cold_gold_ms:.1f}ms, warm (cached file) {warm_gold_ms:.1f}ms")
+    for name, text, executed, cold_ms, memo_ms in rows:
+        print(f"  {name:<10} accepted: text {text}/{len(examples)}  execution {executed}/{len(examples)}  "
+              f"per check: cold {cold_ms:.2f}ms, memoized {memo_ms:.3f}ms")
+    print(f"  metric stats: {metric.stats}")
+    print(f"  runaway query under a 0.2s budget: {timeout[1]!r} after {timeout_ms:.0f}ms")
+    print(f"  after a commit to the database: {changed}")
+
+
+if __name__ == "__main__":
+    main()
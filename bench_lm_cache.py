@@ -0,0 +1,80 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import dspy
+from chroma_setup import create_local_collection
+from fake_lm import FakeLM
+from lm_cache import CachedLM, LMCacheMiss
+from local_embedding import HashingEmbeddingFunction
+from schema_retrieval import RetrieveSchema
+from sql_agent import SQLAgent
+
+
+## Benchmark: full SQLAgent runs against a slow LM (FakeLM with --lm-latency-ms),
+## first recording through CachedLM, then replaying the same questions from a
+## fresh CachedLM on the same file (disk hits) and again from that instance
+## (memory hits). Checks that replayed answers match the recorded ones and
+## that replay mode fails fast on an unseen prompt.
+##   python bench_lm_cache.py --lm-latency-ms 300
+
+QUESTIONS = {
+    "How many transformers are in stock?": "SELECT SUM(stock_quantity) FROM products WHERE name LIKE '%Transformer%'",
+    "What is the cost of a 10W LED bulb?": "SELECT price FROM products WHERE name = 'LED Light Bulb 10W'",
+    "List all categories of electrical parts.": "SELECT name FROM categories",
+    "How many orders did customer Alice Cooper place?":
+        "SELECT COUNT(*) FROM orders o JOIN customers c ON o.customer_id = c.customer_id WHERE c.name = 'Alice Cooper'",
+    "What is the tax rate for customers in california?": "SELECT tax_rate FROM taxes WHERE state = 'california'",
+    "Show me all products supplied by ElectroSupply Inc.":
+        "SELECT p.name FROM products p JOIN suppliers s ON p.supplier_id = s.supplier_id WHERE s.name = 'ElectroSupply Inc.'",
+}
+
+
+def run(agent, lm):
+    timings, answers = [], []
+    with dspy.context(lm=lm):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            answers.append(agent(question=question).answer)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings, answers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lm-latency-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    retrieve = RetrieveSchema(collection=create_local_collection(HashingEmbeddingFunction()))
+    agent = SQLAgent(retrieve=retrieve)
+    fake = FakeLM(QUESTIONS, latency_ms=args.lm_latency_ms)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "responses.db")
+        recorder = CachedLM(fake, mode="record", path=path)
+        record_ms, recorded = run(agent, recorder)
+
+        replayer = CachedLM(fake, mode="replay", path=path)
+        disk_ms, replayed = run(agent, replayer)
+        memory_ms, replayed_again = run(agent, replayer)
+        assert recorded == replayed == replayed_again, "replayed answers differ from the recorded ones"
+
+        try:
+            with dspy.context(lm=replayer):
+                agent(question="Which supplier has the most products?")
+            miss = "no error"
+        except LMCacheMiss as e:
+            miss = f"LMCacheMiss: {e}"
+
+        print(f"{len(QUESTIONS)} questions, LM latency {args.lm_latency_ms}ms, {fake.calls} LM calls while recording")
+        for name, timings in (("record (cold)", record_ms), ("replay (disk)", disk_ms), ("replay (memory)", memory_ms)):
+            print(f"  {name:<16} mean={statistics.mean(timings):8.2f}ms  max={max(timings):8.2f}ms")
+        print(f"  recorder: {recorder.stats()}")
+        print(f"  replayer: {replayer.stats()}")
+        print(f"  unseen prompt in replay mode -> {miss}")
+        recorder.store.close()
+
+
+if __name__ == "__main__":
+    main()
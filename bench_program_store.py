@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+## Benchmark: redeploying a program under load.
+## Client threads ask questions through a LiveAgent (FakeLM with latency; odd
+## clients go through the async LiveAgent.acall) while the store's CURRENT
+## pointer is moved to a corrupted version (refused, then rolled back), to a
+## new version, and rolled back again. First it checks that an async call
+## started before a swap finishes on the agent it started with. Reports requests
+## served and failed, latency percentiles overall and in the second after each
+## step, and the time from the pointer flip to the swap. It also reports the first request of an
+## unwarmed agent, and a restart (fresh process: import, build, load, first
+## request) for comparison.
+##   python bench_program_store.py --clients 8 --lm-latency-ms 20
+
+QUESTION = "How many transformers are in stock?"
+QUESTIONS = [QUESTION, "List all categories of electrical parts.", "What is the cost of a 10W LED bulb?"]
+
+
+def child(program_path: str):
+    start = time.perf_counter()
+    import dspy
+    from evaluate_agent import build_agent
+    from fake_lm import FakeLM
+    dspy.configure(lm=FakeLM())
+    agent = build_agent(offline=True, program_path=program_path)
+    agent(question=QUESTION)
+    print(json.dumps({"restart": time.perf_counter() - start}))
+
+
+def variant(program_path: str, directory: str, keep: int) -> str:
+    """A copy of the saved program keeping the first `keep` demos of each predictor."""
+    with open(program_path) as f:
+        state = json.load(f)
+    for value in state.values():
+        if isinstance(value, dict) and "demos" in value:
+            value["demos"] = value["demos"][:keep]
+    path = os.path.join(directory, f"program_{keep}.json")
+    with open(path, "w") as f:
+        json.dump(state, f)
+    return path
+
+
+def check_async_swap():
+    """An async call started before a swap finishes on the agent it started with."""
+    from program_store import LiveAgent
+
+    class Agent:
+        def __init__(self, name):
+            self.name = name
+
+        async def aforward(self, question):
+            await asyncio.sleep(0.05)
+            return self.name
+
+    async def run():
+        live = LiveAgent(Agent("old"), version="old")
+        call = asyncio.create_task(live.acall(question=QUESTION))
+        await asyncio.sleep(0.01)
+        live.swap(Agent("new"), version="new")
+        return await call, await live.acall(question=QUESTION)
+
+    assert asyncio.run(run()) == ("old", "new")
+
+
+def wait_for(live, version: str, timeout: float = 30.0) -> float:
+    start = time.perf_counter()
+    while live.version != version:
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"still serving {live.version}, expected {version}")
+        time.sleep(0.001)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--program", default="optimized_agent.json")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--lm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--phase-seconds", type=float, default=2.0, help="load between deployment steps")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.program)
+        return
+    check_async_swap()
+
+    import dspy
+    import metrics
+    from evaluate_agent import build_agent
+    from fake_lm import FakeLM
+    from program_store import ProgramStore, serve_from_store
+    from train_set import train_data
+
+    lm = FakeLM({example.question: example.sql_query for example in train_data}, latency_ms=args.lm_latency_ms)
+    dspy.configure(lm=lm)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProgramStore(os.path.join(directory, "store"))
+        first = store.publish(args.program, notes="baseline")
+        second = store.publish(variant(args.program, directory, keep=3), notes="3 demos", activate=False)
+        corrupt = store.publish(variant(args.program, directory, keep=1), notes="corrupted", activate=False)
+        with open(os.path.join(store.versions_dir, corrupt, "program.json"), "r+b") as f:
+            f.seek(100)
+            f.write(b"#")
+
+        template = build_agent(offline=True, program_path=None)
+        start = time.perf_counter()
+        live, watcher = serve_from_store(template, store, interval=0.05)
+        initial_load = time.perf_counter() - start
+
+        records, stop = [], threading.Event()
+
+        def client(index):
+            n = index
+            while not stop.is_set():
+                question = QUESTIONS[n % len(QUESTIONS)]
+                n += 1
+                began = time.perf_counter()
+                try:
+                    if index % 2:
+                        answer = asyncio.run(live.acall(question=question)).answer
+                    else:
+                        answer = live(question=question).answer
+                    ok = not answer.startswith("Error")
+                except Exception:
+                    ok = False
+                records.append((began, (time.perf_counter() - began) * 1000, ok, index % 2))
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        bench_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        steps = []
+        for label, action, expected in [
+            ("activate corrupted", lambda: store.activate(corrupt), None),
+            ("rollback (no swap)", store.rollback, first),
+            ("activate new", lambda: store.activate(second), second),
+            ("rollback", store.rollback, first),
+        ]:
+            time.sleep(args.phase_seconds)
+            flipped = time.perf_counter()
+            action()
+            if expected is None:
+                time.sleep(0.5)  # a few watcher polls
+                steps.append((label, flipped, None, live.version))
+            else:
+                steps.append((label, flipped, wait_for(live, expected), live.version))
+        time.sleep(args.phase_seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        watcher.stop()
+        elapsed = time.perf_counter() - bench_start
+
+        fresh = build_agent(offline=True, program_path=None)
+        fresh.load_state(store.read(first))
+        began = time.perf_counter()
+        fresh(question=QUESTION)
+        unwarmed_ms = (time.perf_counter() - began) * 1000
+
+    restart = json.loads(subprocess.run([sys.executable, __file__, "--child", "--program", args.program],
+                                        capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1])
+
+    latencies = [latency for _, latency, _, _ in records]
+    failed = sum(not ok for _, _, ok, _ in records)
+    async_failed = sum(not ok for _, _, ok, is_async in records if is_async)
+    summary = metrics.latency_summary(latencies)
+    print(f"{len(records)} requests from {args.clients} clients in {elapsed:.1f}s, {failed} failed "
+          f"({async_failed} of them async); "
+          f"FakeLM latency {args.lm_latency_ms:.0f}ms")
+    print(f"  all requests       p50={summary['p50']:7.1f}ms  p99={summary['p99']:7.1f}ms")
+    for label, flipped, swap_seconds, serving in steps:
+        window = [latency for began, latency, _, _ in records if flipped <= began < flipped + 1.0]
+        after = metrics.latency_summary(window) if window else {"p50": 0.0, "p99": 0.0}
+        swap = f"swapped in {swap_seconds * 1000:7.1f}ms" if swap_seconds is not None else "refused, no swap    "
+        print(f"  {label:<20} {swap}  next 1s p50={after['p50']:7.1f}ms  p99={after['p99']:7.1f}ms  serving {serving}")
+    print(f"initial load + warm-up {initial_load * 1000:.1f}ms; unwarmed first request {unwarmed_ms:.1f}ms; "
+          f"restart (fresh process to first answer) {restart['restart'] * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
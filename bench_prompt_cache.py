@@ -0,0 +1,97 @@
+import argparse
+import time
+import dspy
+import metrics
+from bench_lm_cache import QUESTIONS
+from chroma_setup import create_local_collection
+from conversation_memory import count_tokens
+from fake_lm import FakeLM
+from local_embedding import HashingEmbeddingFunction
+from prompt_cache import CachedChatAdapter
+from schema_retrieval import RetrieveSchema
+from sql_agent import PROGRAM_PATH, SQLAgent
+from train_set import train_data
+
+
+## Benchmark: prompt rendering for the loaded optimized program.
+## Checks that CachedChatAdapter without a budget produces exactly the
+## messages dspy.ChatAdapter does, times adapter.format per call for the
+## ReAct step and the extract step, then runs the agent (FakeLM, guard off so
+## every question reaches the LM) with each adapter and reports prompt tokens
+## per LM call as counted by FakeLM and by the adapter.
+##   python bench_prompt_cache.py --budgets 250 450 --rounds 200
+
+WRITE_QUESTIONS = [example.question for example in train_data]
+
+
+def format_inputs(agent, question: str) -> list:
+    """(predictor, inputs) for the ReAct step and the extract step of `question`."""
+    context = agent.retrieve(question)
+    trajectory = {"thought_0": "I should query the database.", "tool_name_0": "execute_sql",
+                  "tool_args_0": {"query": QUESTIONS.get(question, "SELECT 1")}, "observation_0": "columns: n\nrows: 1\n42"}
+    base = {"question": question, "context": context, "history": []}
+    trajectory_text = agent.react._format_trajectory(trajectory)
+    return [
+        (agent.react.react, {**base, "trajectory": trajectory_text}),
+        (agent.react.extract.predict, {**base, "trajectory": trajectory_text}),
+    ]
+
+
+def run_agent(agent, adapter, lm, questions: list) -> dict:
+    calls = lm.calls
+    start = time.perf_counter()
+    with dspy.context(lm=lm, adapter=adapter):
+        for question in questions:
+            agent(question=question)
+    elapsed = time.perf_counter() - start
+    prompt_tokens = sum(entry["usage"]["prompt_tokens"] for entry in lm.history[-(lm.calls - calls):])
+    return {"lm_calls": lm.calls - calls, "prompt_tokens": prompt_tokens, "seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--program", default=PROGRAM_PATH)
+    parser.add_argument("--budgets", type=int, nargs="*", default=[250, 450])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    agent = SQLAgent(guard=False, retrieve=RetrieveSchema(collection=create_local_collection(HashingEmbeddingFunction())))
+    agent.load(args.program)
+    questions = list(QUESTIONS) + WRITE_QUESTIONS
+    plain, cached = dspy.ChatAdapter(), CachedChatAdapter()
+
+    cases = [case for question in questions for case in format_inputs(agent, question)]
+    for predictor, inputs in cases:
+        assert plain.format(predictor.signature, predictor.demos, inputs) == \
+            cached.format(predictor.signature, predictor.demos, inputs), "cached prompt differs from ChatAdapter's"
+
+    print(f"{len(questions)} questions, {len(agent.react.react.demos)} demos per predictor in {args.program}")
+    print("adapter.format per call:")
+    for name, adapter in [("ChatAdapter", plain), ("cached", cached)] + \
+            [(f"cached, {budget} tokens", CachedChatAdapter(demo_token_budget=budget)) for budget in args.budgets]:
+        start = time.perf_counter()
+        tokens = 0
+        for _ in range(args.rounds):
+            for predictor, inputs in cases:
+                messages = adapter.format(predictor.signature, predictor.demos, inputs)
+        for predictor, inputs in cases:
+            messages = adapter.format(predictor.signature, predictor.demos, inputs)
+            tokens += sum(count_tokens(message["content"]) for message in messages)
+        per_call_us = (time.perf_counter() - start) * 1e6 / ((args.rounds + 1) * len(cases))
+        print(f"  {name:<20} {per_call_us:8.1f}us  {tokens / len(cases):7.1f} prompt tokens")
+
+    print("agent runs (FakeLM prompt tokens, ~4 chars each):")
+    lm = FakeLM(QUESTIONS)
+    for name, adapter in [("ChatAdapter", plain)] + \
+            [("cached", CachedChatAdapter())] + \
+            [(f"cached, {budget} tokens", CachedChatAdapter(demo_token_budget=budget)) for budget in args.budgets]:
+        metrics.reset_counters()
+        result = run_agent(agent, adapter, lm, questions)
+        counted = metrics.counters().get("prompt.tokens", 0)
+        adapter_note = f"  adapter count {counted / result['lm_calls']:7.1f}/call" if counted else ""
+        print(f"  {name:<20} {result['prompt_tokens'] / result['lm_calls']:7.1f} tokens/call over "
+              f"{result['lm_calls']} calls{adapter_note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import statistics
+import time
+from chroma_setup import create_local_collection
+from local_embedding import HashingEmbeddingFunction
+from schema_retrieval import RetrieveSchema
+
+
+## Benchmark: RetrieveSchema latency with three serial text queries (before)
+## versus one embedding reused across concurrent queries (after). Uses an
+## in-memory Chroma collection and a local embedding function whose latency
+## stands in for a real embedding model.
+##   python bench_retrieve_schema.py --embed-latency-ms 5
+
+QUESTIONS = [
+    "How many transformers are in stock?",
+    "What is the cost of a 10W LED bulb?",
+    "List all categories of electrical parts.",
+    "How many orders did customer Alice Cooper place?",
+    "Show me all products supplied by ElectroSupply Inc.",
+    "What is the tax rate for customers in california?",
+]
+
+
+def retrieve_schema_before(collection, user_query: str):
+    table_results = collection.query(
+        query_texts=[user_query], n_results=3, where={"type": "table"}
+    )
+    tables = [doc["table_name"] for doc in table_results.get("metadatas", [])[0]]
+
+    column_results = collection.query(
+        query_texts=[user_query],
+        n_results=3,
+        where={"$and": [{"type": {"$eq": "column"}}, {"table": {"$in": tables}}]},
+    )
+    columns = [
+        (doc["table"], doc["columns"])
+        for doc in column_results.get("metadatas", [])[0]
+    ]
+
+    relationship_results = collection.query(
+        query_texts=[user_query], n_results=3, where={"type": "relationship"}
+    )
+    relationships = [
+        (doc["table1"], doc["table2"], doc["relationship_type"])
+        for doc in relationship_results.get("metadatas", [])[0]
+    ]
+    return {"tables": tables, "columns": columns, "relationships": relationships}
+
+
+def measure(fn, rounds: int):
+    timings = []
+    for _ in range(rounds):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            fn(question)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    embedding_function = HashingEmbeddingFunction(latency_ms=args.embed_latency_ms)
+    collection = create_local_collection(embedding_function, name="sql_schema_bench")
+
+    retrieve = RetrieveSchema(collection=collection)
+    for question in QUESTIONS:
+        before, after = retrieve_schema_before(collection, question), retrieve(question)
+        assert set(before["tables"]) == set(after["tables"]), (question, before, after)
+        assert set(before["columns"]) == set(after["columns"]), (question, before, after)
+
+    before = measure(lambda q: retrieve_schema_before(collection, q), args.rounds)
+    after = measure(retrieve, args.rounds)
+
+    print(f"{len(before)} retrievals, embedding latency {args.embed_latency_ms}ms")
+    print(f"before (3 serial text queries)   mean={statistics.mean(before):7.2f}ms  p50={statistics.median(before):7.2f}ms")
+    print(f"after  (1 embedding, concurrent) mean={statistics.mean(after):7.2f}ms  p50={statistics.median(after):7.2f}ms")
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
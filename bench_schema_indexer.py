@@ -0,0 +1,86 @@
+import argparse
+import time
+import chromadb
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table
+from local_embedding import HashingEmbeddingFunction
+from schema_indexer import index_schema, schema_chunks
+
+
+## Benchmark: indexing a large synthetic schema (--tables tables, each with a
+## few columns and a foreign key to the previous table) with an embedding
+## function that sleeps --embed-latency-ms per call. Compares the old
+## one-chunk-at-a-time add with index_schema: full build, re-index with no
+## change, and re-index after --changed tables gain a column and one is dropped.
+##   python bench_schema_indexer.py --tables 300 --embed-latency-ms 20
+
+
+class CountingEmbeddingFunction(HashingEmbeddingFunction):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+        self.texts = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        self.texts += len(input)
+        return super().__call__(input)
+
+
+def synthetic_schema(tables: int, extra_column_every: int = 0, drop_last: bool = False) -> MetaData:
+    metadata = MetaData()
+    count = tables - 1 if drop_last else tables
+    for index in range(count):
+        columns = [Column("id", Integer, primary_key=True), Column("name", String), Column("code", String)]
+        if index:
+            columns.append(Column(f"table_{index - 1:04d}_id", Integer, ForeignKey(f"table_{index - 1:04d}.id")))
+        if extra_column_every and index % extra_column_every == 0:
+            columns.append(Column("notes", String))
+        Table(f"table_{index:04d}", metadata, *columns)
+    return metadata
+
+
+def legacy_add(collection, chunks):
+    # The previous chroma_setup.add_schema_chunks
+    existing_ids = set(collection.get()["ids"])
+    for chunk in chunks:
+        if chunk["id"] not in existing_ids:
+            collection.add(ids=[chunk["id"]], documents=[chunk["text"]], metadatas=[chunk["metadata"]])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=300)
+    parser.add_argument("--changed", type=int, default=3, help="tables that gain a column before the last re-index")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    client = chromadb.EphemeralClient()
+    chunks = schema_chunks(synthetic_schema(args.tables))
+    print(f"{args.tables} tables -> {len(chunks)} chunks, embedding latency {args.embed_latency_ms}ms per call")
+
+    embedding = CountingEmbeddingFunction(latency_ms=args.embed_latency_ms)
+    legacy = client.get_or_create_collection("bench_legacy", embedding_function=embedding)
+    start = time.perf_counter()
+    legacy_add(legacy, chunks)
+    print(f"  {'legacy add, one chunk per call':<38} {time.perf_counter() - start:8.2f}s  "
+          f"{embedding.calls} embedding calls")
+
+    embedding = CountingEmbeddingFunction(latency_ms=args.embed_latency_ms)
+    collection = client.get_or_create_collection("bench_indexer", embedding_function=embedding)
+    steps = [
+        ("index_schema, full build", chunks),
+        ("index_schema, nothing changed", chunks),
+        (f"index_schema, {args.changed} changed + 1 dropped",
+         schema_chunks(synthetic_schema(args.tables, extra_column_every=max(args.tables // args.changed, 1),
+                                        drop_last=True))),
+    ]
+    for name, step_chunks in steps:
+        calls, texts = embedding.calls, embedding.texts
+        stats = index_schema(collection, step_chunks)
+        print(f"  {name:<38} {stats['seconds']:8.2f}s  {embedding.calls - calls} embedding calls "
+              f"({embedding.texts - texts} texts)  {stats}")
+    assert collection.count() == len(steps[-1][1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+
+## Benchmark: cold start of the agent in fresh processes.
+## "fast start" imports sql_agent, loads optimized_agent.json and answers one
+## question offline (FakeLM + in-memory schema collection). "recompile" is what
+## an import used to cost: a BootstrapFewShot compile on train_data[:5], with
+## FakeLM sleeping --lm-latency-ms per call to stand in for the hosted model.
+##   python bench_startup.py --runs 5 --lm-latency-ms 800
+
+QUESTION = "How many transformers are in stock?"
+QUESTION_SQL = "SELECT SUM(stock_quantity) FROM products WHERE name LIKE '%Transformer%'"
+
+
+def child(mode: str, lm_latency_ms: float):
+    timings = {}
+    start = time.perf_counter()
+    import dspy
+    timings["import dspy"] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    import sql_agent
+    timings["import sql_agent"] = time.perf_counter() - mark
+
+    from fake_lm import FakeLM
+    from train_set import train_data
+    gold_sql = {example.question: example.sql_query for example in train_data}
+    gold_sql[QUESTION] = QUESTION_SQL
+    lm = FakeLM(gold_sql, latency_ms=lm_latency_ms)
+    dspy.configure(lm=lm)
+
+    mark = time.perf_counter()
+    if mode == "recompile":
+        agent = sql_agent.compile_agent(train_data[:5], teacher_lm=lm, checkpoint_dir=None, program_path=None)
+        timings["compile"] = time.perf_counter() - mark
+    else:
+        agent = sql_agent.load_agent(sql_agent.PROGRAM_PATH)
+        timings["load_agent"] = time.perf_counter() - mark
+
+    from chroma_setup import create_local_collection
+    from local_embedding import HashingEmbeddingFunction
+    from schema_retrieval import RetrieveSchema
+    agent.retrieve = RetrieveSchema(collection=create_local_collection(HashingEmbeddingFunction()))
+    lm_calls = lm.calls
+    mark = time.perf_counter()
+    agent(question=QUESTION)
+    timings["first query"] = time.perf_counter() - mark
+    timings["total"] = time.perf_counter() - start
+    timings["lm calls before first query"] = lm_calls
+    print(json.dumps(timings))
+
+
+def run(mode: str, lm_latency_ms: float) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode, "--lm-latency-ms", str(lm_latency_ms)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--child", choices=["fast", "recompile"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.lm_latency_ms)
+        return
+
+    for mode, runs in (("fast", args.runs), ("recompile", 1)):
+        results = [run(mode, args.lm_latency_ms) for _ in range(runs)]
+        print(f"{mode} start, median of {runs} run(s), FakeLM latency {args.lm_latency_ms}ms:")
+        for name in results[0]:
+            value = statistics.median(result[name] for result in results)
+            print(f"  {name:<28} {value:8.0f}" if name.startswith("lm calls") else f"  {name:<28} {value * 1000:8.0f}ms")
+    print("sql_agent's own startup is import sql_agent + load_agent; import dspy is the library's floor.")
+
+
+if __name__ == "__main__":
+    main()
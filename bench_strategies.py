@@ -0,0 +1,112 @@
+import argparse
+import os
+import time
+import dspy
+import metrics
+import sql_engine
+from bench_lm_cache import QUESTIONS
+from chroma_setup import create_local_collection
+from fake_lm import FakeLM
+from lm_cache import CACHE_PATH, CachedLM
+from local_embedding import HashingEmbeddingFunction
+from metrics import latency_summary
+from schema_retrieval import RetrieveSchema
+from sql_agent import DEFAULT_MODEL, SQLAgent, validate_prediction
+from train_set import train_data
+
+
+## Benchmark: ReAct versus the one-shot strategy (one SQL call, local
+## execution, template or small formatting call, ReAct fallback).
+## Runs train_data with the guard off so every question reaches the LM, plus
+## a set of read questions, plus a multi-column one (formatting call) and one
+## whose SQL fails (ReAct fallback).
+## By default FakeLM stands in for the provider with --lm-latency-ms per call.
+## FakeLM always writes the gold SQL, so every strategy is equally accurate by
+## construction. That run compares only latency and LM calls, and prints no
+## accuracy. To measure accuracy, use recorded responses of the real model:
+## record once per strategy with a live provider, then replay offline.
+##   python bench_strategies.py --lm-latency-ms 300
+##   python bench_strategies.py --lm-cache record   # needs GROQ_API_KEY
+##   python bench_strategies.py --lm-cache replay   # accuracy, no network
+
+EXTRA_QUESTIONS = {
+    "List every product with its price.": "SELECT name, price FROM products",
+    "Which products cost more than 20?": "SELECT name FROM product WHERE price > 20",
+}
+
+
+def read_question_passes(question, prediction) -> bool:
+    """Right SQL, and the answer mentions the first value of its result."""
+    gold = QUESTIONS.get(question)
+    if gold is None:
+        return bool(prediction.answer)
+    rows = sql_engine.execute_sql(gold)
+    return prediction.sql_query.strip() == gold and str(rows[0][0]) in prediction.answer
+
+
+def run(agent, lm, questions, passes):
+    timings, correct, errors = [], 0, 0
+    calls_before = len(lm.history)
+    with dspy.context(lm=lm):
+        for question in questions:
+            start = time.perf_counter()
+            try:
+                prediction = agent(question=question)
+            except Exception:
+                # e.g. LMCacheMiss when a replay has no recording for this prompt
+                errors += 1
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+            correct += passes(question, prediction)
+    return {
+        "accuracy": correct / len(questions),
+        "errors": errors,
+        "lm_calls": (len(lm.history) - calls_before) / len(questions),
+        **latency_summary(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lm-latency-ms", type=float, default=300.0, help="FakeLM latency per call")
+    parser.add_argument("--lm-cache", choices=["record", "replay"], default=None,
+                        help=f"use {DEFAULT_MODEL} through the LM response cache instead of FakeLM")
+    parser.add_argument("--lm-cache-path", default=CACHE_PATH)
+    args = parser.parse_args()
+
+    if args.lm_cache:
+        lm = CachedLM(dspy.LM(DEFAULT_MODEL, api_key=os.getenv("GROQ_API_KEY")), mode=args.lm_cache,
+                      path=args.lm_cache_path)
+        print(f"{DEFAULT_MODEL}, {args.lm_cache} from {args.lm_cache_path}"
+              + (" (latency is cache-hit latency)" if args.lm_cache == "replay" else ""))
+    else:
+        gold_sql = {**{example.question: example.sql_query for example in train_data}, **QUESTIONS, **EXTRA_QUESTIONS}
+        lm = FakeLM(gold_sql, latency_ms=args.lm_latency_ms)
+        print(f"FakeLM latency {args.lm_latency_ms}ms per call. FakeLM returns the gold SQL, so accuracy is "
+              f"the same for every strategy and is not compared; see --lm-cache replay.")
+    retrieve = RetrieveSchema(collection=create_local_collection(HashingEmbeddingFunction()))
+    train_examples = {example.question: example for example in train_data}
+    datasets = {
+        "train_data": (list(train_examples), lambda q, p: validate_prediction(train_examples[q], p)),
+        "read questions": (list(QUESTIONS) + list(EXTRA_QUESTIONS), read_question_passes),
+    }
+
+    for name, (questions, passes) in datasets.items():
+        print(f"{name} ({len(questions)} questions)")
+        for strategy in ("react", "one_shot"):
+            metrics.reset_counters()
+            agent = SQLAgent(guard=False, retrieve=retrieve, strategy=strategy)
+            result = run(agent, lm, questions, passes)
+            accuracy = f"accuracy={result['accuracy']:6.1%} errors={result['errors']}  " if args.lm_cache else ""
+            print(f"  {strategy:<9} {accuracy}lm calls/q={result['lm_calls']:4.2f}  "
+                  f"p50={result['p50']:7.1f}ms  p95={result['p95']:7.1f}ms")
+            outcomes = {k.rsplit("agent.one_shot.", 1)[-1]: v for k, v in metrics.counters().items()
+                        if k.startswith("agent.one_shot.")}
+            if outcomes:
+                print(f"            one-shot outcomes: {outcomes}")
+    if args.lm_cache:
+        print(f"LM cache: {lm.stats()}")
+
+
+if __name__ == "__main__":
+    main()
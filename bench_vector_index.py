@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+## Benchmark: RetrieveSchema on the Chroma backend (persistent client on
+## disk) versus the in-process VectorIndex loaded from its memory-mapped
+## snapshot. Both are built from the same chunks and embeddings
+## (HashingEmbeddingFunction); the exact NumPy search must never return a
+## farther chunk than Chroma's approximate HNSW, whose recall is reported. Reports per-retrieval latency and cold
+## start in a fresh process (backend import, open, first retrieval; dspy's
+## import is shared by both). --tables N uses a synthetic schema of N tables
+## instead of db_setup's.
+##   python bench_vector_index.py --rounds 50
+##   python bench_vector_index.py --tables 300
+
+QUESTIONS = [
+    "How many transformers are in stock?",
+    "What is the cost of a 10W LED bulb?",
+    "List all categories of electrical parts.",
+    "How many orders did customer Alice Cooper place?",
+    "Show me all products supplied by ElectroSupply Inc.",
+    "What is the tax rate for customers in california?",
+]
+COLLECTION = "sql_schema_bench"
+
+
+def child(backend: str, path: str):
+    timings = {}
+    start = time.perf_counter()
+    # dspy and the embedding function are loaded either way
+    from local_embedding import HashingEmbeddingFunction
+    from schema_retrieval import ChromaBackend, RetrieveSchema
+    timings["shared import"] = time.perf_counter() - start
+    mark = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+        timings["backend import"] = time.perf_counter() - mark
+        mark = time.perf_counter()
+        collection = chromadb.PersistentClient(path=path).get_collection(
+            COLLECTION, embedding_function=HashingEmbeddingFunction())
+        retrieve = RetrieveSchema(backend=ChromaBackend(collection))
+    else:
+        from vector_index import VectorIndex
+        timings["backend import"] = time.perf_counter() - mark
+        mark = time.perf_counter()
+        retrieve = RetrieveSchema(backend=VectorIndex.load(path))
+    timings["open"] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    retrieve(QUESTIONS[0])
+    timings["first retrieval"] = time.perf_counter() - mark
+    timings["after shared import"] = time.perf_counter() - start - timings["shared import"]
+    print(json.dumps(timings))
+
+
+def cold_start(backend: str, path: str, runs: int) -> dict:
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, __file__, "--child", backend, "--path", path],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {name: statistics.median(result[name] for result in results) for name in results[0]}
+
+
+def check_neighbours(collection, index, n_results: int) -> float:
+    """Exact search is never farther than Chroma's HNSW; returns HNSW recall@n."""
+    import numpy as np
+    found = total = 0
+    for question in QUESTIONS:
+        query = np.asarray(index.embed(question), dtype=np.float32)
+        for chunk_type in ("table", "relationship"):
+            chroma = collection.query(query_embeddings=[query], n_results=n_results, where={"type": chunk_type},
+                                      include=["distances"])["distances"][0]
+            rows = index.search(query, n_results, {"type": chunk_type})
+            exact = [float(np.sum((index.embeddings[row] - query) ** 2)) for row in rows]
+            assert all(e <= c + 1e-4 for e, c in zip(exact, chroma)), (question, chunk_type, chroma, exact)
+            # Ties make ids ambiguous, so recall counts distances within the exact top-n
+            found += sum(c <= exact[-1] + 1e-4 for c in chroma)
+            total += len(exact)
+    return found / total
+
+
+def measure(retrieve, rounds: int) -> list:
+    timings = []
+    for _ in range(rounds):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            retrieve(question)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per cold start")
+    parser.add_argument("--tables", type=int, default=0, help="synthetic schema size (0: db_setup's schema)")
+    parser.add_argument("--child", choices=["chroma", "index"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.path)
+        return
+
+    import chromadb
+    from local_embedding import HashingEmbeddingFunction
+    from metrics import latency_summary
+    from schema_indexer import declared_schema, index_schema, schema_chunks
+    from schema_retrieval import ChromaBackend, RetrieveSchema
+    from vector_index import VectorIndex
+
+    if args.tables:
+        from bench_schema_indexer import synthetic_schema
+        metadata = synthetic_schema(args.tables)
+    else:
+        metadata = declared_schema()
+    chunks = schema_chunks(metadata)
+
+    with tempfile.TemporaryDirectory() as directory:
+        chroma_path, snapshot_path = os.path.join(directory, "chroma"), os.path.join(directory, "schema.vidx")
+        collection = chromadb.PersistentClient(path=chroma_path).get_or_create_collection(
+            COLLECTION, embedding_function=HashingEmbeddingFunction())
+        index_schema(collection, chunks)
+        VectorIndex.from_collection(collection).save(snapshot_path)
+
+        backends = {
+            "chroma": RetrieveSchema(backend=ChromaBackend(collection)),
+            "index": RetrieveSchema(backend=VectorIndex.load(snapshot_path)),
+        }
+        recall = check_neighbours(collection, backends["index"].backend, n_results=5)
+
+        print(f"{len(chunks)} chunks ({len(metadata.tables)} tables), snapshot {os.path.getsize(snapshot_path)} bytes, "
+              f"Chroma HNSW recall@5 vs exact {recall:.1%}")
+        print("per retrieval (embed + table and relationship top-k + columns):")
+        for name, retrieve in backends.items():
+            summary = latency_summary(measure(retrieve, args.rounds))
+            print(f"  {name:<7} p50={summary['p50']:8.3f}ms  p95={summary['p95']:8.3f}ms  p99={summary['p99']:8.3f}ms")
+        print(f"cold start, median of {args.runs} fresh processes:")
+        for name, path in (("chroma", chroma_path), ("index", snapshot_path)):
+            timings = cold_start(name, path, args.runs)
+            print("  " + f"{name:<7}" + "  ".join(f"{key}={value * 1000:.1f}ms" for key, value in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
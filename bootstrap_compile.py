@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import dspy
+from dspy.dsp.utils.settings import thread_local_overrides
+from evaluate_agent import fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+## Resumable, parallel BootstrapFewShot.
+## Teacher runs go to a bounded thread pool, each worker on its own copy of the
+## teacher. Every finished example (success, metric failure or error) is
+## appended to a JSONL checkpoint keyed by the program's signatures, the
+## teacher LM and the metric, so an interrupted or rate-limited compile picks
+## up where it stopped. Examples whose demos are already in the previously
+## saved program, with the same inputs and still passing the metric, are
+## reused without a teacher call. Errors are retried on the next run.
+## Demos, labeled fill-ins and their order come out the same as
+## dspy.BootstrapFewShot for the same traces.
+
+CHECKPOINT_DIR = ".compile_cache"
+
+
+class BootstrapCheckpoint:
+    """Append-only JSONL of {"example": key, "status": ..., "demos": {predictor: [...]}}."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        records = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:  # torn last line after a crash
+                        continue
+                    records[record["example"]] = record
+        except FileNotFoundError:
+            pass
+        return records
+
+    def append(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def saved_demos(program_path: str) -> dict:
+    """{predictor name: [augmented demo dicts]} from a saved program, if any."""
+    if not program_path or not os.path.exists(program_path):
+        return {}
+    with open(program_path) as f:
+        state = json.load(f)
+    return {
+        name: [demo for demo in value.get("demos", []) if demo.get("augmented")]
+        for name, value in state.items() if isinstance(value, dict) and "demos" in value
+    }
+
+
+class ResumableBootstrapFewShot(dspy.BootstrapFewShot):
+    def __init__(self, *args, num_threads: int = 8, checkpoint_dir: str = CHECKPOINT_DIR,
+                 program_path: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_threads = num_threads
+        self.checkpoint_dir = checkpoint_dir
+        self.program_path = program_path
+        self.stats = {}
+
+    def _checkpoint_key(self) -> str:
+        lm = self.teacher_settings.get("lm") or dspy.settings.lm
+        return fingerprint({
+            "signatures": {name: str(predictor.signature) for name, predictor in self.student.named_predictors()},
+            "instructions": {name: predictor.signature.instructions for name, predictor in self.student.named_predictors()},
+            "lm": {"model": getattr(lm, "model", repr(lm)), "kwargs": getattr(lm, "kwargs", {})},
+            "metric": getattr(self.metric, "__qualname__", repr(self.metric)),
+            "metric_threshold": self.metric_threshold,
+            "max_rounds": self.max_rounds,
+        })
+
+    def _reuse_saved(self, example, demos_by_name: dict):
+        """Demos for `example` from the saved program, if its inputs match and they pass the metric."""
+        inputs = example.inputs().toDict()
+        matches = {
+            name: [demo for demo in demos if all(demo.get(key) == value for key, value in inputs.items())]
+            for name, demos in demos_by_name.items()
+        }
+        if not all(matches.values()):
+            return None
+        # Labels may have changed: the demos that carry them must still pass
+        labels = example.labels().keys()
+        labelled = [demo for demos in matches.values() for demo in demos if all(key in demo for key in labels)]
+        if self.metric is None or not labelled:
+            return matches
+        return matches if any(self._passes(example, dspy.Prediction(**demo)) for demo in labelled) else None
+
+    def _passes(self, example, prediction, trace=None) -> bool:
+        value = self.metric(example, prediction, trace)
+        return value >= self.metric_threshold if self.metric_threshold else bool(value)
+
+    def _run_example(self, teacher, example) -> dict:
+        """One example, up to max_rounds attempts, on a worker-owned teacher copy."""
+        predictor2name = {id(predictor): name for name, predictor in teacher.named_predictors()}
+        record = {"status": "failed", "demos": {}, "rounds": 0}
+        for round_idx in range(self.max_rounds):
+            record["rounds"] = round_idx + 1
+            cached_demos = {name: predictor.demos for name, predictor in teacher.named_predictors()}
+            try:
+                with dspy.settings.context(trace=[], **self.teacher_settings):
+                    lm = dspy.settings.lm
+                    lm = lm.copy(temperature=0.7 + 0.001 * round_idx) if round_idx > 0 else lm
+                    with dspy.settings.context(lm=lm):
+                        for _, predictor in teacher.named_predictors():
+                            predictor.demos = [demo for demo in predictor.demos if demo != example]
+                        prediction = teacher(**example.inputs())
+                        trace = dspy.settings.trace
+                success = self._passes(example, prediction, trace) if self.metric else True
+            except Exception as e:
+                with self.error_lock:
+                    self.error_count += 1
+                logger.error(f"Failed to run or to evaluate example {example} with {self.metric} due to {e}.")
+                record.update(status="error", error=f"{type(e).__name__}: {e}")
+                return record
+            finally:
+                for name, predictor in teacher.named_predictors():
+                    predictor.demos = cached_demos[name]
+
+            if success:
+                name2traces = {}
+                for predictor, inputs, outputs in trace:
+                    name = predictor2name.get(id(predictor))
+                    if name is not None:
+                        name2traces.setdefault(name, []).append(dspy.Example(augmented=True, **inputs, **outputs))
+                record.update(status="success", demos={name: self._pick_demos(demos) for name, demos in name2traces.items()})
+                return record
+        return record
+
+    @staticmethod
+    def _pick_demos(demos: list) -> list:
+        # Same choice BootstrapFewShot makes when a predictor ran more than once
+        from datasets.fingerprint import Hasher
+        if len(demos) > 1:
+            rng = random.Random(Hasher.hash(tuple(demos)))
+            demos = [rng.choice(demos[:-1]) if rng.random() < 0.5 else demos[-1]]
+        return [demo.toDict() for demo in demos]
+
+    def _bootstrap(self, *, max_bootstraps=None):
+        max_bootstraps = max_bootstraps or self.max_bootstrapped_demos
+        checkpoint = None
+        if self.checkpoint_dir:
+            checkpoint = BootstrapCheckpoint(
+                os.path.join(self.checkpoint_dir, f"bootstrap-{self._checkpoint_key()[:16]}.jsonl")
+            )
+        records = checkpoint.load() if checkpoint else {}
+        previous = saved_demos(self.program_path)
+        example_keys = [fingerprint(example.toDict()) for example in self.trainset]
+        results = {}
+        self.stats = {"checkpoint": 0, "saved_program": 0, "bootstrapped": 0, "errors": 0}
+
+        pending = []
+        for index, (key, example) in enumerate(zip(example_keys, self.trainset)):
+            record = records.get(key)
+            if record and record["status"] != "error":
+                results[index] = record
+                self.stats["checkpoint"] += 1
+                continue
+            reused = self._reuse_saved(example, previous) if previous else None
+            if reused:
+                results[index] = {"example": key, "status": "success", "demos": reused, "source": "saved_program"}
+                if checkpoint:
+                    checkpoint.append(results[index])
+                self.stats["saved_program"] += 1
+                continue
+            pending.append(index)
+
+        successes = sum(record["status"] == "success" for record in results.values())
+        overrides = thread_local_overrides.overrides.copy()
+        local = threading.local()
+
+        def run(index):
+            # Each worker owns a teacher copy: predictor demos are swapped per example
+            if not hasattr(local, "teacher"):
+                local.teacher = self.teacher.deepcopy()
+            with dspy.context(**overrides):
+                return self._run_example(local.teacher, self.trainset[index])
+
+        # Submit in trainset order and stop once enough traces exist; up to
+        # num_threads - 1 extra examples may still finish and are kept
+        queue = iter(pending)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+            in_flight = {}
+            while True:
+                while len(in_flight) < self.num_threads and successes < max_bootstraps \
+                        and self.error_count < self.max_errors:
+                    index = next(queue, None)
+                    if index is None:
+                        break
+                    in_flight[pool.submit(run, index)] = index
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    record = {"example": example_keys[index], **future.result()}
+                    if checkpoint:
+                        checkpoint.append(record)
+                    results[index] = record
+                    self.stats["bootstrapped"] += 1
+                    if record["status"] == "success":
+                        successes += 1
+                    elif record["status"] == "error":
+                        self.stats["errors"] += 1
+
+        if self.error_count >= self.max_errors:
+            where = f"checkpointed in {checkpoint.path}, rerun to resume" if checkpoint else "not checkpointed"
+            raise RuntimeError(f"Stopped after {self.error_count} teacher errors; finished examples are {where}.")
+
+        # Trainset order, not completion order, so the compiled program is deterministic
+        bootstrapped = set()
+        self.name2traces = {name: [] for name in self.name2predictor}
+        for index in sorted(results):
+            record = results[index]
+            if record["status"] != "success" or len(bootstrapped) >= max_bootstraps:
+                continue
+            bootstrapped.add(index)
+            for name, demos in record["demos"].items():
+                if name in self.name2traces:
+                    self.name2traces[name].extend(dspy.Example(**demo) for demo in demos)
+
+        print(
+            f"Bootstrapped {len(bootstrapped)} full traces: {self.stats['checkpoint']} from the checkpoint, "
+            f"{self.stats['saved_program']} from {self.program_path}, {self.stats['bootstrapped']} teacher runs "
+            f"({self.stats['errors']} errors)."
+        )
+        self.validation = [example for index, example in enumerate(self.trainset) if index not in bootstrapped]
+        random.Random(0).shuffle(self.validation)
@@ -2,6 +2,7 @@ import os
 import dspy
 from dotenv import load_dotenv
 from sql_agent import GenerateSQL, execute_sql, RetrieveSchema
+from conversation_memory import ConversationMemory
 import sqlite3
 import datetime
 load_dotenv()
@@ -13,9 +14,9 @@ load_dotenv()
 ## The default user is take as [Alice Cooper]
 ### To change the user, during conversatrion, there's another huge
 ### logic to be implemented, which is not implemented here!
+### (chat_server.py hosts one SQLChatbot per session, each with its own user)
 
-lm = dspy.LM('groq/llama-3.3-70b-versatile', api_key=os.getenv('GROQ_API_KEY'))
-dspy.configure(lm=lm)
+DEFAULT_USER = "Alice Cooper"
 
 sql_query_generator = dspy.ReAct(GenerateSQL, tools=[execute_sql])
 
@@ -24,29 +25,41 @@ retrieve_schema = RetrieveSchema()
 
 
 class SQLChatbot(dspy.Module):
-    def __init__(self):
+    def __init__(self, memory: ConversationMemory = None, user: str = DEFAULT_USER, retrieve=None, generator=None):
         super().__init__()
-        self.history = []
+        self.user = user
+        # The signed-in customer is a resolved entity from the first turn on
+        self.memory = memory or ConversationMemory(entities={"customers.name": user} if user else None)
+        # Retrieval and the ReAct program are shared by every chatbot instance
+        self.retrieve = retrieve or retrieve_schema
+        self.generate = generator or sql_query_generator
 
     def forward(self, user_input: str):
         """Handles user queries and maintains conversation history for better results"""
 
-        query_context = retrieve_schema(user_input)
-        response = sql_query_generator(question=user_input, context=query_context, history=self.history)
-        # Store conversation history
-        self.history.append(f"User: {user_input}")
-        self.history.append(f"Bot: {response.answer}")
+        query_context = self.retrieve(user_input)
+        response = self.generate(question=user_input, context=query_context, history=self.memory.history())
+        # Store conversation history; older turns are folded into a summary
+        self.memory.add_turn(user_input, response.answer, getattr(response, "sql_query", ""))
         return response.answer
-        
-
-assistant = SQLChatbot()
-
-print("Assistant: Ask me database queries! Type 'exit' to quit.")
-while True:
-    #logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
-    user_input = input("You: ")
-    if user_input.lower() in ["exit", "quit"]:
-        print("Goodbye!")
-        break
-    response = assistant(user_input)
-    print(f"Assistant: {response}")
\ No newline at end of file
+
+
+def main():
+    lm = dspy.LM('groq/llama-3.3-70b-versatile', api_key=os.getenv('GROQ_API_KEY'))
+    dspy.configure(lm=lm)
+
+    assistant = SQLChatbot()
+
+    print("Assistant: Ask me database queries! Type 'exit' to quit.")
+    while True:
+        #logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+        user_input = input("You: ")
+        if user_input.lower() in ["exit", "quit"]:
+            print("Goodbye!")
+            break
+        response = assistant(user_input)
+        print(f"Assistant: {response}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import contextvars
+import json
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import dspy
+from aiohttp import WSMsgType, web
+from dspy.utils.callback import BaseCallback
+import metrics
+
+
+## Multi-session chat server: many SQLChatbot sessions behind one process.
+## Each session has its own ConversationMemory and user identity; the SQLAgent
+## (ReAct program, SQL engine) and its schema retrieval are built once and
+## shared. Turns run on a bounded thread pool, one at a time per session.
+## Idle sessions expire after `ttl` seconds and the least recently used idle
+## sessions are evicted while the estimated size of all sessions is over
+## `max_bytes`. Responses stream as the agent works: a `thought` and `sql`
+## event per ReAct step, then the answer in `answer` chunks and a final `done`.
+## (dspy 2.6 parses output fields only once the LM call completes, so the
+## answer text itself is chunked after the fact.)
+##   POST   /chat            {"session_id"?, "user"?, "message"} -> NDJSON events
+##   GET    /ws              ?session_id=&user=, one JSON/text message per turn
+##   GET    /stats
+##   DELETE /sessions/{id}
+##   python chat_server.py --offline --port 8080
+## With --program-store the agent serves that program_store's CURRENT version
+## and hot-swaps to whatever it is pointed at next (publish, activate, rollback).
+
+DEFAULT_TTL = 30 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Fixed per-session cost (objects, lock, bookkeeping) on top of the history text
+SESSION_OVERHEAD_BYTES = 4096
+ANSWER_CHUNK = re.compile(r"\S+\s*")
+
+
+class SessionUserMismatch(Exception):
+    pass
+
+
+class Session:
+    __slots__ = ("session_id", "user", "chatbot", "lock", "created", "last_used", "size", "turns")
+
+    def __init__(self, session_id: str, user: str, chatbot):
+        self.session_id = session_id
+        self.user = user
+        self.chatbot = chatbot
+        self.lock = asyncio.Lock()
+        self.created = self.last_used = time.monotonic()
+        self.size = session_bytes(chatbot)
+        self.turns = 0
+
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+
+def session_bytes(chatbot) -> int:
+    """Estimated memory held by one session: its history text plus a fixed overhead."""
+    return SESSION_OVERHEAD_BYTES + sum(len(line.encode()) for line in chatbot.memory.history())
+
+
+class SessionStore:
+    """Sessions by id in LRU order, bounded by idle TTL and a total size estimate.
+
+    Only touched from the event loop thread, so it needs no locking.
+    """
+
+    def __init__(self, factory, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.factory = factory      # user -> SQLChatbot
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"created": 0, "expired": 0, "evicted": 0, "closed": 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get_or_create(self, session_id: str = None, user: str = None):
+        """(session, created); a session id is bound to the user that opened it."""
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None:
+            if user and user != session.user:
+                raise SessionUserMismatch(f"Session {session_id} belongs to another user")
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session, False
+
+        session_id = session_id or uuid.uuid4().hex
+        session = Session(session_id, user, self.factory(user))
+        self._sessions[session_id] = session
+        self.total_bytes += session.size
+        self.stats["created"] += 1
+        self.evict()
+        return session, True
+
+    def touch(self, session: Session):
+        """Re-measures a session after a turn and enforces the limits."""
+        if self._sessions.get(session.session_id) is not session:
+            return  # closed while the turn ran
+        size = session_bytes(session.chatbot)
+        self.total_bytes += size - session.size
+        session.size = size
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session.session_id)
+        self.evict()
+
+    def remove(self, session_id: str, reason: str = "closed") -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.total_bytes -= session.size
+        self.stats[reason] += 1
+        return True
+
+    def evict(self, now: float = None):
+        """Drops expired sessions, then idle ones from the LRU end while over max_bytes."""
+        now = now or time.monotonic()
+        for session in list(self._sessions.values()):
+            if now - session.last_used < self.ttl:
+                break  # LRU order: everything after this was used more recently
+            if not session.busy():
+                self.remove(session.session_id, "expired")
+        if self.total_bytes <= self.max_bytes:
+            return
+        for session in list(self._sessions.values()):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if not session.busy():
+                self.remove(session.session_id, "evicted")
+
+    def report(self) -> dict:
+        return {**self.stats, "active": len(self._sessions), "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes, "ttl": self.ttl}
+
+
+class StreamingCallback(BaseCallback):
+    """Forwards ReAct steps of one turn to `emit` (called from the worker thread)."""
+
+    def __init__(self, emit):
+        self.emit = emit
+
+    def on_module_end(self, call_id, outputs, exception=None):
+        if exception is None and isinstance(outputs, dspy.Prediction) and "next_thought" in outputs:
+            self.emit({"type": "thought", "text": outputs.next_thought})
+
+    def on_tool_start(self, call_id, instance, inputs):
+        if getattr(instance, "name", None) == "execute_sql":
+            # Tool.__call__(**kwargs) reaches callbacks as {"kwargs": {...}}
+            arguments = inputs.get("kwargs", inputs)
+            self.emit({"type": "sql", "query": arguments.get("query", "")})
+
+
+_DONE = object()
+
+
+class ChatServer:
+    def __init__(self, factory, workers: int = 16, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES,
+                 watcher=None):
+        self.sessions = SessionStore(factory, ttl=ttl, max_bytes=max_bytes)
+        self.watcher = watcher  # program_store.ProgramWatcher behind a LiveAgent, if any
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat")
+        self.turn_ms = deque(maxlen=10000)
+        self._sweeper = None
+
+    async def turn(self, session: Session, message: str):
+        """Async generator of the events for one turn of `session`."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def emit(event):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        def work():
+            # dspy.context is thread-local: the callback only sees this turn
+            with dspy.context(callbacks=[*dspy.settings.callbacks, StreamingCallback(emit)]):
+                return session.chatbot(message)
+
+        start = time.perf_counter()
+        async with session.lock:
+            future = loop.run_in_executor(self.executor, contextvars.copy_context().run, work)
+            # Runs after the events the worker queued before returning
+            future.add_done_callback(lambda _: queue.put_nowait(_DONE))
+            try:
+                while (event := await queue.get()) is not _DONE:
+                    yield event
+            finally:
+                # A client disconnect cancels or closes this generator, but the
+                # worker keeps running and updating the chatbot's memory. Hold the
+                # session lock until it finishes so the next turn cannot race it.
+                if not future.done():
+                    await asyncio.wait([future])
+            try:
+                answer = future.result()
+            except Exception as e:
+                metrics.increment("chat.errors")
+                yield {"type": "error", "message": f"{type(e).__name__}: {e}"}
+                return
+            session.turns += 1
+
+        self.sessions.touch(session)
+        for chunk in ANSWER_CHUNK.findall(answer):
+            yield {"type": "answer", "text": chunk}
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.turn_ms.append(latency_ms)
+        metrics.increment("chat.turns")
+        yield {"type": "done", "answer": answer, "latency_ms": latency_ms}
+
+    def open_session(self, session_id: str, user: str):
+        try:
+            session, created = self.sessions.get_or_create(session_id, user)
+        except SessionUserMismatch as e:
+            raise web.HTTPForbidden(text=str(e))
+        return session, {"type": "session", "session_id": session.session_id, "user": session.user, "new": created}
+
+    async def handle_chat(self, request: web.Request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(text="Expected a JSON body")
+        message = body.get("message")
+        if not message:
+            raise web.HTTPBadRequest(text="'message' is required")
+        session, opened = self.open_session(body.get("session_id"), body.get("user"))
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        await response.write(json.dumps(opened).encode() + b"\n")
+        async for event in self.turn(session, message):
+            await response.write(json.dumps(event).encode() + b"\n")
+        await response.write_eof()
+        return response
+
+    async def handle_ws(self, request: web.Request):
+        session, opened = self.open_session(request.query.get("session_id"), request.query.get("user"))
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        await ws.send_json(opened)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                message = json.loads(msg.data).get("message", "")
+            except (json.JSONDecodeError, AttributeError):
+                message = msg.data
+            if not message:
+                await ws.send_json({"type": "error", "message": "'message' is required"})
+                continue
+            # Refreshes the session, or starts a fresh one under the same id if it
+            # expired or was evicted while the socket sat idle
+            session, opened = self.open_session(session.session_id, session.user)
+            if opened["new"]:
+                await ws.send_json(opened)
+            async for event in self.turn(session, message):
+                await ws.send_json(event)
+        return ws
+
+    async def handle_stats(self, request: web.Request):
+        stats = {
+            "sessions": self.sessions.report(),
+            "turns": metrics.latency_summary(list(self.turn_ms)),
+            "counters": metrics.counters(),
+        }
+        if self.watcher is not None:
+            stats["program"] = self.watcher.report()
+        return web.json_response(stats)
+
+    async def handle_delete(self, request: web.Request):
+        if not self.sessions.remove(request.match_info["session_id"]):
+            raise web.HTTPNotFound()
+        return web.json_response({"closed": request.match_info["session_id"]})
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(max(min(self.sessions.ttl / 4, 60), 0.05))
+            self.sessions.evict()
+
+    async def _on_startup(self, app):
+        self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _on_cleanup(self, app):
+        self._sweeper.cancel()
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post("/chat", self.handle_chat),
+            web.get("/ws", self.handle_ws),
+            web.get("/stats", self.handle_stats),
+            web.delete("/sessions/{session_id}", self.handle_delete),
+        ])
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def chatbot_factory(agent, **memory_kwargs):
+    """user -> SQLChatbot sharing `agent` and its retrieval, with its own memory."""
+    from chat_assistent_learning import DEFAULT_USER, SQLChatbot
+    from conversation_memory import ConversationMemory
+
+    def factory(user):
+        user = user or DEFAULT_USER
+        memory = ConversationMemory(entities={"customers.name": user}, **memory_kwargs)
+        return SQLChatbot(memory=memory, user=user, retrieve=agent.retrieve, generator=agent)
+    return factory
+
+
+def build_server(offline: bool = False, program_path: str = "optimized_agent.json", strategy: str = "react",
+                 workers: int = 16, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_history_tokens: int = 1000, program_store: str = None,
+                 result_cache: bool = False) -> ChatServer:
+    from evaluate_agent import build_agent
+    watcher = None
+    if program_store:
+        from program_store import ProgramStore, serve_from_store
+        template = build_agent(offline=offline, program_path=None, strategy=strategy)
+        # Sessions call the LiveAgent, so a swap reaches every session on its next turn
+        agent, watcher = serve_from_store(template, ProgramStore(program_store))
+    else:
+        agent = build_agent(offline=offline, program_path=program_path, strategy=strategy)
+    if result_cache:
+        from agent_cache import CachedSQLAgent
+        # Keyed by question, history and context, so only repeated turns hit
+        agent = CachedSQLAgent(agent)
+    return ChatServer(chatbot_factory(agent, max_tokens=max_history_tokens), workers=workers, ttl=ttl,
+                      max_bytes=max_bytes, watcher=watcher)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--offline", action="store_true", help="use FakeLM and an in-memory schema collection")
+    parser.add_argument("--lm-latency-ms", type=float, default=0.0, help="FakeLM latency with --offline")
+    parser.add_argument("--program", default="optimized_agent.json")
+    parser.add_argument("--program-store", default=None, help="serve and hot-swap this program_store's CURRENT")
+    parser.add_argument("--result-cache", action="store_true", help="cache final answers (agent_cache)")
+    parser.add_argument("--strategy", choices=["react", "one_shot"], default="react")
+    parser.add_argument("--workers", type=int, default=16, help="turns running at once")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="seconds before an idle session expires")
+    parser.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20, help="cap on all sessions")
+    parser.add_argument("--max-history-tokens", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.offline:
+        from fake_lm import FakeLM
+        from train_set import train_data
+        lm = FakeLM({example.question: example.sql_query for example in train_data}, latency_ms=args.lm_latency_ms)
+    else:
+        from sql_agent import get_lm
+        lm = get_lm()
+    dspy.configure(lm=lm)
+
+    server = build_server(offline=args.offline, program_path=args.program, strategy=args.strategy,
+                          workers=args.workers, ttl=args.ttl, max_bytes=int(args.max_mb * 2**20),
+                          max_history_tokens=args.max_history_tokens, program_store=args.program_store,
+                          result_cache=args.result_cache)
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
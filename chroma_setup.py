@@ -1,47 +1,33 @@
 import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-
-
-# Initialize ChromaDB with persistence
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(name="sql_schema")  # Collection to store schema and documents
-
-
-# Define schema chunks with tables and relationships (given schema)
-schema_chunks = [
-    # Tables
-    {"id": "suppliers_table", "text": "table: suppliers", "metadata": {"type": "table","table_name":"suppliers"}},
-    {"id": "categories_table", "text": "table: categories", "metadata": {"type": "table","table_name":"categories"}},
-    {"id": "products_table", "text": "table: products", "metadata": {"type": "table","table_name":"products"}},
-    {"id": "customers_table", "text": "table: customers", "metadata": {"type": "table","table_name":"customers"}},
-    {"id": "orders_table", "text": "table: orders", "metadata": {"type": "table","table_name":"orders"}},
-    {"id": "order_items_table", "text": "table: order_items", "metadata": {"type": "table","table_name":"order_items"}},
-    
-    # Columns
-    {"id": "suppliers_columns", "text": "Columns: supplier_id, name, contact_name, phone, address", "metadata": {"type": "column", "table": "suppliers", "columns": "supplier_id, name, contact_name, phone, address"}},
-    {"id": "categories_columns", "text": "Columns: category_id, name", "metadata": {"type": "column", "table": "categories", "columns": "category_id, name"}},
-    {"id": "products_columns", "text": "Columns: product_id, name, category_id, supplier_id, price, stock_quantity", "metadata": {"type": "column", "table": "products", "columns": "product_id, name, category_id, supplier_id, price, stock_quantity"}},
-    {"id": "customers_columns", "text": "Columns: customer_id, name, email, phone, address", "metadata": {"type": "column", "table": "customers", "columns": "customer_id, name, email, phone, address"}},
-    {"id": "orders_columns", "text": "Columns: order_id, customer_id, order_date, total_amount", "metadata": {"type": "column", "table": "orders", "columns": "order_id, customer_id, order_date, total_amount"}},
-    {"id": "order_items_columns", "text": "Columns: order_item_id, order_id, product_id, quantity, unit_price", "metadata": {"type": "column", "table": "order_items", "columns": "order_item_id, order_id, product_id, quantity, unit_price"}},
-    
-    # Relationships
-    {"id": "products_suppliers_relationship", "text": "Relationship: products.supplier_id → suppliers.supplier_id", "metadata": {"type": "relationship", "table1": "products", "table2": "suppliers", "relationship_type": "foreign_key"}},
-    {"id": "products_categories_relationship", "text": "Relationship: products.category_id → categories.category_id", "metadata": {"type": "relationship", "table1": "products", "table2": "categories", "relationship_type": "foreign_key"}},
-    {"id": "orders_customers_relationship", "text": "Relationship: orders.customer_id → customers.customer_id", "metadata": {"type": "relationship", "table1": "orders", "table2": "customers", "relationship_type": "foreign_key"}},
-    {"id": "order_items_orders_relationship", "text": "Relationship: order_items.order_id → orders.order_id", "metadata": {"type": "relationship", "table1": "order_items", "table2": "orders", "relationship_type": "foreign_key"}},
-    {"id": "order_items_products_relationship", "text": "Relationship: order_items.product_id → products.product_id", "metadata": {"type": "relationship", "table1": "order_items", "table2": "products", "relationship_type": "foreign_key"}},
-]
-
-
-# Check existing documents to avoid duplication
-existing_ids = set(collection.get()["ids"])
-# Add schema chunks to the ChromaDB collection
-for chunk in schema_chunks:
-    if chunk["id"] not in existing_ids:
-        collection.add(
-            ids=[chunk["id"]],
-            documents=[chunk["text"]],  # Chroma will automatically generate embeddings
-            metadatas=[chunk["metadata"]]
-        )
\ No newline at end of file
+from schema_indexer import declared_schema, index_schema, reflect_schema, schema_chunks
+
+
+## Builds the `sql_schema` Chroma collection. The chunks come from
+## schema_indexer: reflected from electrical_parts.db when run as a script,
+## from db_setup.metadata for the in-memory collection used offline.
+## Re-running only touches chunks whose table, columns or keys changed.
+
+
+def add_schema_chunks(collection, chunks=None):
+    # Upserts new/changed chunks and deletes stale ones
+    stats = index_schema(collection, chunks if chunks is not None else schema_chunks(declared_schema()))
+    if stats["added"] or stats["updated"] or stats["deleted"]:
+        # Retrieval in this process caches the table -> columns map
+        from schema_retrieval import load_column_map
+        load_column_map(collection, refresh=True)
+    return stats
+
+
+def create_local_collection(embedding_function, name="sql_schema_local"):
+    # In-memory collection with the same chunks, for offline runs and benchmarks
+    client = chromadb.EphemeralClient()
+    collection = client.get_or_create_collection(name=name, embedding_function=embedding_function)
+    add_schema_chunks(collection)
+    return collection
+
+
+if __name__ == "__main__":
+    # Initialize ChromaDB with persistence
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    collection = chroma_client.get_or_create_collection(name="sql_schema")  # Collection to store schema and documents
+    print(add_schema_chunks(collection, schema_chunks(reflect_schema())))
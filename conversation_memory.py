@@ -0,0 +1,164 @@
+import re
+from collections import OrderedDict, deque
+import dspy
+from query_guard import TABLE_REFERENCE, table_aliases
+
+
+## Token-budgeted conversation memory for the chatbot.
+## The last `max_turns` turns stay verbatim; turns that fall out of that window
+## are folded one at a time into a rolling summary (never re-summarised from
+## scratch), and values the bot's SQL already resolved (the customer, a state,
+## an order id) are kept as entities. `history()` renders all of it as the
+## list[str] GenerateSQL expects, within `max_tokens`, and `token_count` is
+## kept up to date incrementally so each turn costs the same however long the
+## session runs.
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# col = 'value' / alias.col = 42 in generated SQL
+SQL_EQUALITY = re.compile(r"(?:\b([A-Za-z_]\w*)\.)?\b([A-Za-z_]\w*)\s*=\s*(?:'((?:[^']|'')*)'|(\d+(?:\.\d+)?)\b)")
+MAX_SUMMARY_LINE_CHARS = 160
+SUMMARY_HEADER = "Summary of earlier conversation:"
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count: words and punctuation marks, no tokenizer download."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def extractive_summary(summary: str, user: str, bot: str) -> str:
+    """Default summarizer: appends one compact line per folded turn, no LM call."""
+    line = f"- asked: {_shorten(user, MAX_SUMMARY_LINE_CHARS // 2)} -> {_shorten(bot, MAX_SUMMARY_LINE_CHARS // 2)}"
+    return f"{summary}\n{line}" if summary else line
+
+
+class UpdateSummary(dspy.Signature):
+    """Update a running summary of a conversation about a database with one more exchange.
+    Keep facts the user may refer back to (names, ids, filters, results); stay brief."""
+
+    summary: str = dspy.InputField(desc="Summary so far, may be empty")
+    user: str = dspy.InputField()
+    bot: str = dspy.InputField()
+    updated_summary: str = dspy.OutputField()
+
+
+class LMSummarizer(dspy.Module):
+    """Summarizer that asks the LM to merge one turn into the summary."""
+
+    def __init__(self):
+        super().__init__()
+        self.update = dspy.Predict(UpdateSummary)
+
+    def forward(self, summary: str, user: str, bot: str) -> str:
+        return self.update(summary=summary, user=user, bot=bot).updated_summary
+
+
+def resolved_entities(sql_query: str) -> dict:
+    """{"customers.name": "Alice Cooper", ...} from the equality filters in `sql_query`."""
+    sql_query = sql_query or ""
+    aliases = table_aliases(sql_query, {match.group(1).lower() for match in TABLE_REFERENCE.finditer(sql_query)})
+    entities = {}
+    for qualifier, column, text, number in SQL_EQUALITY.findall(sql_query):
+        if text == "" and number == "":
+            continue
+        key = f"{aliases.get(qualifier.lower(), qualifier)}.{column}" if qualifier else column
+        entities[key] = text.replace("''", "'") if number == "" else number
+    return entities
+
+
+class ConversationMemory:
+    """Bounded prompt history: summary + entities + the last `max_turns` turns."""
+
+    def __init__(self, max_turns: int = 4, max_tokens: int = 1000, max_entities: int = 16,
+                 summarizer=extractive_summary, tokenizer=count_tokens, entities: dict = None):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_entities = max_entities
+        self.summarizer = summarizer
+        self.tokenizer = tokenizer
+        self.turns = deque()            # (user, bot, tokens)
+        self.turn_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.entities = OrderedDict()   # most recently resolved last
+        self._entity_line = ""
+        self.entity_tokens = 0
+        self.folded_turns = 0
+        self.update_entities(entities or {})
+
+    @property
+    def token_count(self) -> int:
+        """Tokens this memory contributes to the prompt."""
+        return self.summary_tokens + self.entity_tokens + self.turn_tokens
+
+    def add_turn(self, user: str, bot: str, sql_query: str = ""):
+        tokens = self.tokenizer(f"User: {user}") + self.tokenizer(f"Bot: {bot}")
+        self.turns.append((user, bot, tokens))
+        self.turn_tokens += tokens
+        self.update_entities(resolved_entities(sql_query))
+
+        while len(self.turns) > self.max_turns:
+            self._fold_oldest()
+        # Over budget: the summary shrinks first, then verbatim turns are
+        # folded too, but the latest turn always stays
+        self._trim_summary()
+        while self.token_count > self.max_tokens and len(self.turns) > 1:
+            self._fold_oldest()
+            self._trim_summary()
+
+    def update_entities(self, entities: dict):
+        if not entities:
+            return
+        for key, value in entities.items():
+            self.entities.pop(key, None)
+            self.entities[key] = value
+        while len(self.entities) > self.max_entities:
+            self.entities.popitem(last=False)
+        self._entity_line = "Known entities: " + "; ".join(f"{key} = {value}" for key, value in self.entities.items())
+        self.entity_tokens = self.tokenizer(self._entity_line)
+
+    def _fold_oldest(self):
+        user, bot, tokens = self.turns.popleft()
+        self.turn_tokens -= tokens
+        self.summary = self.summarizer(self.summary, user, bot)
+        self._count_summary()
+        self.folded_turns += 1
+
+    def _trim_summary(self):
+        """Drops the oldest summary lines, then halves what is left, until the budget fits."""
+        budget = self.max_tokens - self.entity_tokens - self.turn_tokens
+        while self.summary and self.summary_tokens > budget:
+            lines = self.summary.splitlines()
+            if len(lines) > 1:
+                self.summary = "\n".join(lines[1:])
+            elif budget <= 0 or len(self.summary) < 8:
+                self.summary = ""
+            else:
+                self.summary = "..." + self.summary[len(self.summary) // 2:]
+            self._count_summary()
+
+    def _count_summary(self):
+        self.summary_tokens = self.tokenizer(f"{SUMMARY_HEADER}\n{self.summary}") if self.summary else 0
+
+    def history(self) -> list:
+        history = []
+        if self.summary:
+            history.append(f"{SUMMARY_HEADER}\n{self.summary}")
+        if self.entities:
+            history.append(self._entity_line)
+        for user, bot, _ in self.turns:
+            history.append(f"User: {user}")
+            history.append(f"Bot: {bot}")
+        return history
+
+    def clear(self):
+        self.turns.clear()
+        self.turn_tokens = 0
+        self.summary, self.summary_tokens = "", 0
+        self.entities.clear()
+        self._entity_line, self.entity_tokens = "", 0
+        self.folded_turns = 0
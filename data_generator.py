@@ -0,0 +1,200 @@
+import argparse
+import datetime
+import os
+import random
+import time
+from itertools import islice
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateTable
+from db_setup import metadata, suppliers, categories, products, customers, orders, order_items, taxes
+
+
+## Synthetic data generator for the electrical_parts schema.
+## Builds a database from the same MetaData/Table definitions as db_setup.py at
+## a chosen scale, loading through batched executemany with load-tuned pragmas
+## and creating the FK/filter indexes once the data is in.
+##   python data_generator.py --scale 1m
+##   python data_generator.py --scale 10k --output electrical_parts_10k.db --force
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Share of the total row count per table; order_items averages 3 per order
+SHARES = {"suppliers": 0.001, "products": 0.015, "customers": 0.04, "orders": 0.236}
+
+CATEGORY_NAMES = [
+    "Wires & Cables", "Switches & Sockets", "Lighting", "Transformers", "Circuit Breakers",
+    "Fuses", "Conduits", "Connectors", "Meters", "Relays", "Motors", "Batteries",
+    "Solar", "Tools", "Enclosures", "Sensors", "Timers", "Plugs", "Adapters", "Generators",
+]
+PRODUCT_WORDS = ["Copper", "LED", "Mini", "Heavy Duty", "Smart", "Outdoor", "Industrial", "Compact", "Dual", "Pro"]
+PRODUCT_ITEMS = ["Wire", "Bulb", "Socket", "Transformer", "Breaker", "Fuse", "Switch", "Relay", "Cable", "Meter"]
+FIRST_NAMES = ["Alice", "Bob", "Carol", "Dave", "Erin", "Frank", "Grace", "Heidi", "Ivan", "Judy", "Martin", "Nina"]
+LAST_NAMES = ["Cooper", "Martin", "Smith", "Johnson", "Lee", "Garcia", "Brown", "Davis", "Miller", "Wilson"]
+STATES = [
+    "alabama", "alaska", "arizona", "arkansas", "california", "colorado", "connecticut", "delaware",
+    "florida", "georgia", "hawaii", "idaho", "illinois", "indiana", "iowa", "kansas", "kentucky",
+    "louisiana", "maine", "maryland", "massachusetts", "michigan", "minnesota", "mississippi",
+    "missouri", "montana", "nebraska", "nevada", "new hampshire", "new jersey", "new mexico",
+    "new york", "north carolina", "north dakota", "ohio", "oklahoma", "oregon", "pennsylvania",
+    "rhode island", "south carolina", "south dakota", "tennessee", "texas", "utah", "vermont",
+    "virginia", "washington", "west virginia", "wisconsin", "wyoming",
+]
+
+# Fast, unsafe-on-crash settings: the file is rebuilt from scratch if a load fails
+LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "locking_mode": "EXCLUSIVE",
+    "temp_store": "MEMORY",
+    "cache_size": -512000,  # ~512MB
+}
+
+
+def table_sizes(total_rows: int) -> dict:
+    sizes = {name: max(int(total_rows * share), 3) for name, share in SHARES.items()}
+    sizes["categories"] = len(CATEGORY_NAMES)
+    sizes["taxes"] = len(STATES)
+    return sizes
+
+
+def generate_suppliers(rng, count):
+    for i in range(1, count + 1):
+        yield (i, f"Supplier {i}", f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+               f"555-{rng.randrange(10000):04d}", f"{rng.randrange(1, 9999)} Industrial Rd")
+
+
+def generate_categories():
+    for i, name in enumerate(CATEGORY_NAMES, start=1):
+        yield (i, name)
+
+
+def generate_products(rng, count, supplier_count, prices):
+    for i in range(1, count + 1):
+        price = round(rng.uniform(0.5, 500), 2)
+        prices.append(price)
+        yield (i, f"{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_ITEMS)} {i}", rng.randrange(1, len(CATEGORY_NAMES) + 1),
+               rng.randrange(1, supplier_count + 1), price, rng.randrange(0, 1000))
+
+
+def generate_customers(rng, count):
+    for i in range(1, count + 1):
+        yield (i, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}", f"customer{i}@example.com",
+               f"555-{rng.randrange(10000):04d}", f"{rng.randrange(1, 9999)} Main St", rng.choice(STATES))
+
+
+def generate_orders(rng, count, customer_count, prices, items_out):
+    """Yields orders and appends their line items to `items_out` as it goes."""
+    start_date = datetime.date(2022, 1, 1).toordinal()
+    item_id = 0
+    for order_id in range(1, count + 1):
+        total = 0.0
+        for _ in range(rng.randint(1, 5)):
+            item_id += 1
+            product_id = rng.randrange(1, len(prices) + 1)
+            quantity = rng.randint(1, 10)
+            unit_price = prices[product_id - 1]
+            total += quantity * unit_price
+            items_out.append((item_id, order_id, product_id, quantity, unit_price))
+        order_date = datetime.date.fromordinal(start_date + rng.randrange(1460)).isoformat()
+        yield (order_id, rng.randrange(1, customer_count + 1), order_date, round(total, 2))
+
+
+def generate_taxes(rng):
+    for state in STATES:
+        yield (state, round(rng.uniform(0.0, 0.1), 4))
+
+
+def insert_rows(dbapi_connection, table, rows, batch_size: int) -> int:
+    placeholders = ", ".join("?" for _ in table.columns)
+    statement = f"INSERT INTO {table.name} ({', '.join(table.columns.keys())}) VALUES ({placeholders})"
+    cursor = dbapi_connection.cursor()
+    inserted = 0
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        cursor.executemany(statement, batch)
+        inserted += len(batch)
+    cursor.close()
+    return inserted
+
+
+def generate_db(path: str, total_rows: int, seed: int = 0, batch_size: int = 50_000, log=print):
+    engine = create_engine(f"sqlite:///{path}")
+    rng = random.Random(seed)
+    sizes = table_sizes(total_rows)
+    started = time.perf_counter()
+
+    dbapi_connection = engine.raw_connection()
+    try:
+        cursor = dbapi_connection.cursor()
+        for name, value in LOAD_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        # Tables first, indexes after the load: one sort per index instead of
+        # a B-tree update per inserted row
+        for table in metadata.sorted_tables:
+            cursor.execute(str(CreateTable(table).compile(engine)))
+
+        prices, items = [], []
+        loads = [
+            (suppliers, generate_suppliers(rng, sizes["suppliers"])),
+            (categories, generate_categories()),
+            (products, generate_products(rng, sizes["products"], sizes["suppliers"], prices)),
+            (customers, generate_customers(rng, sizes["customers"])),
+            (taxes, generate_taxes(rng)),
+        ]
+        for table, rows in loads:
+            count = insert_rows(dbapi_connection, table, rows, batch_size)
+            log(f"{table.name:<12} {count:>10} rows  {time.perf_counter() - started:6.1f}s")
+
+        # Orders and their items are generated together so totals add up; the
+        # items are flushed after every orders batch to keep memory flat
+        order_rows = generate_orders(rng, sizes["orders"], sizes["customers"], prices, items)
+        order_count = item_count = 0
+        while batch := list(islice(order_rows, batch_size)):
+            order_count += insert_rows(dbapi_connection, orders, batch, batch_size)
+            item_count += insert_rows(dbapi_connection, order_items, items, batch_size)
+            items.clear()
+        log(f"{'orders':<12} {order_count:>10} rows  {time.perf_counter() - started:6.1f}s")
+        log(f"{'order_items':<12} {item_count:>10} rows  {time.perf_counter() - started:6.1f}s")
+        dbapi_connection.commit()
+
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                columns = ", ".join(column.name for column in index.columns)
+                cursor.execute(f"CREATE INDEX {index.name} ON {table.name} ({columns})")
+        cursor.execute("ANALYZE")
+        dbapi_connection.commit()
+        log(f"indexes + ANALYZE         {time.perf_counter() - started:6.1f}s")
+
+        # Back to the settings the agent expects (see db_setup.create_db)
+        cursor.execute("PRAGMA locking_mode=NORMAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+    finally:
+        dbapi_connection.close()
+        engine.dispose()
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--output", default=None, help="defaults to electrical_parts_<scale>.db")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--force", action="store_true", help="overwrite an existing file")
+    args = parser.parse_args()
+
+    path = args.output or f"electrical_parts_{args.scale}.db"
+    if os.path.exists(path):
+        if not args.force:
+            parser.error(f"{path} already exists; pass --force to overwrite it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print(f"Generating {path} at scale {args.scale} ({SCALES[args.scale]} rows)")
+    generate_db(path, SCALES[args.scale], seed=args.seed, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
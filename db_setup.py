@@ -1,83 +1,113 @@
 import pandas as pd
 import datetime
 from sqlalchemy import (
-    create_engine, MetaData, Table, Column, Integer, String, Float, ForeignKey, Date
+    create_engine, MetaData, Table, Column, Integer, String, Float, ForeignKey, Date, Index
 )
 
 
-def create_db():
-    # Create a persistent SQLite database in a file
-    engine = create_engine("sqlite:///electrical_parts.db", echo=True)
-    metadata = MetaData()
-
-    # 1. Define suppliers table
-    suppliers = Table(
-        "suppliers", metadata,
-        Column("supplier_id", Integer, primary_key=True, autoincrement=True),
-        Column("name", String, nullable=False),
-        Column("contact_name", String),
-        Column("phone", String),
-        Column("address", String)
-    )
-
-    # 2. Define categories table
-    categories = Table(
-        "categories", metadata,
-        Column("category_id", Integer, primary_key=True, autoincrement=True),
-        Column("name", String, nullable=False)
-    )
-
-    # 3. Define products table
-    products = Table(
-        "products", metadata,
-        Column("product_id", Integer, primary_key=True, autoincrement=True),
-        Column("name", String, nullable=False),
-        Column("category_id", Integer, ForeignKey("categories.category_id")),
-        Column("supplier_id", Integer, ForeignKey("suppliers.supplier_id")),
-        Column("price", Float),
-        Column("stock_quantity", Integer)
-    )
-
-    # 4. Define customers table
-    customers = Table(
-        "customers", metadata,
-        Column("customer_id", Integer, primary_key=True, autoincrement=True),
-        Column("name", String, nullable=False),
-        Column("email", String, unique=True),
-        Column("phone", String),
-        Column("address", String),
-        Column("state",String)
-    )
-
-    # 5. Define orders table
-    orders = Table(
-        "orders", metadata,
-        Column("order_id", Integer, primary_key=True, autoincrement=True),
-        Column("customer_id", Integer, ForeignKey("customers.customer_id")),
-        Column("order_date", Date),
-        Column("total_amount", Float)
-    )
-
-    # 6. Define order_items table
-    order_items = Table(
-        "order_items", metadata,
-        Column("order_item_id", Integer, primary_key=True, autoincrement=True),
-        Column("order_id", Integer, ForeignKey("orders.order_id")),
-        Column("product_id", Integer, ForeignKey("products.product_id")),
-        Column("quantity", Integer),
-        Column("unit_price", Float)
-    )
-
-    # 7. Define taxes table with state as the primary key
-    taxes = Table(
+metadata = MetaData()
+
+# 1. Define suppliers table
+suppliers = Table(
+    "suppliers", metadata,
+    Column("supplier_id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String, nullable=False),
+    Column("contact_name", String),
+    Column("phone", String),
+    Column("address", String)
+)
+
+# 2. Define categories table
+categories = Table(
+    "categories", metadata,
+    Column("category_id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String, nullable=False)
+)
+
+# 3. Define products table
+products = Table(
+    "products", metadata,
+    Column("product_id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String, nullable=False),
+    Column("category_id", Integer, ForeignKey("categories.category_id")),
+    Column("supplier_id", Integer, ForeignKey("suppliers.supplier_id")),
+    Column("price", Float),
+    Column("stock_quantity", Integer)
+)
+
+# 4. Define customers table
+customers = Table(
+    "customers", metadata,
+    Column("customer_id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String, nullable=False),
+    Column("email", String, unique=True),
+    Column("phone", String),
+    Column("address", String),
+    Column("state",String)
+)
+
+# 5. Define orders table
+orders = Table(
+    "orders", metadata,
+    Column("order_id", Integer, primary_key=True, autoincrement=True),
+    Column("customer_id", Integer, ForeignKey("customers.customer_id")),
+    Column("order_date", Date),
+    Column("total_amount", Float)
+)
+
+# 6. Define order_items table
+order_items = Table(
+    "order_items", metadata,
+    Column("order_item_id", Integer, primary_key=True, autoincrement=True),
+    Column("order_id", Integer, ForeignKey("orders.order_id")),
+    Column("product_id", Integer, ForeignKey("products.product_id")),
+    Column("quantity", Integer),
+    Column("unit_price", Float)
+)
+
+# 7. Define taxes table with state as the primary key
+taxes = Table(
     "taxes", metadata,
     Column("state", String, primary_key=True, nullable=False),  # Use state as the primary key
     Column("tax_rate", Float, nullable=False)  # Store tax rate as a percentage (e.g., 0.07 for 7%)
 )
 
+# Indexes on foreign keys and the columns questions usually filter on
+indexes = [
+    Index("ix_products_category_id", products.c.category_id),
+    Index("ix_products_supplier_id", products.c.supplier_id),
+    Index("ix_products_name", products.c.name),
+    Index("ix_customers_name", customers.c.name),
+    Index("ix_customers_state", customers.c.state),
+    Index("ix_orders_customer_id", orders.c.customer_id),
+    Index("ix_orders_order_date", orders.c.order_date),
+    Index("ix_order_items_order_id", order_items.c.order_id),
+    Index("ix_order_items_product_id", order_items.c.product_id),
+]
+
+
+def create_indexes(engine):
+    # create_all only indexes the tables it creates; this also covers existing files
+    for index in indexes:
+        index.create(engine, checkfirst=True)
+
+
+def create_db():
+    # Create a persistent SQLite database in a file
+    engine = create_engine("sqlite:///electrical_parts.db", echo=True)
 
     # Create all tables
     metadata.create_all(engine)
+    create_indexes(engine)
+
+    # WAL is persistent in the file, so read-only agent connections get it too
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    # Re-running on an existing database only adds missing tables and indexes
+    with engine.connect() as conn:
+        if conn.execute(suppliers.select().limit(1)).first() is not None:
+            return
 
     # Insert initial data
     with engine.begin() as conn:
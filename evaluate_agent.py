@@ -0,0 +1,352 @@
+import argparse
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import dspy
+from dspy.dsp.utils.settings import thread_local_overrides
+from metrics import StageTimingCallback, collect_stages, latency_summary
+
+
+## Evaluation runner for SQLAgent.
+## Runs a dataset on a thread or process pool, caches each prediction on disk
+## keyed by (program state and configuration, LM settings, code, example),
+## streams results as they finish and reports accuracy plus per-stage latency
+## percentiles (retrieval, lm, sql).
+##   python evaluate_agent.py --threads 8
+##   python evaluate_agent.py --offline --no-guard --max-p95-ms total=500
+##   python evaluate_agent.py --lm-cache replay --no-cache
+## --offline swaps in FakeLM and an in-memory schema collection, so the run
+## needs no network and is deterministic; it adds read questions with gold SQL
+## to train_data's write requests so every stage is exercised.
+
+CACHE_DIR = ".eval_cache"
+STAGES = ("retrieval", "lm", "sql", "total")
+
+
+def fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# LM attributes that change on every call
+VOLATILE_LM_ATTRS = {"calls", "history"}
+SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+
+def lm_settings(lm) -> dict:
+    """Class, model, kwargs and scalar settings (FakeLM latency, cache mode, ...) of `lm` and any LM it wraps."""
+    settings = {
+        "class": type(lm).__qualname__,
+        "model": getattr(lm, "model", repr(lm)),
+        "kwargs": getattr(lm, "kwargs", {}),
+        "settings": {k: v for k, v in vars(lm).items()
+                     if not k.startswith("_") and k not in VOLATILE_LM_ATTRS and isinstance(v, SIMPLE_TYPES)},
+    }
+    if isinstance(getattr(lm, "sql_by_question", None), dict):
+        settings["sql_by_question"] = lm.sql_by_question
+    if getattr(lm, "lm", None) is not None:
+        settings["wraps"] = lm_settings(lm.lm)
+    return settings
+
+
+def agent_config(program) -> dict:
+    """Settings outside dump_state() that change predictions: guard, strategy, retrieval, adapter."""
+    from schema_indexer import embedding_key
+    from sql_agent import get_adapter
+    config = {"class": type(program).__qualname__}
+    for name in ("guard", "strategy"):
+        config[name] = getattr(program, name, None)
+    retrieve = getattr(program, "retrieve", None)
+    if retrieve is not None:
+        backend = getattr(retrieve, "backend", None)
+        collection = getattr(backend, "collection", None)
+        embedding_function = (getattr(retrieve, "embedding_function", None)
+                              or getattr(backend, "embedding_function", None)
+                              or getattr(collection, "_embedding_function", None))
+        config["retrieve"] = {
+            "class": type(retrieve).__qualname__,
+            "n_results": getattr(retrieve, "n_results", None),
+            # No backend yet means sql_agent.get_schema_backend(), chosen by the environment
+            "backend": type(backend).__qualname__ if backend is not None else
+            f"default:{os.getenv('SQL_AGENT_SCHEMA_INDEX') or 'chroma'}",
+            "collection": getattr(collection, "name", None),
+            "embedding": embedding_key(embedding_function) if embedding_function is not None else None,
+        }
+    # Resolved the way SQLAgent._generate resolves it
+    adapter = getattr(program, "adapter", None) or dspy.settings.adapter or get_adapter()
+    config["adapter"] = {"class": type(adapter).__qualname__,
+                         "demo_token_budget": getattr(adapter, "demo_token_budget", None),
+                         "max_demos": getattr(adapter, "max_demos", None)}
+    return config
+
+
+def code_fingerprint() -> str:
+    """Hash of the source of every module loaded from this directory."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name, module in sorted(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path and path.endswith(".py") and os.path.dirname(os.path.abspath(path)) == root:
+            with open(path, "rb") as f:
+                digest.update(name.encode() + b"\0" + f.read())
+    return digest.hexdigest()
+
+
+def program_fingerprint(program, lm=None) -> str:
+    """Identifies everything a prediction depends on: program state and
+    configuration, LM settings and the code that runs them."""
+    lm = lm or dspy.settings.lm
+    return fingerprint({"program": program.dump_state(), "config": agent_config(program),
+                        "lm": lm_settings(lm), "code": code_fingerprint()})
+
+
+def example_fingerprint(example) -> str:
+    return fingerprint(example.toDict())
+
+
+class PredictionCache:
+    """One JSON file per (program, example) under `directory`."""
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, program_key: str, example_key: str) -> str:
+        return os.path.join(self.directory, program_key[:16], f"{example_key[:32]}.json")
+
+    def get(self, program_key: str, example_key: str):
+        try:
+            with open(self._path(program_key, example_key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, program_key: str, example_key: str, result: dict):
+        path = self._path(program_key, example_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+
+def program_inputs(example) -> dict:
+    # train_data carries context={}, which would make SQLAgent skip retrieval
+    return {name: value for name, value in example.inputs().items() if not (name == "context" and not value)}
+
+
+def read_examples() -> list:
+    """Read questions with gold SQL (bench_lm_cache.QUESTIONS), so retrieval and SQL run offline."""
+    from bench_lm_cache import QUESTIONS
+    return [dspy.Example(question=question, sql_query=sql, answer="").with_inputs("question")
+            for question, sql in QUESTIONS.items()]
+
+
+def run_example(program, metric, example) -> dict:
+    """Runs one example and returns its prediction, score and stage timings."""
+    with collect_stages() as stages:
+        start = time.perf_counter()
+        try:
+            prediction, error = program(**program_inputs(example)), None
+        except Exception as e:
+            prediction, error = None, f"{type(e).__name__}: {e}"
+        stages["total"] = time.perf_counter() - start
+
+    score = bool(metric(example, prediction)) if prediction is not None else False
+    return {
+        "question": example.question,
+        "answer": getattr(prediction, "answer", None),
+        "sql_query": getattr(prediction, "sql_query", None),
+        "score": score,
+        "error": error,
+        "stages": dict(stages),
+    }
+
+
+def _run_in_thread(program, metric, example, overrides):
+    # Worker threads do not inherit dspy.context() from the caller
+    with dspy.context(**overrides):
+        return run_example(program, metric, example)
+
+
+_worker_program = None
+_worker_metric = None
+
+
+def _init_process_worker(program_factory, lm_factory, metric):
+    global _worker_program, _worker_metric
+    _worker_program = program_factory()
+    _worker_metric = metric
+    dspy.configure(lm=lm_factory() if lm_factory else dspy.settings.lm, callbacks=[StageTimingCallback()])
+
+
+def _run_in_process(example):
+    return run_example(_worker_program, _worker_metric, example)
+
+
+def evaluate(program, dataset, metric, num_threads: int = 8, executor: str = "thread",
+             cache_dir: str = CACHE_DIR, program_factory=None, lm_factory=None):
+    """Yields one result dict per example, in completion order.
+
+    With executor="process", `program_factory` and `lm_factory` must be
+    picklable callables; each worker builds its own program and LM from them.
+    """
+    if program is None:
+        program = program_factory()
+    lm = lm_factory() if lm_factory else dspy.settings.lm
+    program_key = program_fingerprint(program, lm)
+    cache = PredictionCache(cache_dir) if cache_dir else None
+
+    pending = []
+    for index, example in enumerate(dataset):
+        example_key = example_fingerprint(example)
+        cached = cache.get(program_key, example_key) if cache else None
+        if cached is not None:
+            yield {**cached, "index": index, "cached": True}
+        else:
+            pending.append((index, example_key, example))
+    if not pending:
+        return
+
+    if executor == "process":
+        # spawn, not fork: Chroma and the SQL pools start threads at import
+        pool = ProcessPoolExecutor(
+            max_workers=num_threads, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process_worker,
+            initargs=(program_factory, lm_factory, metric),
+        )
+        submit = lambda example: pool.submit(_run_in_process, example)
+    else:
+        pool = ThreadPoolExecutor(max_workers=num_threads)
+        overrides = {**thread_local_overrides.overrides, "lm": lm}
+        overrides["callbacks"] = [*overrides.get("callbacks", dspy.settings.callbacks), StageTimingCallback()]
+        submit = lambda example: pool.submit(_run_in_thread, program, metric, example, overrides)
+
+    with pool:
+        futures = {submit(example): (index, example_key) for index, example_key, example in pending}
+        for future in as_completed(futures):
+            index, example_key = futures[future]
+            result = future.result()
+            if cache and result["error"] is None:
+                cache.put(program_key, example_key, result)
+            yield {**result, "index": index, "cached": False}
+
+
+def summarize(results: list) -> dict:
+    """Accuracy over every result; latency percentiles (ms) over fresh runs only."""
+    fresh = [result for result in results if not result["cached"]]
+    stages = {
+        name: latency_summary([result["stages"].get(name, 0.0) * 1000 for result in fresh])
+        for name in STAGES
+    }
+    return {
+        "examples": len(results),
+        "accuracy": sum(result["score"] for result in results) / len(results) if results else 0.0,
+        "errors": sum(result["error"] is not None for result in results),
+        "cached": len(results) - len(fresh),
+        "stages_ms": stages,
+    }
+
+
+def build_agent(offline: bool = False, guard: bool = True, program_path: str = "optimized_agent.json",
+                strategy: str = "react"):
+    from sql_agent import SQLAgent
+
+    retrieve = None
+    if offline:
+        from chroma_setup import create_local_collection
+        from local_embedding import HashingEmbeddingFunction
+        from schema_retrieval import RetrieveSchema
+        retrieve = RetrieveSchema(collection=create_local_collection(HashingEmbeddingFunction()))
+    agent = SQLAgent(guard=guard, retrieve=retrieve, strategy=strategy)
+    if program_path and os.path.exists(program_path):
+        agent.load(program_path)
+    return agent
+
+
+def parse_budgets(values: list) -> dict:
+    budgets = {}
+    for value in values or []:
+        name, _, limit = value.partition("=")
+        if name not in STAGES or not limit:
+            raise argparse.ArgumentTypeError(f"expected <stage>=<ms> with stage in {STAGES}, got {value!r}")
+        budgets[name] = float(limit)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--program", default="optimized_agent.json")
+    parser.add_argument("--offline", action="store_true", help="use FakeLM and an in-memory schema collection")
+    parser.add_argument("--lm-latency-ms", type=float, default=0.0, help="FakeLM latency with --offline")
+    parser.add_argument("--no-guard", action="store_true", help="send write requests through the full pipeline")
+    parser.add_argument("--strategy", choices=["react", "one_shot"], default="react")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--min-accuracy", type=float, default=None)
+    parser.add_argument("--max-p95-ms", nargs="*", default=[], help="fail if a stage's p95 exceeds it, e.g. total=500")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--lm-cache", choices=["record", "replay", "passthrough"], default=None,
+                        help="route LM calls through the on-disk response cache")
+    parser.add_argument("--lm-cache-path", default=None)
+    args = parser.parse_args()
+    budgets = parse_budgets(args.max_p95_ms)
+
+    from sql_agent import validate_prediction
+    from train_set import train_data
+
+    dataset = list(train_data)
+    if args.offline:
+        # train_data only holds write requests
+        dataset += read_examples()
+
+    program_factory = functools.partial(build_agent, offline=args.offline, guard=not args.no_guard,
+                                        program_path=args.program, strategy=args.strategy)
+    lm_factory = None
+    if args.offline:
+        from fake_lm import FakeLM
+        gold_sql = {example.question: example.sql_query for example in dataset}
+        lm_factory = functools.partial(FakeLM, sql_by_question=gold_sql, latency_ms=args.lm_latency_ms)
+    else:
+        lm_factory = functools.partial(dspy.LM, "groq/qwen-2.5-32b", api_key=os.getenv("GROQ_API_KEY"))
+    if args.lm_cache:
+        from lm_cache import CACHE_PATH, cached_lm
+        lm_factory = functools.partial(cached_lm, lm_factory, mode=args.lm_cache, path=args.lm_cache_path or CACHE_PATH)
+
+    program = None if args.executor == "process" else program_factory()
+    results = []
+    for result in evaluate(program, dataset, validate_prediction, num_threads=args.threads,
+                           executor=args.executor, cache_dir=None if args.no_cache else args.cache_dir,
+                           program_factory=program_factory, lm_factory=lm_factory):
+        results.append(result)
+        status = "PASS" if result["score"] else "FAIL"
+        source = "cached" if result["cached"] else f"{result['stages']['total'] * 1000:.0f}ms"
+        print(f"[{len(results)}/{len(dataset)}] {status} {source:>8}  {result['question']}", file=sys.stderr)
+
+    summary = summarize(results)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"accuracy {summary['accuracy']:.1%} over {summary['examples']} examples "
+              f"({summary['cached']} cached, {summary['errors']} errors)")
+        for name, stats in summary["stages_ms"].items():
+            print(f"  {name:<10} p50={stats['p50']:8.1f}ms  p95={stats['p95']:8.1f}ms  p99={stats['p99']:8.1f}ms")
+
+    failures = []
+    if args.min_accuracy is not None and summary["accuracy"] < args.min_accuracy:
+        failures.append(f"accuracy {summary['accuracy']:.1%} < {args.min_accuracy:.1%}")
+    for name, limit in budgets.items():
+        if summary["stages_ms"][name]["count"] and summary["stages_ms"][name]["p95"] > limit:
+            failures.append(f"{name} p95 {summary['stages_ms'][name]['p95']:.1f}ms > {limit}ms")
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
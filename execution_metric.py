@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+import metrics
+import sql_engine
+from intent_guard import validate_sql_query
+from query_guard import QueryBudget, QueryTooExpensive
+
+
+## Execution-equivalence metric for SQLAgent predictions.
+## A predicted query is correct when it returns the same result set as the
+## gold query, however it is written. Result sets are reduced to a canonical
+## hash that ignores row order (a sum of per-row hashes, so rows stream
+## through without sorting) and treats 5 and 5.0 alike. Gold hashes are
+## computed once per dataset and database and kept in GOLD_CACHE_PATH;
+## predicted queries run read-only under a query_guard.QueryBudget and are
+## memoized by normalized text, so a query seen again (another thread, round
+## or example) is never executed twice. When the SQLite file changes (size or
+## mtime of the database or its WAL), gold hashes and memoized results are
+## dropped and recomputed.
+##   metric = ExecutionMetric(train_data)
+##   metric(example, prediction)
+
+GOLD_CACHE_PATH = ".eval_cache/gold_results.json"
+EVAL_BUDGET = QueryBudget(max_seconds=1.0)
+FLOAT_DIGITS = 6
+REFUSAL_PREFIX = "Sorry, but you are not allowed"
+_HASH_MODULUS = 2 ** 128
+
+
+def normalize_sql(query: str) -> str:
+    """Whitespace- and trailing-semicolon-insensitive key for a query."""
+    return " ".join(query.strip().rstrip(";").split())
+
+
+def _canonical_value(value):
+    if isinstance(value, float):
+        value = round(value, FLOAT_DIGITS)
+        return int(value) if value.is_integer() else value
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+def result_hash(rows) -> str:
+    """Order-insensitive hash of a result set: row count + sum of row digests."""
+    count, total = 0, 0
+    for row in rows:
+        encoded = json.dumps([_canonical_value(value) for value in row], default=str).encode()
+        total = (total + int.from_bytes(hashlib.sha256(encoded).digest()[:16], "big")) % _HASH_MODULUS
+        count += 1
+    return f"{count}:{total:032x}"
+
+
+def database_identity(url: str = None) -> dict:
+    """What the gold hashes depend on: the URL and, for SQLite files, their size and mtime."""
+    url = url or sql_engine.DEFAULT_DB_URL
+    identity = {"url": url}
+    path = sql_engine.sqlite_path(url)
+    if path:
+        for suffix in ("", "-wal"):
+            try:
+                stat = os.stat(path + suffix)
+                identity[path + suffix] = [stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                pass
+    return identity
+
+
+class ExecutionMetric:
+    """Compares predicted and gold SQL by their result hashes.
+
+    Refusal examples (empty gold SQL) still pass on the refusal message. A gold
+    query that cannot run falls back to comparing normalized SQL text.
+    """
+
+    def __init__(self, dataset=(), url: str = None, budget: QueryBudget = EVAL_BUDGET,
+                 gold_cache_path: str = GOLD_CACHE_PATH):
+        self.url = url
+        self.budget = budget
+        self.gold_cache_path = gold_cache_path
+        self._memo = {}                 # normalized SQL -> Future of (hash, error)
+        self._lock = threading.Lock()
+        self._gold_lock = threading.Lock()
+        self.stats = {"executions": 0, "memo_hits": 0, "text_matches": 0, "errors": 0}
+        self.gold = {}                  # normalized gold SQL -> (hash, error)
+        self._identity = None           # database_identity the hashes above belong to
+        self.add_gold(example.sql_query for example in dataset)
+
+    def __call__(self, example, pred, trace=None):
+        if not example.sql_query:
+            return bool(pred is not None and getattr(pred, "answer", "").startswith(REFUSAL_PREFIX))
+        predicted = getattr(pred, "sql_query", None)
+        if not predicted:
+            return False
+
+        gold_key, predicted_key = normalize_sql(example.sql_query), normalize_sql(predicted)
+        if gold_key == predicted_key:
+            self._count("text_matches")
+            return True
+        self.refresh()
+        gold_hash, gold_error = self.gold.get(gold_key) or self.add_gold([example.sql_query])[gold_key]
+        if gold_error:
+            return False
+        predicted_hash, _ = self.run(predicted)
+        return predicted_hash == gold_hash
+
+    def refresh(self):
+        """Drops gold hashes and memoized results if the database changed since they were computed."""
+        identity = json.dumps(database_identity(self.url), sort_keys=True)
+        with self._gold_lock:
+            self._use_identity(identity)
+        return identity
+
+    def _use_identity(self, identity: str):
+        # Caller holds _gold_lock
+        if identity != self._identity:
+            with self._lock:
+                self.gold.clear()
+                self._memo.clear()
+            self._identity = identity
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def run(self, query: str):
+        """(result hash, None) or (None, error) for `query`, executed at most once."""
+        key = normalize_sql(query)
+        with self._lock:
+            future = self._memo.get(key)
+            owner = future is None
+            if owner:
+                future = self._memo[key] = Future()
+                self.stats["executions"] += 1
+            else:
+                self.stats["memo_hits"] += 1
+        if owner:
+            future.set_result(self._execute(query))
+        return future.result()
+
+    def _execute(self, query: str):
+        try:
+            validate_sql_query(query)
+            return result_hash(sql_engine.iter_sql(query, url=self.url, budget=self.budget)), None
+        except (ValueError, QueryTooExpensive) as e:
+            error = str(e)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self._count("errors")
+        metrics.increment("eval.sql_errors")
+        return None, error
+
+    def add_gold(self, queries) -> dict:
+        """Hashes gold queries not seen yet, reusing GOLD_CACHE_PATH for this database."""
+        identity = json.dumps(database_identity(self.url), sort_keys=True)
+        with self._gold_lock:
+            self._use_identity(identity)
+            queries = {normalize_sql(query) for query in queries if query} - self.gold.keys()
+            if not queries:
+                return dict(self.gold)
+            stored = self._load_gold_cache().get(identity, {})
+            for key in sorted(queries):
+                if key not in stored:
+                    stored[key] = list(self.run(key))
+                self.gold[key] = tuple(stored[key])
+            if self.gold_cache_path:
+                # Entries for other database versions are stale
+                self._save_gold_cache({identity: stored})
+            return dict(self.gold)
+
+    def _load_gold_cache(self) -> dict:
+        if not self.gold_cache_path:
+            return {}
+        try:
+            with open(self.gold_cache_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_gold_cache(self, cache: dict):
+        os.makedirs(os.path.dirname(self.gold_cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.gold_cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.gold_cache_path)
@@ -0,0 +1,78 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+import dspy
+from intent_guard import REFUSAL_MESSAGE
+
+
+## Deterministic local LM stand-in for benchmarks and offline runs.
+## It reads the output fields DSPy asks for from the prompt and answers them in
+## ChatAdapter format, so SQLAgent's ReAct loop runs end to end: the first step
+## calls execute_sql, the next one finishes, and the extract step answers from
+## the observation (or from the `result` input of the one-shot FormatAnswer).
+## Questions mapped to an empty query in `sql_by_question` get the standard
+## refusal. `latency_ms` simulates the round-trip to a real provider.
+##   dspy.configure(lm=FakeLM(latency_ms=200))
+
+DEFAULT_SQL = "SELECT COUNT(*) FROM products"
+FIELD_PATTERN = re.compile(r"`\[\[ ## (\w+) ## \]\]`")
+SECTION_PATTERN = re.compile(r"\[\[ ## (\w+) ## \]\]\n(.*?)(?=\n\n\[\[ ## |\Z)", re.DOTALL)
+
+
+def parse_sections(content: str) -> dict:
+    return {name: value.strip() for name, value in SECTION_PATTERN.findall(content)}
+
+
+class FakeLM(dspy.LM):
+    def __init__(self, sql_by_question: dict = None, latency_ms: float = 0.0, model: str = "fake/sql-agent"):
+        super().__init__(model=model, cache=False)
+        self.sql_by_question = sql_by_question or {}
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def sql_for(self, question: str) -> str:
+        return self.sql_by_question.get(question, DEFAULT_SQL)
+
+    def outputs_for(self, fields: list, sections: dict) -> dict:
+        # The trajectory's own headers (thought_0, observation_0, ...) show up
+        # as sections of the prompt too
+        observation = sections.get("observation_0") or sections.get("result")
+        sql = self.sql_for(sections.get("question", ""))
+        if not sql:
+            return {field: {"next_tool_name": "finish", "next_tool_args": "{}", "answer": REFUSAL_MESSAGE}.get(field, "")
+                    for field in fields}
+        values = {
+            "next_thought": "I have the result." if observation is not None else "I should query the database.",
+            "next_tool_name": "finish" if observation is not None else "execute_sql",
+            "next_tool_args": json.dumps({} if observation is not None else {"query": sql}),
+            "reasoning": "The query result answers the question.",
+            "sql_query": sql,
+            "answer": f"The result is {observation or 'unavailable'}.",
+        }
+        return {field: values.get(field, "") for field in fields}
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        with self._calls_lock:
+            self.calls += 1
+
+        messages = messages or [{"role": "user", "content": prompt}]
+        content = messages[-1]["content"]
+        fields = FIELD_PATTERN.findall(content.rsplit("Respond with the corresponding output fields", 1)[-1])
+        fields = [field for field in fields if field != "completed"]
+        outputs = self.outputs_for(fields, parse_sections(content))
+        completion = "\n\n".join(f"[[ ## {field} ## ]]\n{value}" for field, value in outputs.items())
+        completion += "\n\n[[ ## completed ## ]]"
+
+        prompt_tokens = sum(len(str(message["content"])) for message in messages) // 4
+        completion_tokens = len(completion) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=completion), finish_reason="stop")],
+            usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                   "total_tokens": prompt_tokens + completion_tokens},
+            model=self.model,
+        )
@@ -0,0 +1,191 @@
+import math
+import re
+from collections import Counter
+
+
+## Zero-LLM guard for write/modify requests.
+## SQLAgent calls `is_write_request` before any retrieval or LM call and answers
+## with the standard refusal. `validate_sql_query` parses whatever SQL the model
+## produces so only a single read-only statement ever reaches execute_sql.
+
+REFUSAL_MESSAGE = "Sorry, but you are not allowed to perform this operation."
+
+# Verbs that start a request to change data ("Delete all customers ...")
+WRITE_VERBS = {
+    "add", "alter", "buy", "cancel", "create", "delete", "drop", "edit", "insert",
+    "modify", "remove", "rename", "replace", "restock", "truncate", "update",
+}
+# Heads that are also nouns in this schema ("Order history for ...", "Set of
+# all products ..."). They count as write verbs only when an object follows
+# ("Order 5 bulbs", "Set the price ..."); otherwise the classifier decides.
+AMBIGUOUS_HEADS = {
+    "change", "decrease", "increase", "order", "place", "purchase", "register", "reset", "set",
+}
+# Write verbs that ask for information ("Add up the prices ...", "Update me
+# on ...", "Create a list of ..."); the classifier decides these.
+READ_IDIOMS = {("add", "up"), ("drop", "me"), ("drop", "us"), ("update", "me"), ("update", "us")}
+REPORT_NOUNS = {"breakdown", "chart", "list", "overview", "report", "summary", "tally"}
+OBJECT_STARTERS = {
+    "a", "all", "an", "another", "each", "every", "her", "him", "his", "it", "me", "my", "new",
+    "our", "some", "that", "the", "their", "them", "these", "this", "those", "up", "us", "your",
+}
+# Words that start a request for information ("How many ...", "List all ...")
+READ_VERBS = {
+    "are", "can", "count", "did", "do", "does", "find", "get", "give", "how", "is",
+    "list", "show", "tell", "what", "when", "where", "which", "who", "whose", "why",
+}
+# Polite or indirect openers stripped before looking at the head verb
+REQUEST_PREFIXES = re.compile(
+    r"^(?:(?:please|kindly|now|also|ok(?:ay)?|hey|hi)\W+"
+    r"|(?:can|could|would|will) you(?: please)?\W+"
+    r"|i(?: would|'d)? (?:want|like|need|wish)(?: you)? to\W+"
+    r"|i(?: would|'d) like(?: you)? to\W+"
+    r"|(?:help me|let me|let's|lets)\W+)+"
+)
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Read questions used as negative examples for the classifier; train_set.py
+# currently only holds write requests.
+READ_EXAMPLES = [
+    "How many Mini Transformer 220V-110V are available?",
+    "How many transformers are in stock?",
+    "What is the cost of a 10W LED bulb?",
+    "List all categories of electrical parts.",
+    "How many orders did customer John Doe place?",
+    "Show me all products supplied by 'ElectroSupply Inc.'.",
+    "What is the total revenue from orders this month?",
+    "Find all products in the 'Lighting' category with less than 20 in stock",
+    "Which customers haven't placed any orders?",
+    "What is the tax rate in california?",
+    "Order history for Alice Cooper?",
+    "Orders placed in the last week",
+    "Set of all products by supplier 2",
+    "Change in stock for transformers since last month?",
+    "Purchase history of customer John Doe",
+    "Placement of the Lighting category in the catalog?",
+    "Increase in revenue compared to last month?",
+    "Register of all suppliers and their cities",
+]
+
+
+def tokenize(text: str) -> list:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def request_words(question: str) -> list:
+    """Words of the request once polite prefixes are removed."""
+    return tokenize(REQUEST_PREFIXES.sub("", question.strip().lower()))
+
+
+def asks_for_report(words: list) -> bool:
+    """True for READ_IDIOMS and "<verb> (me) a list/report/... of ..."."""
+    if tuple(words[:2]) in READ_IDIOMS:
+        return True
+    if words[1:2] in (["me"], ["us"]):
+        words = words[1:]
+    return len(words) > 2 and words[1] in ("a", "an") and words[2] in REPORT_NOUNS
+
+
+def head_verb(question: str) -> str:
+    """Returns the first word of the request once polite prefixes are removed."""
+    words = request_words(question)
+    return words[0] if words else ""
+
+
+class IntentClassifier:
+    """Multinomial naive Bayes over question words, labels "write" and "read"."""
+
+    def __init__(self, examples):
+        self.word_counts = {"write": Counter(), "read": Counter()}
+        self.doc_counts = Counter()
+        for question, label in examples:
+            self.doc_counts[label] += 1
+            self.word_counts[label].update(tokenize(question))
+        self.vocabulary = set(self.word_counts["write"]) | set(self.word_counts["read"])
+        self.totals = {label: sum(counts.values()) for label, counts in self.word_counts.items()}
+
+    @classmethod
+    def from_train_data(cls, train_data):
+        examples = [(example.question, "read" if example.sql_query else "write") for example in train_data]
+        examples += [(question, "read") for question in READ_EXAMPLES]
+        return cls(examples)
+
+    def write_probability(self, question: str) -> float:
+        total_docs = sum(self.doc_counts.values())
+        scores = {}
+        for label in ("write", "read"):
+            score = math.log((self.doc_counts[label] + 1) / (total_docs + 2))
+            for word in tokenize(question):
+                count = self.word_counts[label][word]
+                score += math.log((count + 1) / (self.totals[label] + len(self.vocabulary) + 1))
+            scores[label] = score
+        return 1 / (1 + math.exp(scores["read"] - scores["write"]))
+
+
+_classifier = None
+
+
+def get_classifier() -> IntentClassifier:
+    global _classifier
+    if _classifier is None:
+        from train_set import train_data
+        _classifier = IntentClassifier.from_train_data(train_data)
+    return _classifier
+
+
+def classify_intent(question: str, threshold: float = 0.9) -> str:
+    """Returns "write" or "read" without calling the LM.
+
+    The head verb decides when it is in one of the lexicons, and an ambiguous
+    head when an object follows it. A write verb used for a report ("Add up
+    ...", "Create a list of ...") and all other questions go to the classifier.
+    """
+    words = request_words(question)
+    verb = words[0] if words else ""
+    if verb in WRITE_VERBS and not asks_for_report(words):
+        return "write"
+    if verb in AMBIGUOUS_HEADS and len(words) > 1 and (words[1] in OBJECT_STARTERS or words[1].isdigit()):
+        return "write"
+    if verb in READ_VERBS:
+        return "read"
+    return "write" if get_classifier().write_probability(question) >= threshold else "read"
+
+
+def is_write_request(question: str) -> bool:
+    return classify_intent(question) == "write"
+
+
+# SQL validation
+
+SQL_COMMENTS = re.compile(r"--[^\n]*|/\*.*?(?:\*/|$)", re.DOTALL)
+SQL_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]")
+SQL_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+READ_STATEMENTS = {"SELECT", "WITH"}
+WRITE_KEYWORDS = {
+    "ALTER", "ANALYZE", "ATTACH", "BEGIN", "COMMIT", "CREATE", "DELETE", "DETACH", "DROP",
+    "INSERT", "PRAGMA", "REINDEX", "RELEASE", "REPLACE", "ROLLBACK", "SAVEPOINT",
+    "TRUNCATE", "UPDATE", "UPSERT", "VACUUM",
+}
+
+
+def validate_sql_query(query: str) -> bool:
+    """Validate that the query is a single SELECT statement and is not empty."""
+    if not query or not query.strip():
+        raise ValueError("Query cannot be empty")
+
+    # Comments and literals cannot hide or fake keywords once masked out
+    masked = SQL_QUOTED.sub("''", SQL_COMMENTS.sub(" ", query))
+    statements = [statement for statement in masked.split(";") if statement.strip()]
+    if len(statements) != 1:
+        raise ValueError("Only a single SQL statement can be executed at a time.")
+
+    statement = statements[0]
+    words = [(match.group().upper(), match.end()) for match in SQL_WORD.finditer(statement)]
+    # replace(x, y, z) is a read-only string function
+    writes = [word for word, end in words if word in WRITE_KEYWORDS
+              and not (word == "REPLACE" and statement[end:].lstrip().startswith("("))]
+    if not words or words[0][0] not in READ_STATEMENTS or writes:
+        raise ValueError(
+            "Only SELECT queries are allowed for safety. Please rephrase your question to get information instead of modifying data."
+        )
+    return True
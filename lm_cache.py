@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+import dspy
+
+
+## Persistent, content-addressed LM response cache.
+## CachedLM wraps any dspy.LM and can be passed to dspy.configure(lm=...).
+## Responses are stored in a local SQLite file keyed by a hash of the model,
+## messages and sampling parameters (API keys excluded). A bounded in-memory
+## LRU sits in front, and the file is trimmed to `max_bytes` by least recent use.
+##   record       serve hits, call the LM on a miss and store the response
+##   replay       serve hits, raise LMCacheMiss on a miss (offline tests)
+##   passthrough  always call the LM, store nothing
+##   lm = CachedLM(dspy.LM("groq/qwen-2.5-32b"), mode="record")
+## sql_agent.get_lm() wraps its LM this way when SQL_AGENT_LM_CACHE is set.
+
+CACHE_PATH = ".lm_cache/responses.db"
+MODES = ("record", "replay", "passthrough")
+# Request keys that do not change the response
+UNKEYED = {"cache", "cache_in_memory", "num_retries"}
+
+
+class LMCacheMiss(RuntimeError):
+    pass
+
+
+def request_key(request: dict) -> str:
+    keyed = {k: v for k, v in request.items() if k not in UNKEYED and not k.startswith("api_")}
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def response_to_dict(response) -> dict:
+    choices = []
+    for choice in response.choices:
+        message = getattr(choice, "message", None)
+        if message is not None:
+            entry = {"message": {"role": getattr(message, "role", "assistant"), "content": message.content}}
+        else:
+            entry = {"text": choice["text"]}
+        entry["finish_reason"] = getattr(choice, "finish_reason", None)
+        logprobs = getattr(choice, "logprobs", None)
+        if logprobs is not None:
+            entry["logprobs"] = logprobs if isinstance(logprobs, (dict, list)) else json.loads(json.dumps(logprobs, default=vars))
+        choices.append(entry)
+    usage = {k: v for k, v in dict(response.usage or {}).items() if isinstance(v, (int, float))}
+    return {"choices": choices, "usage": usage, "model": getattr(response, "model", None)}
+
+
+def response_from_dict(data: dict):
+    choices = []
+    for entry in data["choices"]:
+        if "message" in entry:
+            choices.append(SimpleNamespace(message=SimpleNamespace(**entry["message"]),
+                                           finish_reason=entry.get("finish_reason"), logprobs=entry.get("logprobs")))
+        else:
+            choices.append(entry)
+    return SimpleNamespace(choices=choices, usage=data["usage"], model=data["model"], _hidden_params={"cache_hit": True})
+
+
+class ResponseStore:
+    """SQLite-backed {key: response dict}, trimmed by least recent use."""
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = 256 * 1024 * 1024, memory_items: int = 4096):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)")
+        self._size = self.size_bytes()  # running total; recounted on eviction
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key], "memory"
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            value = json.loads(row[0])
+            self._remember(key, value)
+            return value, "disk"
+
+    def put(self, key: str, value: dict):
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._size += len(payload) - (previous[0] if previous else 0)
+            self._remember(key, value)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        # Trim to 90% so a full store does not evict on every insert
+        target = int(self.max_bytes * 0.9)
+        total = self.size_bytes()
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        for (key,) in evicted:
+            self._memory.pop(key, None)
+        self.evictions += len(evicted)
+        self._size = total
+
+    def size_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._memory.clear()
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedLM(dspy.LM):
+    """dspy.LM wrapper that records and replays responses through a ResponseStore."""
+
+    def __init__(self, lm, mode: str = "record", path: str = CACHE_PATH, max_bytes: int = 256 * 1024 * 1024,
+                 store: ResponseStore = None):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        super().__init__(model=lm.model, model_type=lm.model_type, cache=False, num_retries=lm.num_retries, **lm.kwargs)
+        self.lm = lm
+        self.mode = mode
+        self.store = store or ResponseStore(path, max_bytes=max_bytes)
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "calls": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        messages = messages or [{"role": "user", "content": prompt}]
+        key = request_key({"model": self.model, "messages": messages, **self.kwargs, **kwargs})
+
+        if self.mode != "passthrough":
+            cached, source = self.store.get(key)
+            if cached is not None:
+                self._count(f"{source}_hits")
+                return response_from_dict(cached)
+            self._count("misses")
+            if self.mode == "replay":
+                raise LMCacheMiss(f"No recorded response for request {key[:16]} ({self.model}) in {self.store.path}")
+
+        self._count("calls")
+        # The outer __call__ already ran the LM callbacks for this request
+        with dspy.context(callbacks=[]):
+            response = self.lm.forward(prompt=prompt, messages=messages, **kwargs)
+        if self.mode == "record":
+            self.store.put(key, response_to_dict(response))
+        return response
+
+    def copy(self, **kwargs):
+        # Shares the store: a deepcopy of the SQLite connection is not possible
+        return CachedLM(self.lm.copy(**kwargs), mode=self.mode, store=self.store)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats.update(
+            mode=self.mode,
+            hit_rate=hits / lookups if lookups else 0.0,
+            entries=len(self.store),
+            size_bytes=self.store.size_bytes(),
+            evictions=self.store.evictions,
+        )
+        return stats
+
+
+def cached_lm(lm_factory, mode: str = "record", path: str = CACHE_PATH):
+    """Picklable factory helper: CachedLM(lm_factory(), ...) for process pools."""
+    return CachedLM(lm_factory(), mode=mode, path=path)
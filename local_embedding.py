@@ -0,0 +1,50 @@
+import hashlib
+import re
+import time
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+
+## Deterministic, offline embedding function for benchmarks and tests.
+## Hashes word unigrams and character trigrams into a fixed-size vector, so it
+## needs no model download; `latency_ms` simulates the cost of a real model.
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+class HashingEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, dim: int = 256, latency_ms: float = 0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+
+    def _features(self, text: str):
+        words = TOKEN_PATTERN.findall(text.lower())
+        for word in words:
+            yield word
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def __call__(self, input):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for feature in self._features(text):
+                digest = hashlib.md5(feature.encode()).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "hashing"
+
+    def get_config(self):
+        return {"dim": self.dim, "latency_ms": self.latency_ms}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashingEmbeddingFunction(**config)
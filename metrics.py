@@ -0,0 +1,104 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dspy.utils.callback import BaseCallback
+
+
+## In-process stage timings and counters for the agent pipeline.
+## Pipeline code wraps its work in `stage("retrieval")`, `stage("sql")`, ...;
+## LM calls are timed through a DSPy callback. Timings only go somewhere while
+## a caller has opened `collect_stages()` on the current thread, so the
+## instrumentation costs one thread-local lookup otherwise. Counters are
+## process-wide.
+
+_local = threading.local()
+_counters = defaultdict(int)
+_counters_lock = threading.Lock()
+
+
+def increment(name: str, amount: int = 1):
+    with _counters_lock:
+        _counters[name] += amount
+
+
+def counters() -> dict:
+    with _counters_lock:
+        return dict(_counters)
+
+
+def reset_counters():
+    with _counters_lock:
+        _counters.clear()
+
+
+def percentile(samples: list, p: float) -> float:
+    """Nearest-rank percentile of `samples` (p in 0..100)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def latency_summary(samples: list) -> dict:
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+    }
+
+
+@contextmanager
+def collect_stages():
+    """Collects {stage: total seconds} for everything timed on this thread."""
+    previous = getattr(_local, "stages", None)
+    stages = defaultdict(float)
+    _local.stages = stages
+    try:
+        yield stages
+    finally:
+        _local.stages = previous
+
+
+def collecting() -> bool:
+    """True while a collect_stages() block is open on this thread."""
+    return getattr(_local, "stages", None) is not None
+
+
+def record_stage(name: str, seconds: float):
+    stages = getattr(_local, "stages", None)
+    if stages is not None:
+        stages[name] += seconds
+
+
+@contextmanager
+def stage(name: str):
+    if getattr(_local, "stages", None) is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+class StageTimingCallback(BaseCallback):
+    """Times every LM call as the "lm" stage.
+
+    dspy.context(callbacks=[StageTimingCallback()])
+    """
+
+    def __init__(self):
+        self._starts = {}
+
+    def on_lm_start(self, call_id, instance, inputs):
+        self._starts[call_id] = time.perf_counter()
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        start = self._starts.pop(call_id, None)
+        if start is not None:
+            record_stage("lm", time.perf_counter() - start)
@@ -0,0 +1,338 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+import dspy
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+## Versioned store for optimized program artifacts, and hot reload.
+## Each published program is an immutable version directory
+##   {root}/versions/{NNNN}-{sha256[:12]}/program.json  (dspy save format)
+##   {root}/versions/{NNNN}-{sha256[:12]}/manifest.json (sha256, size, notes)
+## written to a temp directory and renamed into place. {root}/CURRENT names the
+## live version and the one before it; activating or rolling back rewrites only
+## that pointer (temp file + rename). Loads verify the checksum.
+## On the serving side, LiveAgent forwards calls to the current SQLAgent.
+## ProgramWatcher polls the pointer. When it names a new version, the watcher
+## loads that version into a copy of the live agent on its own thread, warms it
+## up with canned questions and swaps it in. Requests already running finish
+## on the agent they started with. Recently loaded versions stay in memory, so
+## rolling back swaps without loading again.
+##   python program_store.py publish optimized_agent.json --notes "bootstrap, 8 demos"
+##   python program_store.py list | activate 0003-1a2b3c4d5e6f | rollback | verify
+
+STORE_PATH = ".programs"
+POINTER = "CURRENT"
+VERSION_PATTERN = re.compile(r"^(\d{4,})-([0-9a-f]{12})$")
+WARMUP_QUESTIONS = [
+    "How many transformers are in stock?",
+    "List all categories of electrical parts.",
+]
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ProgramStore:
+    def __init__(self, root: str = STORE_PATH):
+        self.root = root
+        self.versions_dir = os.path.join(root, "versions")
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    def versions(self) -> list:
+        """Version ids, oldest first."""
+        names = [name for name in os.listdir(self.versions_dir) if VERSION_PATTERN.match(name)]
+        return sorted(names, key=lambda name: int(VERSION_PATTERN.match(name).group(1)))
+
+    def manifest(self, version: str) -> dict:
+        try:
+            with open(os.path.join(self.versions_dir, version, "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ArtifactError(f"No version {version!r} in {self.root}")
+
+    def publish(self, program, notes: str = None, activate: bool = True) -> str:
+        """Stores `program` (a dspy.Module or a saved .json path) as a new version."""
+        if isinstance(program, str):
+            source = program
+            with open(program, "rb") as f:
+                data = f.read()
+            json.loads(data)  # refuse to publish a truncated or non-JSON file
+        else:
+            source = None
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "program.json")
+                program.save(path)
+                with open(path, "rb") as f:
+                    data = f.read()
+        digest = _sha256(data)
+        manifest = {"sha256": digest, "bytes": len(data), "created": time.time(), "source": source, "notes": notes,
+                    "dspy": dspy.__version__}
+
+        staging = tempfile.mkdtemp(prefix=".publish-", dir=self.versions_dir)
+        try:
+            _write_atomic(os.path.join(staging, "program.json"), data)
+            while True:
+                existing = self.versions()
+                number = int(VERSION_PATTERN.match(existing[-1]).group(1)) + 1 if existing else 1
+                version = f"{number:04d}-{digest[:12]}"
+                manifest["version"] = version
+                _write_atomic(os.path.join(staging, "manifest.json"), json.dumps(manifest, indent=2).encode())
+                try:
+                    # A concurrent publish that took this number makes the rename fail
+                    os.rename(staging, os.path.join(self.versions_dir, version))
+                    break
+                except OSError:
+                    if not os.path.isdir(os.path.join(self.versions_dir, version)):
+                        raise
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if activate:
+            self.activate(version)
+        return version
+
+    def read(self, version: str) -> dict:
+        """The program state of `version`, after checking its sha256."""
+        manifest = self.manifest(version)
+        with open(os.path.join(self.versions_dir, version, "program.json"), "rb") as f:
+            data = f.read()
+        if _sha256(data) != manifest["sha256"]:
+            raise ArtifactError(f"{version}: program.json does not match its sha256")
+        return json.loads(data)
+
+    def pointer(self) -> dict:
+        """{"version": live, "previous": the one before}; empty when nothing is active."""
+        try:
+            with open(os.path.join(self.root, POINTER)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def current(self) -> str:
+        return self.pointer().get("version")
+
+    def activate(self, version: str):
+        self.manifest(version)
+        pointer = self.pointer()
+        if pointer.get("version") == version:
+            return
+        _write_atomic(os.path.join(self.root, POINTER), json.dumps(
+            {"version": version, "previous": pointer.get("version"), "activated": time.time()}).encode())
+
+    def rollback(self) -> str:
+        """Points CURRENT back at the previous version and returns it."""
+        previous = self.pointer().get("previous")
+        if previous is None:
+            raise ArtifactError("No previous version to roll back to")
+        self.activate(previous)
+        return previous
+
+
+def load_version(store: ProgramStore, version: str, template):
+    """A copy of `template` (an SQLAgent) with the program state of `version`."""
+    agent = template.deepcopy()  # own predictors; retrieval backend and adapter stay shared
+    agent.load_state(store.read(version))
+    return agent
+
+
+def warm_up(agent, questions: list = WARMUP_QUESTIONS):
+    """Runs `questions` through `agent`; raises if any turn errors."""
+    for question in questions:
+        answer = agent(question=question).answer
+        if answer.startswith("Error"):
+            raise ArtifactError(f"warm-up question {question!r} failed: {answer}")
+
+
+class LiveAgent:
+    """Calls go to the current agent; swap() replaces it for the calls that follow."""
+
+    def __init__(self, agent, version: str = None):
+        self._agent = agent
+        self.version = version
+        self.swapped_at = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def agent(self):
+        return self._agent
+
+    def swap(self, agent, version: str):
+        with self._lock:
+            previous = self.version
+            # One reference assignment: running calls keep the agent they started with
+            self._agent, self.version, self.swapped_at = agent, version, time.time()
+        metrics.increment("program.swaps")
+        logger.info("Serving program %s (was %s)", version, previous)
+
+    def __call__(self, *args, **kwargs):
+        return self._agent(*args, **kwargs)
+
+    async def acall(self, *args, **kwargs):
+        agent = self._agent  # an in-flight call stays on this agent across a swap
+        return await agent.aforward(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # retrieve, batch, abatch, ... of the current agent
+        return getattr(self._agent, name)
+
+
+class ProgramWatcher:
+    """Background thread that keeps a LiveAgent on the store's CURRENT version."""
+
+    def __init__(self, store: ProgramStore, live: LiveAgent, interval: float = 2.0,
+                 warmup_questions: list = WARMUP_QUESTIONS, keep_loaded: int = 3, lm=None, template=None):
+        self.store = store
+        self.live = live
+        # Versions load into copies of this agent, not of whatever is live
+        self.template = template or live.agent
+        self.interval = interval
+        self.warmup_questions = warmup_questions
+        self.keep_loaded = keep_loaded
+        self.lm = lm
+        # version -> warmed agent, so a rollback swaps without loading
+        self.loaded = OrderedDict()
+        if live.version is not None:
+            self.loaded[live.version] = live.agent
+        self.failed = {}  # version -> error; not retried until CURRENT names it again
+        self._stop = threading.Event()
+        self._thread = None
+
+    def prepare(self, version: str):
+        agent = self.loaded.get(version)
+        if agent is None:
+            start = time.perf_counter()
+            agent = load_version(self.store, version, self.template)
+            with dspy.context(lm=self.lm) if self.lm is not None else nullcontext():
+                warm_up(agent, self.warmup_questions)
+            metrics.increment("program.loads")
+            logger.info("Loaded and warmed up %s in %.2fs", version, time.perf_counter() - start)
+        self.loaded[version] = agent
+        self.loaded.move_to_end(version)
+        while len(self.loaded) > self.keep_loaded:
+            self.loaded.popitem(last=False)
+        return agent
+
+    def check(self) -> bool:
+        """Swaps in CURRENT if it changed; returns True on a swap."""
+        version = self.store.current()
+        if version is None or version == self.live.version or version in self.failed:
+            return False
+        try:
+            agent = self.prepare(version)
+        except Exception as e:
+            self.failed[version] = f"{type(e).__name__}: {e}"
+            metrics.increment("program.load_errors")
+            logger.error("Keeping %s, could not load %s: %s", self.live.version, version, self.failed[version])
+            return False
+        self.live.swap(agent, version)
+        return True
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                # A failed version gets another try once CURRENT moves away from it
+                self.failed = {v: e for v, e in self.failed.items() if v == self.store.current()}
+                self.check()
+            except Exception:
+                logger.exception("Program watcher check failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="program-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self) -> dict:
+        return {"version": self.live.version, "swapped_at": self.live.swapped_at,
+                "loaded": list(self.loaded), "failed": self.failed}
+
+
+def serve_from_store(template, store: ProgramStore, interval: float = 2.0, warmup_questions: list = WARMUP_QUESTIONS,
+                     lm=None):
+    """(LiveAgent, started ProgramWatcher) serving the store's CURRENT version.
+
+    `template` is an SQLAgent built with the serving retrieval and settings.
+    CURRENT is loaded before this returns, so the first request is not cold.
+    """
+    live = LiveAgent(template)
+    watcher = ProgramWatcher(store, live, interval=interval, warmup_questions=warmup_questions, lm=lm)
+    if store.current() is not None and not watcher.check():
+        raise ArtifactError(f"Could not load {store.current()}: {watcher.failed.get(store.current())}")
+    return live, watcher.start()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default=STORE_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="add a saved program as a new version")
+    publish.add_argument("path")
+    publish.add_argument("--notes", default=None)
+    publish.add_argument("--no-activate", action="store_true", help="store it without pointing CURRENT at it")
+    commands.add_parser("list", help="versions, oldest first; * marks CURRENT")
+    activate = commands.add_parser("activate", help="point CURRENT at a version")
+    activate.add_argument("version")
+    commands.add_parser("rollback", help="point CURRENT back at the previous version")
+    commands.add_parser("verify", help="check every version's sha256")
+    args = parser.parse_args()
+
+    store = ProgramStore(args.store)
+    if args.command == "publish":
+        print(store.publish(args.path, notes=args.notes, activate=not args.no_activate))
+    elif args.command == "list":
+        current = store.current()
+        for version in store.versions():
+            manifest = store.manifest(version)
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest["created"]))
+            print(f"{'*' if version == current else ' '} {version}  {created}  {manifest['bytes']:>8}  "
+                  f"{manifest.get('notes') or ''}")
+    elif args.command == "activate":
+        store.activate(args.version)
+        print(args.version)
+    elif args.command == "rollback":
+        print(store.rollback())
+    else:
+        bad = 0
+        for version in store.versions():
+            try:
+                store.read(version)
+            except (ArtifactError, ValueError) as e:
+                bad += 1
+                print(f"{version}: {e}")
+        print(f"{len(store.versions()) - bad}/{len(store.versions())} versions ok")
+        raise SystemExit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
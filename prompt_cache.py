@@ -0,0 +1,153 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+import dspy
+from dspy.adapters.chat_adapter import History, prepare_instructions, try_expand_image_tags
+from conversation_memory import count_tokens
+import metrics
+from tracing import current_span
+
+
+## ChatAdapter that renders a predictor's static prompt prefix once.
+## The system message (instructions, field descriptions, output structure)
+## and every demo's user/assistant turns are rendered the first time a
+## (signature, demos) pair is seen and reused until the program's demos
+## change (e.g. after load_state). Only the inputs are formatted per call.
+## With `demo_token_budget`, the demos are ranked by word overlap with the
+## incoming question and the best ones that fit the budget are kept, in their
+## original order so the prefix stays stable for provider-side caching.
+## Each call's estimated prompt tokens go to the current tracing span
+## (prompt_tokens, demo_tokens, demos) and to metrics counters.
+##   dspy.configure(adapter=CachedChatAdapter(demo_token_budget=300))
+## With no budget the messages are identical to dspy.ChatAdapter's.
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+MAX_PROGRAMS = 256
+
+
+def _word_vector(text: str) -> Counter:
+    return Counter(WORD_PATTERN.findall(text.lower()))
+
+
+def _cosine(a: Counter, b: Counter, b_norm: float) -> float:
+    if not a or not b_norm:
+        return 0.0
+    dot = sum(count * b.get(word, 0) for word, count in a.items())
+    return dot / (math.sqrt(sum(count * count for count in a.values())) * b_norm)
+
+
+class RenderedPrefix:
+    """System message plus rendered demo turns for one (signature, demos) pair."""
+
+    __slots__ = ("demos", "system", "turns", "tokens", "vectors", "norms", "system_tokens", "selections")
+
+    def __init__(self, adapter, signature, demos: list):
+        self.demos = demos  # keeps the Example objects (and so their ids) alive
+        incomplete = [demo for demo in demos if not all(k in demo and demo[k] is not None for k in signature.fields)]
+        complete = [demo for demo in demos if demo not in incomplete]
+        incomplete = [
+            demo for demo in incomplete
+            if any(k in demo for k in signature.input_fields) and any(k in demo for k in signature.output_fields)
+        ]
+        self.system = try_expand_image_tags([{"role": "system", "content": prepare_instructions(signature)}])[0]
+        self.system_tokens = count_tokens(self.system["content"])
+        self.turns, self.tokens, self.vectors, self.norms = [], [], [], []
+        for demo in incomplete + complete:
+            flag = demo in incomplete
+            pair = try_expand_image_tags([
+                adapter.format_turn(signature, demo, role="user", incomplete=flag),
+                adapter.format_turn(signature, demo, role="assistant", incomplete=flag),
+            ])
+            self.turns.append(pair)
+            self.tokens.append(sum(count_tokens(message["content"]) for message in pair))
+            vector = _word_vector(" ".join(str(demo[k]) for k in signature.input_fields if k in demo))
+            self.vectors.append(vector)
+            self.norms.append(math.sqrt(sum(count * count for count in vector.values())))
+        self.selections = {}  # tuple of kept demo positions -> prefix messages
+
+    def prefix(self, keep: tuple) -> list:
+        messages = self.selections.get(keep)
+        if messages is None:
+            messages = [self.system] + [message for index in keep for message in self.turns[index]]
+            self.selections[keep] = messages
+        return messages
+
+
+class CachedChatAdapter(dspy.ChatAdapter):
+    def __init__(self, demo_token_budget: int = None, max_demos: int = None, callbacks=None):
+        super().__init__(callbacks)
+        self.demo_token_budget = demo_token_budget
+        self.max_demos = max_demos
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "renders": 0, "prompt_tokens": 0, "demo_tokens": 0, "demo_tokens_dropped": 0}
+
+    def __deepcopy__(self, memo):
+        return self  # the render cache is shared by program copies
+
+    def _rendered(self, signature, demos: list) -> RenderedPrefix:
+        key = (signature, tuple(map(id, demos)))
+        with self._lock:
+            rendered = self._prefixes.get(key)
+            if rendered is not None and all(a is b for a, b in zip(rendered.demos, demos)):
+                self._prefixes.move_to_end(key)
+                return rendered
+        rendered = RenderedPrefix(self, signature, list(demos))
+        with self._lock:
+            self._prefixes[key] = rendered
+            self.stats["renders"] += 1
+            while len(self._prefixes) > MAX_PROGRAMS:
+                self._prefixes.popitem(last=False)
+        return rendered
+
+    def select_demos(self, rendered: RenderedPrefix, inputs: dict) -> tuple:
+        """Positions of the demos to keep: most similar first within the budget, original order."""
+        count = len(rendered.turns)
+        if self.demo_token_budget is None and (self.max_demos is None or self.max_demos >= count):
+            return tuple(range(count))
+        query = _word_vector(str(inputs.get("question") or " ".join(str(v) for v in inputs.values())))
+        ranked = sorted(range(count), key=lambda i: -_cosine(query, rendered.vectors[i], rendered.norms[i]))
+        keep, used = [], 0
+        for index in ranked:
+            if self.max_demos is not None and len(keep) >= self.max_demos:
+                break
+            if self.demo_token_budget is not None and used + rendered.tokens[index] > self.demo_token_budget:
+                continue
+            keep.append(index)
+            used += rendered.tokens[index]
+        return tuple(sorted(keep))
+
+    def format(self, signature, demos, inputs):
+        rendered = self._rendered(signature, demos)
+        keep = self.select_demos(rendered, inputs)
+        messages = list(rendered.prefix(keep))
+
+        if any(field.annotation == History for field in signature.input_fields.values()):
+            dynamic = self.format_conversation_history(signature, inputs)
+        else:
+            dynamic = [self.format_turn(signature, inputs, role="user")]
+        messages.extend(try_expand_image_tags(dynamic))
+
+        demo_tokens = sum(rendered.tokens[index] for index in keep)
+        prompt_tokens = rendered.system_tokens + demo_tokens + sum(count_tokens(m["content"]) for m in dynamic)
+        self._record(prompt_tokens, demo_tokens, sum(rendered.tokens) - demo_tokens, len(keep))
+        return messages
+
+    def parse(self, signature, completion):
+        # dspy wraps parse() with callbacks again in every subclass; calling the
+        # inherited, already wrapped one fails whenever a callback is set
+        return dspy.ChatAdapter.parse.__wrapped__(self, signature, completion)
+
+    def _record(self, prompt_tokens: int, demo_tokens: int, dropped: int, kept: int):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["demo_tokens"] += demo_tokens
+            self.stats["demo_tokens_dropped"] += dropped
+        metrics.increment("prompt.calls")
+        metrics.increment("prompt.tokens", prompt_tokens)
+        metrics.increment("prompt.demo_tokens_dropped", dropped)
+        opened = current_span()
+        if opened is not None:
+            opened.set(prompt_tokens=prompt_tokens, demo_tokens=demo_tokens, demos=kept)
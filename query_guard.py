@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy.exc import OperationalError
+import metrics
+
+
+## Cost guard for generated SQL.
+## Before a query runs, `check_query_plan` reads SQLite's EXPLAIN QUERY PLAN,
+## estimates how many rows the nested loops will visit and rejects cartesian
+## products over large tables. While it runs, `time_budget` installs a progress
+## handler that interrupts it once the wall-clock budget is spent. Both raise
+## QueryTooExpensive, which execute_sql turns into a structured error the ReAct
+## loop can react to.
+
+
+class QueryBudget:
+    """Per-deployment limits; `from_env` reads SQL_AGENT_* overrides."""
+
+    def __init__(self, max_seconds: float = 2.0, max_plan_rows: int = 1_000_000,
+                 large_table_rows: int = 100_000, reject_full_scans: bool = False,
+                 progress_interval: int = 10_000):
+        self.max_seconds = max_seconds                # wall-clock limit per query
+        self.max_plan_rows = max_plan_rows            # estimated rows visited by nested loops
+        self.large_table_rows = large_table_rows      # full scans above this are flagged
+        self.reject_full_scans = reject_full_scans    # ... and rejected when set
+        self.progress_interval = progress_interval    # VM steps between deadline checks
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_seconds=float(os.getenv("SQL_AGENT_MAX_QUERY_SECONDS", 2.0)),
+            max_plan_rows=int(os.getenv("SQL_AGENT_MAX_PLAN_ROWS", 1_000_000)),
+            large_table_rows=int(os.getenv("SQL_AGENT_LARGE_TABLE_ROWS", 100_000)),
+            reject_full_scans=os.getenv("SQL_AGENT_REJECT_FULL_SCANS", "").lower() in ("1", "true", "yes"),
+        )
+
+
+DEFAULT_BUDGET = QueryBudget.from_env()
+
+
+class QueryTooExpensive(Exception):
+    def __init__(self, reason: str, message: str, details: list = None):
+        super().__init__(message)
+        self.reason = reason
+        self.details = details or []
+
+    def to_error(self) -> dict:
+        return {"error": str(self), "valid": False, "reason": self.reason, "details": self.details}
+
+
+# EXPLAIN QUERY PLAN names tables by alias, so aliases are resolved from the query
+TABLE_REFERENCE = re.compile(r"(?:\bFROM\b|\bJOIN\b|,)\s*([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+PLAN_STEP = re.compile(r"^(SCAN|SEARCH) (\w+)")
+NOT_ALIASES = {
+    "where", "on", "using", "join", "left", "right", "inner", "outer", "cross", "natural", "full",
+    "group", "order", "limit", "having", "union", "except", "intersect", "window", "as",
+}
+
+_row_estimates = {}
+_row_estimates_lock = threading.Lock()
+ROW_ESTIMATE_TTL = 60.0
+
+
+def table_aliases(query: str, tables: set) -> dict:
+    aliases = {table: table for table in tables}
+    for match in TABLE_REFERENCE.finditer(query):
+        table, alias = match.group(1).lower(), (match.group(2) or "").lower()
+        if table in tables and alias and alias not in NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def estimate_table_rows(conn, table: str, cache_key=None) -> int:
+    """Approximate row count: MAX(rowid) is an index lookup, COUNT(*) is a scan."""
+    key = (cache_key, table)
+    now = time.monotonic()
+    with _row_estimates_lock:
+        cached = _row_estimates.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+    try:
+        rows = conn.exec_driver_sql(f'SELECT MAX(rowid) FROM "{table}"').scalar() or 0
+    except OperationalError:  # WITHOUT ROWID table
+        rows = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar() or 0
+    with _row_estimates_lock:
+        _row_estimates[key] = (now + ROW_ESTIMATE_TTL, rows)
+    return rows
+
+
+def check_query_plan(conn, query: str, budget: QueryBudget = DEFAULT_BUDGET):
+    """Raises QueryTooExpensive when the plan is a large cartesian product or scan.
+
+    Returns the list of flagged (but allowed) steps.
+    """
+    tables = {name.lower() for (name,) in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )}
+    aliases = table_aliases(query, tables)
+    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {query}").fetchall()
+
+    # Steps sharing a parent run as nested loops: their row counts multiply
+    loops, flagged = {}, []
+    for step_id, parent, _, detail in plan:
+        match = PLAN_STEP.match(detail)
+        if not match or match.group(2).upper() == "CONSTANT":
+            continue
+        table = aliases.get(match.group(2).lower())
+        if match.group(1) == "SEARCH" or table is None:
+            continue
+        rows = estimate_table_rows(conn, table, cache_key=str(conn.engine.url))
+        loops.setdefault(parent, []).append((table, rows))
+        if rows > budget.large_table_rows:
+            flagged.append(f"full scan of {table} (~{rows} rows)")
+
+    estimated_rows = 0
+    for scans in loops.values():
+        loop_rows = 1
+        for _, rows in scans:
+            loop_rows *= max(rows, 1)
+        estimated_rows += loop_rows
+        if len(scans) > 1 and loop_rows > budget.max_plan_rows:
+            metrics.increment("sql.rejected.cartesian")
+            product = " x ".join(f"{table} (~{rows})" for table, rows in scans)
+            raise QueryTooExpensive(
+                "cartesian_product",
+                f"Query rejected as too expensive: it joins {product} without usable join conditions "
+                f"(~{loop_rows} row combinations). Add join conditions or filters.",
+                [product],
+            )
+
+    if flagged:
+        metrics.increment("sql.flagged.full_scan", len(flagged))
+        if budget.reject_full_scans:
+            metrics.increment("sql.rejected.full_scan")
+            raise QueryTooExpensive(
+                "full_scan",
+                f"Query rejected as too expensive: {'; '.join(flagged)}. Filter on an indexed column or add a LIMIT.",
+                flagged,
+            )
+    if estimated_rows > budget.max_plan_rows:
+        metrics.increment("sql.rejected.plan_rows")
+        raise QueryTooExpensive(
+            "plan_rows",
+            f"Query rejected as too expensive: it would visit ~{estimated_rows} rows. Add filters or a LIMIT.",
+        )
+    return flagged
+
+
+@contextmanager
+def time_budget(conn, budget: QueryBudget = DEFAULT_BUDGET):
+    """Interrupts statements on `conn` that run past budget.max_seconds."""
+    dbapi_connection = conn.connection.driver_connection
+    deadline = time.monotonic() + budget.max_seconds
+    expired = []
+
+    def handler():
+        if time.monotonic() > deadline:
+            expired.append(True)
+            return 1
+        return 0
+
+    dbapi_connection.set_progress_handler(handler, budget.progress_interval)
+    try:
+        yield
+    except OperationalError as e:
+        if expired and "interrupted" in str(e):
+            metrics.increment("sql.timeouts")
+            raise QueryTooExpensive(
+                "timeout",
+                f"Query stopped after exceeding its {budget.max_seconds}s time budget. "
+                "Add filters, join conditions or a LIMIT.",
+            ) from e
+        raise
+    finally:
+        dbapi_connection.set_progress_handler(None, 0)
@@ -0,0 +1,90 @@
+import json
+import time
+from intent_guard import classify_intent
+from train_set import train_data
+
+
+## Report: how many LM calls the local write-intent guard saves.
+## A refused question used to cost at least two LM calls (one ReAct step that
+## picks `finish`, then the extract step) plus one embedding and two Chroma
+## queries for schema retrieval. Accuracy is scored on held-out questions that
+## appear neither in train_data nor in intent_guard.READ_EXAMPLES, including
+## ones that start with words that are both a verb and a noun here ("order",
+## "set", "change", ...) and write verbs used for a report ("Add up ...",
+## "Create a list of ...").
+##   python report_intent_guard.py
+
+HELD_OUT_READS = [
+    "Order history of customer Bob Smith",
+    "Order count for customer Jane Smith?",
+    "Set of categories with more than 5 products",
+    "Purchase totals per month",
+    "Change in revenue between March and April?",
+    "Orders shipped to California?",
+    "Place of residence of customer Bob?",
+    "Reset date of the inventory counts?",
+    "Ordered quantity of transformers last month?",
+    "How many LED bulbs are left?",
+    "Which supplier provides copper wire?",
+    "Average price of products in the Lighting category",
+    "Add up the prices of all bulbs",
+    "Create a list of all suppliers",
+    "Update me on the stock of transformers",
+    "Drop me a list of products",
+    "Create a report of orders per customer",
+]
+HELD_OUT_WRITES = [
+    "Order 10 LED bulbs for Alice Cooper",
+    "Set the price of the 10W LED bulb to 5 dollars",
+    "Place an order for two transformers",
+    "Change the email of John Doe to john@example.com",
+    "Please delete the supplier ElectroSupply Inc.",
+    "Increase the stock of transformers by 10",
+    "Register a new customer named Carol",
+    "Reset all stock quantities to zero",
+    "I would like to order a Mini Transformer",
+    "Purchase 3 copper wires",
+    "Could you remove customer Bob Smith?",
+    "Insert a new category called Tools",
+]
+MIN_LM_CALLS_PER_REACT_RUN = 2
+RETRIEVAL_CALLS_PER_RUN = 3
+
+
+def load_demo_questions(path: str = "optimized_agent.json"):
+    with open(path) as f:
+        state = json.load(f)
+    questions = set()
+    for name, predictor in state.items():
+        for demo in predictor.get("demos", []) if isinstance(predictor, dict) else []:
+            questions.add(demo["question"])
+    return sorted(questions)
+
+
+def report(label: str, questions: list, expected: str = None):
+    start = time.perf_counter()
+    intents = [classify_intent(question) for question in questions]
+    elapsed_us = (time.perf_counter() - start) / max(len(questions), 1) * 1e6
+    refused = intents.count("write")
+    print(f"{label}: {refused}/{len(questions)} refused locally ({elapsed_us:.0f}us per question)")
+    if expected:
+        for question, intent in zip(questions, intents):
+            if intent != expected:
+                print(f"  misclassified as {intent}: {question}")
+    return refused
+
+
+def main():
+    refused = report("train_set.train_data", [example.question for example in train_data])
+    report("optimized_agent.json demos", load_demo_questions(), expected="write")
+    refused_reads = report("held-out read questions", HELD_OUT_READS, expected="read")
+    refused_writes = report("held-out write requests", HELD_OUT_WRITES, expected="write")
+    correct = len(HELD_OUT_READS) - refused_reads + refused_writes
+    print(f"held-out accuracy: {correct}/{len(HELD_OUT_READS) + len(HELD_OUT_WRITES)}")
+
+    print(f"LM calls saved on train_data: >= {refused * MIN_LM_CALLS_PER_REACT_RUN}")
+    print(f"embedding/Chroma calls saved on train_data: {refused * RETRIEVAL_CALLS_PER_RUN}")
+
+
+if __name__ == "__main__":
+    main()
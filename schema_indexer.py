@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import json
+import time
+
+
+## Schema indexing pipeline for the `sql_schema` Chroma collection.
+## Chunks are generated from SQLAlchemy MetaData, reflected from the live
+## database or taken from db_setup.metadata, so the index follows the schema:
+##   {table}_table                       "table: {table}"
+##   {table}_columns                     "Columns: a, b, c" (+ "table"/"columns" metadata)
+##   {table}_{referred}_relationship     "Relationship: t.col → referred.col"
+## Every chunk carries a content hash of its text, metadata and the embedding
+## function. index_schema() reads only ids and hashes from the collection,
+## embeds the new or changed chunks in one batched call, upserts them in
+## batches and deletes chunks whose table or key no longer exists; an
+## unchanged schema costs one metadata read and no embedding. Callers that
+## serve retrieval from the same process refresh schema_retrieval's column
+## map afterwards (see chroma_setup.add_schema_chunks).
+##   python schema_indexer.py --source db --path ./chroma_db
+##   python schema_indexer.py --source metadata --dry-run
+
+# Embedding function settings that do not change the vectors
+UNHASHED_CONFIG = {"latency_ms", "api_key", "api_key_env_var"}
+
+
+def reflect_schema(url: str = None):
+    """MetaData reflected from the database at `url` (default: electrical_parts.db)."""
+    from sqlalchemy import MetaData
+    import sql_engine
+    metadata = MetaData()
+    metadata.reflect(bind=sql_engine.get_engine(url))
+    return metadata
+
+
+def declared_schema():
+    from db_setup import metadata
+    return metadata
+
+
+def schema_chunks(metadata) -> list:
+    """Table, column and relationship chunks for every table in `metadata`."""
+    chunks = []
+    relationships = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        columns = ", ".join(column.name for column in table.columns)
+        chunks.append({"id": f"{table.name}_table", "text": f"table: {table.name}",
+                       "metadata": {"type": "table", "table_name": table.name}})
+        chunks.append({"id": f"{table.name}_columns", "text": f"Columns: {columns}",
+                       "metadata": {"type": "column", "table": table.name, "columns": columns}})
+        for fk in sorted(table.foreign_keys, key=lambda fk: (fk.parent.name, fk.target_fullname)):
+            relationships.append((table.name, fk.parent.name, fk.column.table.name, fk.column.name))
+
+    seen = set()
+    for table, column, referred, referred_column in relationships:
+        chunk_id = f"{table}_{referred}_relationship"
+        if chunk_id in seen:
+            # A second key to the same table
+            chunk_id = f"{table}_{column}_{referred}_relationship"
+        seen.add(chunk_id)
+        chunks.append({
+            "id": chunk_id,
+            "text": f"Relationship: {table}.{column} → {referred}.{referred_column}",
+            "metadata": {"type": "relationship", "table1": table, "table2": referred, "relationship_type": "foreign_key"},
+        })
+    return chunks
+
+
+def embedding_key(embedding_function) -> str:
+    if embedding_function is None:
+        return "collection-default"
+    try:
+        name = embedding_function.name()
+        config = {k: v for k, v in embedding_function.get_config().items() if k not in UNHASHED_CONFIG}
+    except Exception:
+        name, config = type(embedding_function).__qualname__, {}
+    return f"{name}:{json.dumps(config, sort_keys=True, default=str)}"
+
+
+def content_hash(chunk: dict, embedding: str) -> str:
+    payload = json.dumps([chunk["text"], chunk["metadata"], embedding], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _batches(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def index_schema(collection, chunks: list, batch_size: int = None, dry_run: bool = False) -> dict:
+    """Upserts changed chunks and deletes stale ones; returns what changed."""
+    start = time.perf_counter()
+    embedding_function = getattr(collection, "_embedding_function", None)
+    key = embedding_key(embedding_function)
+    chunks = [{**chunk, "metadata": {**chunk["metadata"], "content_hash": content_hash(chunk, key)}} for chunk in chunks]
+
+    existing = collection.get(include=["metadatas"])
+    stored = {chunk_id: (metadata or {}).get("content_hash") for chunk_id, metadata in zip(existing["ids"], existing["metadatas"])}
+    wanted = {chunk["id"] for chunk in chunks}
+    changed = [chunk for chunk in chunks if stored.get(chunk["id"]) != chunk["metadata"]["content_hash"]]
+    stale = sorted(set(stored) - wanted)
+    stats = {
+        "added": sum(chunk["id"] not in stored for chunk in changed),
+        "updated": sum(chunk["id"] in stored for chunk in changed),
+        "deleted": len(stale),
+        "unchanged": len(chunks) - len(changed),
+        "embedded": 0,
+    }
+    if dry_run or not (changed or stale):
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+
+    batch_size = batch_size or collection._client.get_max_batch_size()
+    if changed:
+        documents = [chunk["text"] for chunk in changed]
+        # One embedding pass for everything that changed, then batched writes
+        embeddings = list(embedding_function(documents)) if embedding_function is not None else None
+        stats["embedded"] = len(documents)
+        vectors = _batches(embeddings, batch_size) if embeddings is not None else None
+        for batch in _batches(changed, batch_size):
+            collection.upsert(
+                ids=[chunk["id"] for chunk in batch],
+                documents=[chunk["text"] for chunk in batch],
+                metadatas=[chunk["metadata"] for chunk in batch],
+                embeddings=next(vectors) if vectors is not None else None,
+            )
+    for batch in _batches(stale, batch_size):
+        collection.delete(ids=batch)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=["db", "metadata"], default="db",
+                        help="reflect the live database or use db_setup.metadata")
+    parser.add_argument("--url", default=None, help="database URL for --source db")
+    parser.add_argument("--path", default=None, help="Chroma directory (default: sql_agent.CHROMA_PATH)")
+    parser.add_argument("--collection", default=None)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change")
+    args = parser.parse_args()
+
+    import chromadb
+    from sql_agent import CHROMA_PATH, SCHEMA_COLLECTION
+    metadata = reflect_schema(args.url) if args.source == "db" else declared_schema()
+    client = chromadb.PersistentClient(path=args.path or CHROMA_PATH)
+    collection = client.get_or_create_collection(name=args.collection or SCHEMA_COLLECTION)
+    stats = index_schema(collection, schema_chunks(metadata), dry_run=args.dry_run)
+    print(json.dumps({"tables": len(metadata.tables), **stats}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import dspy
+from tracing import span
+
+
+## Schema retrieval over the chunks built by chroma_setup.py / schema_indexer.py.
+## The question is embedded once and the vector is reused for the table and
+## relationship searches. Columns are looked up from an in-memory
+## table -> columns map instead of a third vector search.
+## Searches go through a backend:
+##   ChromaBackend            a Chroma collection (default: sql_agent.get_collection());
+##                            the two searches run concurrently on a shared pool
+##   vector_index.VectorIndex NumPy matrix loaded from a memory-mapped snapshot;
+##                            searches take microseconds and run inline
+## A backend provides embed(text), query(embedding, chunk_type, n_results) ->
+## [metadata], column_map() and `parallel_queries`.
+
+# Shared by every RetrieveSchema instance (modules get deep-copied by optimizers)
+_query_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="schema-query")
+_column_maps = {}
+_column_maps_lock = threading.Lock()
+
+
+def embed_query(collection, user_query: str, embedding_function=None):
+    """Embeds the question with the collection's embedding function."""
+    embedding_function = embedding_function or collection._embedding_function
+    return embedding_function([user_query])[0]
+
+
+def load_column_map(collection, refresh: bool = False) -> dict:
+    """Returns {table: columns} for every column chunk in the collection."""
+    key = id(collection)
+    with _column_maps_lock:
+        if refresh or key not in _column_maps:
+            results = collection.get(where={"type": "column"}, include=["metadatas"])
+            _column_maps[key] = {doc["table"]: doc["columns"] for doc in results["metadatas"]}
+        return _column_maps[key]
+
+
+class ChromaBackend:
+    """Retrieval backend over a Chroma collection."""
+
+    parallel_queries = True
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __deepcopy__(self, memo):
+        return self  # shares the client, like the collection itself
+
+    def embed(self, user_query: str):
+        return embed_query(self.collection, user_query)
+
+    def query(self, query_embedding, chunk_type: str, n_results: int) -> list:
+        results = self.collection.query(
+            query_embeddings=[query_embedding], n_results=n_results,
+            where={"type": chunk_type}, include=["metadatas"],
+        )
+        return results.get("metadatas", [[]])[0]
+
+    def column_map(self) -> dict:
+        return load_column_map(self.collection)
+
+
+class RetrieveSchema(dspy.Module):
+    def __init__(self, collection=None, embedding_function=None, n_results: int = 3, backend=None):
+        super().__init__()
+        self.collection = collection
+        self.embedding_function = embedding_function
+        self.n_results = n_results
+        self.backend = backend
+
+    def get_backend(self):
+        if self.backend is not None:
+            return self.backend
+        if self.collection is not None:
+            self.backend = ChromaBackend(self.collection)
+            return self.backend
+        from sql_agent import get_schema_backend
+        return get_schema_backend()
+
+    def _embed(self, backend, user_query: str):
+        with span("retrieval.embed"):
+            if self.embedding_function is not None:
+                return self.embedding_function([user_query])[0]
+            return backend.embed(user_query)
+
+    def _query(self, backend, query_embedding, chunk_type: str):
+        with span("retrieval.query", type=chunk_type):
+            return backend.query(query_embedding, chunk_type, self.n_results)
+
+    def _build_context(self, backend, tables_found, relationships_found):
+        column_map = backend.column_map()
+        tables = [doc["table_name"] for doc in tables_found]
+        columns = [(table, column_map[table]) for table in tables if table in column_map][: self.n_results]
+        relationships = [(doc["table1"], doc["table2"], doc["relationship_type"]) for doc in relationships_found]
+        return {"tables": tables, "columns": columns, "relationships": relationships}
+
+    def forward(self, user_query: str):
+        """Retrieves relevant schema details from the backend."""
+        with span("retrieval", stage="retrieval"):
+            backend = self.get_backend()
+            query_embedding = self._embed(backend, user_query)
+            if not backend.parallel_queries:
+                return self._build_context(backend, self._query(backend, query_embedding, "table"),
+                                           self._query(backend, query_embedding, "relationship"))
+
+            # copy_context() carries the current span into the pool threads
+            table_future = _query_pool.submit(
+                contextvars.copy_context().run, self._query, backend, query_embedding, "table"
+            )
+            relationship_future = _query_pool.submit(
+                contextvars.copy_context().run, self._query, backend, query_embedding, "relationship"
+            )
+            return self._build_context(backend, table_future.result(), relationship_future.result())
+
+    async def aforward(self, user_query: str):
+        """Async variant of forward; backend calls run on the shared query pool."""
+        loop = asyncio.get_running_loop()
+        with span("retrieval"):
+            backend = self.get_backend()
+            query_embedding = await loop.run_in_executor(
+                _query_pool, contextvars.copy_context().run, self._embed, backend, user_query
+            )
+            if not backend.parallel_queries:
+                return self._build_context(backend, self._query(backend, query_embedding, "table"),
+                                           self._query(backend, query_embedding, "relationship"))
+            tables_found, relationships_found = await asyncio.gather(
+                loop.run_in_executor(_query_pool, contextvars.copy_context().run,
+                                     self._query, backend, query_embedding, "table"),
+                loop.run_in_executor(_query_pool, contextvars.copy_context().run,
+                                     self._query, backend, query_embedding, "relationship"),
+            )
+            return self._build_context(backend, tables_found, relationships_found)
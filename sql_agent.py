@@ -1,70 +1,135 @@
-import chromadb
+import argparse
+import asyncio
+import threading
+from contextlib import nullcontext
 import dspy
-from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 from train_set import train_data
+import sql_engine
+from schema_retrieval import RetrieveSchema
+from intent_guard import REFUSAL_MESSAGE, is_write_request, validate_sql_query
+from query_guard import DEFAULT_BUDGET
+from tracing import span
+import metrics
+from bootstrap_compile import CHECKPOINT_DIR, ResumableBootstrapFewShot
+from execution_metric import ExecutionMetric
 import os
 
 load_dotenv()
 
-# Initialize ChromaDB client
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-db_collection = chroma_client.get_collection(name="sql_schema")
+## Importing this module has no side effects: the Chroma client, the LM and the
+## SQL engine are created on first use, and the compile/demo steps run only
+## from the command line. SQL_AGENT_SCHEMA_INDEX=<snapshot> retrieves schema
+## from a vector_index.VectorIndex instead of Chroma. Prompts are rendered by
+## prompt_cache.CachedChatAdapter; SQL_AGENT_DEMO_TOKEN_BUDGET=<tokens> keeps
+## only the demos closest to the question that fit the budget.
+##   python sql_agent.py compile --output optimized_agent.json [--store .programs]
+##   python sql_agent.py demo "How many transformers are in stock?"
 
-# Create SQLite persistent database connection
+CHROMA_PATH = "./chroma_db"
+SCHEMA_COLLECTION = "sql_schema"
+DEFAULT_MODEL = "groq/qwen-2.5-32b"
+PROGRAM_PATH = "optimized_agent.json"
+
+_clients = {}
+_clients_lock = threading.RLock()
+
+
+def _get_or_create(key, factory):
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def get_chroma_client(path: str = CHROMA_PATH):
+    import chromadb  # ~1s to import, so only paid once retrieval is needed
+    return _get_or_create(("chroma", path), lambda: chromadb.PersistentClient(path=path))
+
+
+def get_collection(name: str = SCHEMA_COLLECTION, path: str = CHROMA_PATH):
+    return _get_or_create(("collection", path, name), lambda: get_chroma_client(path).get_collection(name=name))
+
+
+def get_schema_backend():
+    """RetrieveSchema's default backend: the VectorIndex snapshot named by
+    SQL_AGENT_SCHEMA_INDEX if set, the Chroma collection otherwise."""
+    def create():
+        path = os.getenv("SQL_AGENT_SCHEMA_INDEX")
+        if path:
+            from vector_index import VectorIndex
+            return VectorIndex.load(path)
+        from schema_retrieval import ChromaBackend
+        return ChromaBackend(get_collection())
+    return _get_or_create("schema_backend", create)
+
+
+def get_lm():
+    def create():
+        lm = dspy.LM(DEFAULT_MODEL, api_key=os.getenv('GROQ_API_KEY'))
+        # record / replay / passthrough through the on-disk response cache
+        mode = os.getenv("SQL_AGENT_LM_CACHE")
+        if mode:
+            from lm_cache import CACHE_PATH, CachedLM
+            lm = CachedLM(lm, mode=mode, path=os.getenv("SQL_AGENT_LM_CACHE_PATH", CACHE_PATH))
+        return lm
+    return _get_or_create("lm", create)
+
+
+def default_lm():
+    """Context that falls back to get_lm() when the caller has not configured an LM."""
+    return nullcontext() if dspy.settings.lm is not None else dspy.context(lm=get_lm())
+
+
+def get_adapter():
+    """Shared CachedChatAdapter; SQL_AGENT_DEMO_TOKEN_BUDGET trims demos per call."""
+    def create():
+        from prompt_cache import CachedChatAdapter
+        budget = os.getenv("SQL_AGENT_DEMO_TOKEN_BUDGET")
+        return CachedChatAdapter(demo_token_budget=int(budget) if budget else None)
+    return _get_or_create("adapter", create)
+
+
+def default_adapter(adapter=None):
+    """Context that renders prompts with `adapter`, else the configured one, else get_adapter()."""
+    if adapter is None and dspy.settings.adapter is not None:
+        return nullcontext()
+    return dspy.context(adapter=adapter or get_adapter())
+
+
+def __getattr__(name):
+    # Old module-level names, now created on first access
+    if name == "chroma_client":
+        return get_chroma_client()
+    if name == "db_collection":
+        return get_collection()
+    if name == "lm":
+        return get_lm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Checks out a connection from the shared, read-only SQLite pool
 def create_db_connection():
-    engine = create_engine("sqlite:///electrical_parts.db", echo=True)
-    return engine.connect()
-
-def validate_sql_query(query: str) -> bool:
-    """Validate that the query is a SELECT statement and is not empty."""
-    if not query or not query.strip():
-        raise ValueError("Query cannot be empty")
-    if not query.strip().upper().startswith("SELECT"):
-        raise ValueError(
-            "Only SELECT queries are allowed for safety. Please rephrase your question to get information instead of modifying data."
-        )
-    return True
+    return sql_engine.get_engine().connect()
 
 def execute_sql(query: str):
     """Executes the SQL query in SQLite and fetches results."""
+    # Streams the result and hands the LM a size-bounded ResultSummary
+    # (columns, first rows, row count, aggregates); summary.iter_rows()
+    # gives callers every row. Plans and run time are checked against the
+    # deployment's query budget.
     try:
-        # validate_sql_query(query)
-        with create_db_connection() as conn:
-            result = conn.execute(text(query)).fetchall()
-        return result
-    except Exception as e:
+        validate_sql_query(query)
+    except ValueError as e:
         return {"error": str(e), "valid": False}
+    return sql_engine.summarize_sql(query, budget=DEFAULT_BUDGET)
 
-# DSPy Retrieve Schema Module
-class RetrieveSchema(dspy.Module):
-    def forward(self, user_query: str):
-        """Retrieves relevant schema details from ChromaDB."""
-        table_results = db_collection.query(
-            query_texts=[user_query], n_results=3, where={"type": "table"}
-        )
-        tables = [doc["table_name"] for doc in table_results.get("metadatas", [])[0]]
-
-        column_results = db_collection.query(
-            query_texts=[user_query],
-            n_results=3,
-            where={"$and": [{"type": {"$eq": "column"}}, {"table": {"$in": tables}}]},
-        )
-        columns = [
-            (doc["table"], doc["columns"])
-            for doc in column_results.get("metadatas", [])[0]
-        ]
-
-        relationship_results = db_collection.query(
-            query_texts=[user_query], n_results=3, where={"type": "relationship"}
-        )
-        relationships = [
-            (doc["table1"], doc["table2"], doc["relationship_type"])
-            for doc in relationship_results.get("metadatas", [])[0]
-        ]
-
-        # pprint({"tables": tables, "columns": columns, "relationships": relationships})
-        return {"tables": tables, "columns": columns, "relationships": relationships}
+async def aexecute_sql(query: str):
+    """Async execute_sql; the query runs on the engine's worker threads."""
+    try:
+        validate_sql_query(query)
+    except ValueError as e:
+        return {"error": str(e), "valid": False}
+    return await sql_engine.asummarize_sql(query, budget=DEFAULT_BUDGET)
 
 # DSPy Structured Output for SQL Generation
 class GenerateSQL(dspy.Signature):
@@ -80,27 +145,137 @@ class GenerateSQL(dspy.Signature):
     answer: str = dspy.OutputField()
 
 
-lm = dspy.LM('groq/qwen-2.5-32b', api_key=os.getenv('GROQ_API_KEY'))
-dspy.configure(lm=lm)
+class WriteSQL(dspy.Signature):
+    """Write one SQLite SELECT statement that answers the user's question about the database.
+    For requests to add, change, delete or order anything, return an empty sql_query."""
+
+    question: str = dspy.InputField()
+    context: str = dspy.InputField()
+    history: list[str] = dspy.InputField(default=[])
+    sql_query: str = dspy.OutputField(desc="A single SELECT statement, empty if operation not allowed")
+
+
+class FormatAnswer(dspy.Signature):
+    """Answer the user's question from the query result in a meaningful polite sentence, not just [result]."""
+
+    question: str = dspy.InputField()
+    sql_query: str = dspy.InputField()
+    result: str = dspy.InputField()
+    answer: str = dspy.OutputField()
+
+
+def build_react():
+    """A ReAct program with its own predictors, so loading demos into one agent leaves the others alone."""
+    return dspy.ReAct(GenerateSQL, tools=[execute_sql])
+
 
+# Define your ReAct module (kept for callers that import it; SQLAgent builds its own)
+sql_query_generator = build_react()
+
+
+class OneShotSQL(dspy.Module):
+    """One LM call for the SQL, a local execute_sql, then a template or a small
+    formatting call depending on the result size.
+
+    Returns None when the caller should fall back to ReAct: the SQL is invalid,
+    fails, or returns no rows.
+    """
+
+    def __init__(self, template_max_rows: int = 5):
+        super().__init__()
+        self.write = dspy.Predict(WriteSQL)
+        self.format = dspy.Predict(FormatAnswer)
+        self.template_max_rows = template_max_rows
 
-# Define your ReAct module
-sql_query_generator = dspy.ReAct(GenerateSQL, tools=[execute_sql])
+    def forward(self, question, context, history):
+        sql_query = self.write(question=question, context=context, history=history).sql_query.strip()
+        if not sql_query:
+            metrics.increment("agent.one_shot.refused")
+            return dspy.Prediction(answer=REFUSAL_MESSAGE, sql_query="")
+
+        result = execute_sql(sql_query)
+        if isinstance(result, dict):
+            metrics.increment("agent.one_shot.fallback.error")
+            return None
+        if not result.row_count:
+            # An empty result often means a wrong filter value; let ReAct look
+            metrics.increment("agent.one_shot.fallback.empty")
+            return None
+
+        answer = self.template_answer(result)
+        if answer is None:
+            answer = self.format(question=question, sql_query=sql_query, result=str(result)).answer
+            metrics.increment("agent.one_shot.formatted")
+        else:
+            metrics.increment("agent.one_shot.template")
+        return dspy.Prediction(answer=answer, sql_query=sql_query)
+
+    def template_answer(self, result):
+        """A sentence for single-column results of up to template_max_rows rows, else None."""
+        if len(result.columns) != 1 or result.truncated or result.row_count > self.template_max_rows:
+            return None
+        values = [str(row[0]) for row in result.rows]
+        if len(values) == 1:
+            return f"The answer is {values[0]}."
+        return f"There are {len(values)} results: {', '.join(values[:-1])} and {values[-1]}."
 
 # Define a wrapper module for optimization
 class SQLAgent(dspy.Module):
-    def __init__(self):
+    def __init__(self, guard=True, retrieve=None, strategy="react", adapter=None):
         super().__init__()
-        self.retrieve = RetrieveSchema()
-        self.react = sql_query_generator
+        self.retrieve = retrieve or RetrieveSchema()
+        self.react = build_react()
+        self.guard = guard
+        # "one_shot" tries OneShotSQL first and falls back to ReAct
+        self.strategy = strategy
+        self.one_shot = OneShotSQL() if strategy == "one_shot" else None
+        # Prompt rendering; None uses the shared CachedChatAdapter
+        self.adapter = adapter
         
     def forward(self, question, context=None, history=None):
-        history = history or []
-        if context is None:
-            context = self.retrieve(question)
-            
-        response = self.react(question=question, context=context, history=history)
-        
+        with span("agent") as agent_span:
+            # Write/modify requests are refused locally, before any Chroma or LM call
+            if self.guard and is_write_request(question):
+                agent_span.set(refused=True)
+                return dspy.Prediction(answer=REFUSAL_MESSAGE, sql_query="")
+
+            history = history or []
+            if context is None:
+                context = self.retrieve(question)
+
+            response = self._generate(question=question, context=context, history=history)
+            return self._to_prediction(response)
+
+    async def aforward(self, question, context=None, history=None):
+        with span("agent") as agent_span:
+            if self.guard and is_write_request(question):
+                agent_span.set(refused=True)
+                return dspy.Prediction(answer=REFUSAL_MESSAGE, sql_query="")
+
+            history = history or []
+            if context is None:
+                context = await self.retrieve.aforward(question)
+
+            # dspy 2.6 has no native async ReAct; asyncify runs it on a worker thread
+            # with the caller's dspy settings (LM, adapter) carried over
+            response = await dspy.asyncify(self._generate)(question=question, context=context, history=history)
+            return self._to_prediction(response)
+
+    def _generate(self, question, context, history):
+        with default_lm(), default_adapter(self.adapter):
+            if self.one_shot is not None:
+                response = self.one_shot(question=question, context=context, history=history)
+                if response is not None:
+                    return response
+            return self.react(question=question, context=context, history=history)
+
+    def load_state(self, state):
+        # Programs saved without the one-shot predictors (or only with them) still load
+        for name, param in self.named_parameters():
+            if name in state:
+                param.load_state(state[name])
+
+    def _to_prediction(self, response):
         # ReAct returns the full trace, we need to extract the final prediction
         if hasattr(response, 'answer'):
             return dspy.Prediction(
@@ -108,43 +283,131 @@ class SQLAgent(dspy.Module):
                 sql_query=getattr(response, 'sql_query', '')
             )
         return dspy.Prediction(answer="Error: No valid response generated", sql_query="")
+
+    async def abatch(self, questions, concurrency=8):
+        """Answers `questions` with at most `concurrency` in flight.
+
+        Results keep the input order. A failing question yields an "Error: ..."
+        prediction instead of cancelling the rest of the batch.
+        """
+        questions = list(questions)
+        results = [None] * len(questions)
+        queue = asyncio.Queue(maxsize=concurrency)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, question = item
+                try:
+                    results[index] = await self.aforward(question)
+                except Exception as e:
+                    results[index] = dspy.Prediction(answer=f"Error: {e}", sql_query="", error=e)
+
+        # asyncify shares one limiter sized by async_max_workers
+        with dspy.context(async_max_workers=max(concurrency, dspy.settings.async_max_workers)):
+            workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+            # The bounded queue makes the producer wait while all workers are busy
+            for item in enumerate(questions):
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        return results
+
+    def batch(self, questions, concurrency=8):
+        """Synchronous entry point for abatch."""
+        return asyncio.run(self.abatch(questions, concurrency=concurrency))
     
 
+def execution_metric():
+    """Shared ExecutionMetric holding the gold result hashes of train_data."""
+    return _get_or_create("execution_metric", lambda: ExecutionMetric(train_data))
+
+
 def validate_prediction(example, pred, trace=None):
+    # The predicted SQL must return the gold SQL's result set; how the query
+    # is written (aliases, join order, formatting) does not matter
     try:
-        # For non-SELECT operations
-        if not example.sql_query:
-            return pred.answer.startswith("Sorry, but you are not allowed")
-        
-        # For SELECT queries
-        if not hasattr(pred, 'sql_query') or not pred.sql_query:
-            return False
-            
-        return (example.sql_query.lower().strip() == pred.sql_query.lower().strip() and 
-                example.answer.lower() in pred.answer.lower())
+        return execution_metric()(example, pred, trace)
     except Exception as e:
         print(f"Validation error: {e}")
         return False
 
 
-optimizer = dspy.BootstrapFewShot(
-    metric=validate_prediction,
-    max_bootstrapped_demos=8,
-    max_labeled_demos=8,
-    teacher_settings=dict(lm=dspy.LM('groq/qwen-2.5-32b', api_key=os.getenv('GROQ_API_KEY')))
-)
+def load_agent(path: str = PROGRAM_PATH, cache: bool = False, **kwargs):
+    """Fast start: an SQLAgent with the precompiled demos from `path`, no LM calls.
+
+    With cache=True the agent is wrapped in agent_cache.CachedSQLAgent.
+    """
+    agent = SQLAgent(**kwargs)
+    if path and os.path.exists(path):
+        agent.load(path)
+    if cache:
+        from agent_cache import CachedSQLAgent
+        agent = CachedSQLAgent(agent)
+    return agent
+
+
+def compile_agent(trainset, teacher_lm=None, num_threads=8, checkpoint_dir=CHECKPOINT_DIR, program_path=PROGRAM_PATH):
+    """Bootstraps demos on `trainset`, resuming from `checkpoint_dir` and reusing
+    unchanged demos from `program_path`; pass None for either to start clean."""
+    optimizer = ResumableBootstrapFewShot(
+        metric=validate_prediction,
+        max_bootstrapped_demos=8,
+        max_labeled_demos=8,
+        teacher_settings=dict(lm=teacher_lm or get_lm()),
+        num_threads=num_threads,
+        checkpoint_dir=checkpoint_dir,
+        program_path=program_path,
+    )
 
-agent = SQLAgent()
+    # Compile without the guard so the ReAct predictors still learn to refuse
+    # anything the local guard lets through
+    agent = SQLAgent(guard=False)
 
-# Optimize
-optimized_agent = optimizer.compile(
-    agent, 
-    trainset=train_data[:5]
-)
+    # Optimize
+    with default_lm():
+        optimized_agent = optimizer.compile(agent, trainset=trainset)
+    optimized_agent.guard = True
+    return optimized_agent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="bootstrap few-shot demos and save the program")
+    compile_parser.add_argument("--trainset-size", type=int, default=None, help="first N examples (default: all)")
+    compile_parser.add_argument("--output", default=PROGRAM_PATH)
+    compile_parser.add_argument("--threads", type=int, default=8)
+    compile_parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    compile_parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint and the saved program")
+    compile_parser.add_argument("--store", default=None, help="also publish the program to this program_store directory")
+    demo_parser = commands.add_parser("demo", help="answer a question with the saved program")
+    demo_parser.add_argument("question", nargs="?", default="How many transformers are in stock?")
+    demo_parser.add_argument("--program", default=PROGRAM_PATH)
+    demo_parser.add_argument("--cache", action="store_true", help="wrap the agent in the result cache")
+    args = parser.parse_args()
+
+    dspy.configure(lm=get_lm())
+    if args.command == "compile":
+        optimized_agent = compile_agent(
+            train_data[:args.trainset_size], num_threads=args.threads,
+            checkpoint_dir=None if args.fresh else args.checkpoint_dir,
+            program_path=None if args.fresh else args.output,
+        )
+        optimized_agent.save(args.output)
+        print(f"Saved {args.output}")
+        if args.store:
+            from program_store import ProgramStore
+            notes = f"compile, {len(train_data[:args.trainset_size])} examples"
+            version = ProgramStore(args.store).publish(args.output, notes=notes)
+            print(f"Published {version} to {args.store}")
+    else:
+        response = load_agent(args.program, cache=args.cache)(args.question)
+        print(response.answer)
 
-# Save/Load
-optimized_agent.save('optimized_agent.json')
 
-# Usage remains the same
-response = optimized_agent("How many transformers are in stock?")
-print(response.answer)  # "Sorry, but you are not allowed..."
\ No newline at end of file
+if __name__ == "__main__":
+    main()
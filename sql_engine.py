@@ -0,0 +1,271 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from tracing import span
+from query_guard import QueryTooExpensive, check_query_plan, time_budget
+
+
+## Long-lived SQL execution engine shared by every execute_sql call.
+## One engine (and so one connection pool) is kept per database URL, instead
+## of building a new engine with echo=True on every ReAct tool call.
+
+DEFAULT_DB_PATH = "electrical_parts.db"
+
+# SQLite pragmas applied to every pooled connection
+SQLITE_PRAGMAS = {
+    "query_only": "ON",           # refuse writes even if mode=ro is bypassed
+    "mmap_size": 268435456,       # 256MB memory-mapped reads
+    "cache_size": -16000,         # ~16MB page cache per connection
+    "temp_store": "MEMORY",
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+# Runs blocking queries for async callers; sized to the default pool
+_executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix="sql")
+
+# Limits for results rendered into the LM prompt
+CHUNK_SIZE = 500           # rows fetched per round-trip when streaming
+MAX_PREVIEW_ROWS = 20      # rows shown to the LM
+MAX_PREVIEW_BYTES = 4000   # rendered size of the preview rows
+MAX_CELL_CHARS = 200       # longer values are cut
+MAX_SCAN_ROWS = 100_000    # rows counted/aggregated before giving up on an exact count
+
+
+def sqlite_url(path: str = DEFAULT_DB_PATH, read_only: bool = True) -> str:
+    """Builds a SQLAlchemy URL for a SQLite file, opened read-only by default."""
+    if read_only:
+        return f"sqlite:///file:{path}?mode=ro&uri=true"
+    return f"sqlite:///{path}"
+
+
+DEFAULT_DB_URL = sqlite_url()
+
+
+def sqlite_path(url: str = None) -> str:
+    """The file behind a SQLite URL from sqlite_url, or None for other databases."""
+    url = make_url(url or DEFAULT_DB_URL)
+    path = url.database or ""
+    if not url.drivername.startswith("sqlite") or path in ("", ":memory:"):
+        return None
+    if path.startswith("file:"):
+        # URI filename: "file:<path>?mode=ro&uri=true"
+        path = path[len("file:"):].split("?", 1)[0]
+    return path or None
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL lets readers run alongside a writer. The journal mode is stored in
+        # the database file, so on a read-only connection this only succeeds if
+        # the file was already switched to WAL (see db_setup.create_db).
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        except Exception:
+            pass
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def get_engine(url: str = None, echo: bool = False, pool_size: int = 5, max_overflow: int = 5, pool_timeout: float = 30):
+    """Returns the shared engine for `url`, creating it on first use."""
+    url = url or DEFAULT_DB_URL
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = create_engine(
+                url,
+                echo=echo,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=pool_timeout,
+                connect_args={"check_same_thread": False},
+            )
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", _set_sqlite_pragmas)
+            _engines[url] = engine
+    return engine
+
+
+def dispose_engines():
+    """Closes every pooled connection, e.g. after the database file is replaced."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def _guarded(conn, query: str, budget):
+    """Runs the plan check and returns the time-budget context for `query`."""
+    if budget is None or conn.dialect.name != "sqlite":
+        return nullcontext()
+    check_query_plan(conn, query, budget)
+    return time_budget(conn, budget)
+
+
+def execute_sql(query: str, url: str = None, budget=None):
+    """Executes the SQL query on a pooled connection and fetches results.
+
+    With a query_guard.QueryBudget, expensive plans are rejected and slow
+    queries interrupted; both come back as an error dict with a "reason".
+    """
+    try:
+        with span("sql", stage="sql") as sql_span, get_engine(url).connect() as conn, _guarded(conn, query, budget):
+            result = conn.execute(text(query)).fetchall()
+            sql_span.set(rows=len(result))
+        return result
+    except QueryTooExpensive as e:
+        return e.to_error()
+    except Exception as e:
+        return {"error": str(e), "valid": False}
+
+
+async def aexecute_sql(query: str, url: str = None, budget=None):
+    """Runs execute_sql on a worker thread so the event loop is never blocked."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, contextvars.copy_context().run, execute_sql, query, url, budget)
+
+
+def iter_sql(query: str, url: str = None, chunk_size: int = CHUNK_SIZE, with_columns: bool = False, budget=None):
+    """Yields every result row, fetching `chunk_size` rows at a time.
+
+    With `with_columns`, the column names are yielded first. The connection
+    stays checked out until the iterator is exhausted or closed.
+    """
+    with get_engine(url).connect() as conn, _guarded(conn, query, budget):
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(text(query))
+        if with_columns:
+            yield tuple(result.keys())
+        for partition in result.partitions():
+            yield from partition
+
+
+def _render_cell(value) -> str:
+    value = "NULL" if value is None else str(value)
+    if len(value) > MAX_CELL_CHARS:
+        value = value[:MAX_CELL_CHARS] + "..."
+    return value.replace("\n", " ")
+
+
+def _render_number(value) -> str:
+    return str(round(value, 4) if isinstance(value, float) else value)
+
+
+def _is_key_column(column: str) -> bool:
+    return column.lower() == "id" or column.lower().endswith("_id")
+
+
+class ResultSummary:
+    """Compact, size-bounded view of a query result for the LM.
+
+    Holds the column names, the first rows, the total row count and, when
+    requested, min/max/sum per numeric non-key column. str() renders it for the ReAct
+    trajectory; iter_rows() streams the full result again for callers that
+    need every row.
+    """
+
+    def __init__(self, query: str, url: str, columns: tuple, rows: list, row_count: int,
+                 exact_count: bool, aggregates: dict):
+        self.query = query
+        self.url = url
+        self.columns = columns
+        self.rows = rows
+        self.row_count = row_count
+        self.exact_count = exact_count
+        self.aggregates = aggregates
+
+    @property
+    def truncated(self) -> bool:
+        return len(self.rows) < self.row_count
+
+    def iter_rows(self, chunk_size: int = CHUNK_SIZE):
+        return iter_sql(self.query, self.url, chunk_size)
+
+    def render(self) -> str:
+        if not self.row_count:
+            return f"columns: {' | '.join(self.columns)}\nrows: 0"
+        count = f"{self.row_count}" if self.exact_count else f"more than {self.row_count}"
+        lines = [f"columns: {' | '.join(self.columns)}", f"rows: {count} (showing {len(self.rows)})"]
+        lines.extend(" | ".join(_render_cell(value) for value in row) for row in self.rows)
+        if self.aggregates:
+            scope = "" if self.exact_count else f" over the first {self.row_count} rows"
+            lines.append(f"aggregates{scope}: " + "; ".join(
+                f"{column} min={_render_number(stats['min'])} max={_render_number(stats['max'])} "
+                f"sum={_render_number(stats['sum'])}"
+                for column, stats in self.aggregates.items()
+            ))
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.render()
+
+    __repr__ = __str__
+
+
+def summarize_sql(query: str, url: str = None, max_rows: int = MAX_PREVIEW_ROWS, max_bytes: int = MAX_PREVIEW_BYTES,
+                  max_scan_rows: int = MAX_SCAN_ROWS, aggregates: bool = True, budget=None):
+    """Streams the query and returns a ResultSummary, or the usual error dict.
+
+    Memory stays flat: only the preview rows are kept, everything else is
+    counted (and aggregated) as it streams past.
+    """
+    try:
+        with span("sql", stage="sql") as sql_span:
+            rows = iter_sql(query, url, with_columns=True, budget=budget)
+            try:
+                columns = next(rows)
+                preview, preview_bytes, row_count, exact_count = [], 0, 0, True
+                stats = {}
+                for row in rows:
+                    if row_count >= max_scan_rows:
+                        exact_count = False
+                        break
+                    row_count += 1
+                    if len(preview) < max_rows:
+                        row_bytes = sum(len(_render_cell(value)) + 3 for value in row)
+                        if preview_bytes + row_bytes <= max_bytes or not preview:
+                            preview.append(tuple(row))
+                            preview_bytes += row_bytes
+                        else:
+                            max_rows = len(preview)
+                    if aggregates:
+                        for column, value in zip(columns, row):
+                            if isinstance(value, (int, float)) and not isinstance(value, bool) \
+                                    and not _is_key_column(column):
+                                column_stats = stats.get(column)
+                                if column_stats is None:
+                                    stats[column] = {"min": value, "max": value, "sum": value}
+                                else:
+                                    column_stats["min"] = min(column_stats["min"], value)
+                                    column_stats["max"] = max(column_stats["max"], value)
+                                    column_stats["sum"] += value
+            finally:
+                rows.close()
+            sql_span.set(rows=row_count, exact=exact_count)
+        # Aggregates over a single row repeat the row itself
+        stats = stats if row_count > 1 else {}
+        return ResultSummary(query, url, columns, preview, row_count, exact_count, stats)
+    except QueryTooExpensive as e:
+        return e.to_error()
+    except Exception as e:
+        return {"error": str(e), "valid": False}
+
+
+async def asummarize_sql(query: str, url: str = None, **limits):
+    """Runs summarize_sql on a worker thread so the event loop is never blocked."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, contextvars.copy_context().run, functools.partial(summarize_sql, query, url, **limits)
+    )
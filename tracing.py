@@ -0,0 +1,336 @@
+import argparse
+import contextvars
+import itertools
+import json
+import math
+import sys
+import threading
+import time
+from collections import defaultdict
+import dspy
+from dspy.utils.callback import BaseCallback
+import metrics
+
+
+## Lightweight tracing for the agent pipeline.
+## `span(name, **attrs)` times a block and links it to the enclosing span.
+## Each finished span lands in an in-process latency histogram (p50/p95/p99),
+## adds its numeric attributes (tokens, rows) to per-name totals and, when an
+## export path is set, is written as one JSON line. The instrumented points are:
+##   agent             one SQLAgent question
+##   retrieval         RetrieveSchema, with retrieval.embed and retrieval.query (one per Chroma query)
+##   react.iteration   one ReAct step (tool choice), react.extract for the final answer
+##   lm                one LM call with prompt/completion tokens
+##   tool              one tool call (execute_sql), with sql underneath (rows)
+## While tracing is disabled, span() returns a shared no-op object after one
+## global check, unless a collect_stages() caller wants the stage timing.
+##   python tracing.py report --offline --export traces.jsonl
+##   python tracing.py summarize traces.jsonl
+
+_enabled = False
+_current = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+_lock = threading.Lock()
+_histograms = {}
+_totals = defaultdict(lambda: defaultdict(float))
+_export = None
+
+
+class LatencyHistogram:
+    """Log-bucketed latencies: constant memory, percentiles within ~2%."""
+
+    GROWTH = 1.02
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float):
+        index = math.ceil(math.log(ms, self.GROWTH)) if ms > 0.001 else -1000
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(p / 100 * self.count), 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.GROWTH ** index, self.max) if index > -1000 else 0.0
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Span:
+    __slots__ = ("name", "attrs", "stage", "span_id", "parent_id", "trace_id", "start", "wall_start",
+                 "duration", "_token")
+
+    def __init__(self, name: str, stage: str = None, attrs: dict = None):
+        self.name = name
+        self.stage = stage
+        self.attrs = attrs or {}
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        parent = _current.get()
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self._token = _current.set(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        if self.stage:
+            metrics.record_stage(self.stage, self.duration)
+        if _enabled:
+            _finish(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start": self.wall_start, "duration_ms": self.duration * 1000,
+            "thread": threading.current_thread().name, "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, stage: str = None, **attrs):
+    """Times a block as `name`; with `stage`, also feeds metrics.collect_stages()."""
+    if not _enabled and (stage is None or not metrics.collecting()):
+        return NOOP_SPAN
+    return Span(name, stage, attrs)
+
+
+def current_span():
+    return _current.get()
+
+
+def _finish(finished: Span):
+    ms = finished.duration * 1000
+    numeric = {k: v for k, v in finished.attrs.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    line = json.dumps(finished.to_dict(), default=str) if _export else None
+    with _lock:
+        histogram = _histograms.get(finished.name)
+        if histogram is None:
+            histogram = _histograms[finished.name] = LatencyHistogram()
+        histogram.add(ms)
+        for key, value in numeric.items():
+            _totals[finished.name][key] += value
+        if line is not None:
+            _export.write(line + "\n")
+
+
+def enable(export_path: str = None):
+    """Turns tracing on; spans are appended to `export_path` as JSON lines if given."""
+    global _enabled, _export
+    with _lock:
+        if export_path and _export is None:
+            _export = open(export_path, "a", buffering=1024 * 1024)
+        _enabled = True
+
+
+def disable():
+    global _enabled, _export
+    with _lock:
+        _enabled = False
+        if _export is not None:
+            _export.close()
+            _export = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _totals.clear()
+
+
+def report() -> dict:
+    """{span name: latency summary (ms) + totals of numeric attributes}."""
+    with _lock:
+        return {
+            name: {**histogram.summary(), "totals": dict(_totals.get(name, {}))}
+            for name, histogram in sorted(_histograms.items())
+        }
+
+
+def format_report(summary: dict) -> str:
+    lines = [f"{'span':<18} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  totals"]
+    for name, stats in summary.items():
+        totals = "  ".join(f"{key}={value:g}" for key, value in stats["totals"].items())
+        lines.append(f"{name:<18} {stats['count']:>6} {stats['p50']:>9.2f} {stats['p95']:>9.2f} "
+                     f"{stats['p99']:>9.2f} {stats['max']:>9.2f}  {totals}")
+    return "\n".join(lines)
+
+
+def summarize_export(path: str) -> dict:
+    """Rebuilds report() from an exported JSON lines file."""
+    histograms, totals = defaultdict(LatencyHistogram), defaultdict(lambda: defaultdict(float))
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            histograms[record["name"]].add(record["duration_ms"])
+            for key, value in record["attrs"].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[record["name"]][key] += value
+    return {name: {**histograms[name].summary(), "totals": dict(totals[name])} for name in sorted(histograms)}
+
+
+def _lm_usage(instance, messages) -> dict:
+    # BaseLM.__call__ logs the request (same messages object) with its usage
+    for entry in reversed(getattr(instance, "history", [])[-64:]):
+        if entry.get("messages") is messages:
+            usage = entry.get("usage") or {}
+            return {key: usage[key] for key in ("prompt_tokens", "completion_tokens", "total_tokens") if key in usage}
+    return {}
+
+
+class TracingCallback(BaseCallback):
+    """Opens spans for ReAct steps, LM calls and tool calls.
+
+    dspy.context(callbacks=[TracingCallback()]) or tracing.install()
+    """
+
+    def __init__(self):
+        self._spans = {}
+
+    def _open(self, call_id, name: str, context=None, **attrs):
+        if _enabled:
+            self._spans[call_id] = (Span(name, attrs=attrs).__enter__(), context)
+
+    def _close(self, call_id, exception=None, **attrs):
+        opened = self._spans.pop(call_id, None)
+        if opened is not None:
+            opened[0].set(**attrs).__exit__(type(exception) if exception else None, exception, None)
+
+    def on_module_start(self, call_id, instance, inputs):
+        if isinstance(instance, dspy.Predict):
+            outputs = instance.signature.output_fields
+            if "next_tool_name" in outputs:
+                self._open(call_id, "react.iteration")
+            else:
+                self._open(call_id, "react.extract" if "answer" in outputs else "predict")
+
+    def on_module_end(self, call_id, outputs, exception=None):
+        tool = outputs.get("next_tool_name") if isinstance(outputs, dspy.Prediction) else None
+        self._close(call_id, exception, **({"tool": tool} if tool else {}))
+
+    def on_lm_start(self, call_id, instance, inputs):
+        self._open(call_id, "lm", context=(instance, inputs.get("messages")), model=getattr(instance, "model", None))
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        opened = self._spans.get(call_id)
+        usage = _lm_usage(*opened[1]) if opened is not None and exception is None else {}
+        self._close(call_id, exception, **usage)
+
+    def on_tool_start(self, call_id, instance, inputs):
+        self._open(call_id, "tool", tool=getattr(instance, "name", None))
+
+    def on_tool_end(self, call_id, outputs, exception=None):
+        self._close(call_id, exception)
+
+
+_callback = TracingCallback()
+
+
+def install():
+    """Adds the tracing callback to dspy's global callbacks (call from the configuring thread)."""
+    if _callback not in dspy.settings.callbacks:
+        dspy.settings.configure(callbacks=[*dspy.settings.callbacks, _callback])
+    return _callback
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="trace SQLAgent over train_data and print the summary")
+    report_parser.add_argument("--offline", action="store_true", help="use FakeLM and an in-memory schema collection")
+    report_parser.add_argument("--lm-latency-ms", type=float, default=0.0)
+    report_parser.add_argument("--no-guard", action="store_true", help="send write requests through the full pipeline")
+    report_parser.add_argument("--program", default="optimized_agent.json")
+    report_parser.add_argument("--export", default=None, help="append spans to this JSON lines file")
+    report_parser.add_argument("--json", action="store_true")
+    summarize_parser = commands.add_parser("summarize", help="summarize an exported JSON lines file")
+    summarize_parser.add_argument("path")
+    summarize_parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "summarize":
+        summary = summarize_export(args.path)
+    else:
+        from evaluate_agent import build_agent
+        from train_set import train_data
+        from sql_agent import get_lm
+        if args.offline:
+            from fake_lm import FakeLM
+            lm = FakeLM({example.question: example.sql_query for example in train_data}, latency_ms=args.lm_latency_ms)
+        else:
+            lm = get_lm()
+        dspy.configure(lm=lm)
+        install()
+        agent = build_agent(offline=args.offline, guard=not args.no_guard, program_path=args.program)
+        enable(args.export)
+        try:
+            for example in train_data:
+                agent(**example.inputs())
+        finally:
+            disable()
+        summary = report()
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(format_report(summary))
+    if not summary:
+        print("no spans recorded", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # Run through the importable module so the pipeline's spans and this
+    # command share one tracing state
+    from tracing import main
+    main()
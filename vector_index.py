@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import struct
+import numpy as np
+from schema_indexer import embedding_key
+
+
+## In-process vector index for schema chunks, a RetrieveSchema backend.
+## Chunk embeddings sit in one float32 matrix, rows grouped by chunk type so
+## a type filter is a contiguous view. Equality filters on metadata use
+## boolean masks precomputed at load, and top-k is one matrix-vector product
+## plus argpartition. Ranking is by L2 distance (|x|^2 - 2 x.q), the same
+## order as Chroma's default space, so both backends return the same chunks.
+## The snapshot is a single file: magic, JSON header (ids, metadata,
+## embedding function), then the raw matrix, memory-mapped on load.
+##   python vector_index.py build --source chroma --output schema_index.vidx
+##   SQL_AGENT_SCHEMA_INDEX=schema_index.vidx python sql_agent.py demo "..."
+
+MAGIC = b"SQLVIDX1"
+ALIGNMENT = 64
+SNAPSHOT_PATH = "schema_index.vidx"
+# Metadata too specific to filter on
+UNMASKED_KEYS = {"content_hash", "columns"}
+
+
+def _embedding_function_from(spec: dict):
+    """Rebuilds the embedding function recorded in a snapshot header."""
+    from local_embedding import HashingEmbeddingFunction
+    if spec["name"] == HashingEmbeddingFunction.name():
+        return HashingEmbeddingFunction.build_from_config(spec["config"])
+    from chromadb.utils.embedding_functions import known_embedding_functions
+    if spec["name"] in known_embedding_functions:
+        return known_embedding_functions[spec["name"]].build_from_config(spec["config"])
+    raise ValueError(f"Unknown embedding function {spec['name']!r}; pass embedding_function=")
+
+
+class VectorIndex:
+    """NumPy top-k search over schema chunks with precomputed metadata masks."""
+
+    parallel_queries = False
+
+    def __init__(self, ids: list, metadatas: list, embeddings, embedding_function=None, embedding: str = None):
+        # Group rows by chunk type so `type` filters select a contiguous block
+        order = sorted(range(len(ids)), key=lambda i: (str(metadatas[i].get("type")), ids[i]))
+        if order != list(range(len(ids))):
+            ids = [ids[i] for i in order]
+            metadatas = [metadatas[i] for i in order]
+            embeddings = np.asarray(embeddings, dtype=np.float32)[order]
+        self.ids = list(ids)
+        self.metadatas = list(metadatas)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        self.embedding_function = embedding_function
+        self.embedding = embedding or embedding_key(embedding_function)
+        self.masks = {}
+        for row, metadata in enumerate(self.metadatas):
+            for key, value in metadata.items():
+                if key not in UNMASKED_KEYS and isinstance(value, (str, int, float, bool)):
+                    mask = self.masks.get((key, value))
+                    if mask is None:
+                        mask = self.masks[(key, value)] = np.zeros(len(self.ids), dtype=bool)
+                    mask[row] = True
+        self._blocks = {}
+        self._column_map = {m["table"]: m["columns"] for m in self.metadatas if m.get("type") == "column"}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __deepcopy__(self, memo):
+        return self  # read-only, shared by module copies
+
+    def _block(self, where: dict):
+        """(row numbers, matrix, squared norms) for an equality filter, cached."""
+        key = tuple(sorted((where or {}).items()))
+        block = self._blocks.get(key)
+        if block is None:
+            mask = np.ones(len(self.ids), dtype=bool)
+            for item in key:
+                mask &= self.masks.get(item, np.zeros(len(self.ids), dtype=bool))
+            rows = np.flatnonzero(mask)
+            if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+                matrix = self.embeddings[rows[0]:rows[-1] + 1]  # a view, no copy
+            else:
+                matrix = self.embeddings[rows]
+            block = self._blocks[key] = (rows, matrix, np.einsum("ij,ij->i", matrix, matrix))
+        return block
+
+    def search(self, query_embedding, n_results: int, where: dict = None) -> list:
+        """Row numbers of the `n_results` nearest chunks matching `where`, nearest first."""
+        rows, matrix, norms = self._block(where)
+        if not len(rows):
+            return []
+        scores = norms - 2.0 * (matrix @ np.asarray(query_embedding, dtype=np.float32))
+        k = min(n_results, len(rows))
+        top = np.argpartition(scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(scores[top], kind="stable")]
+        return rows[top].tolist()
+
+    # RetrieveSchema backend interface
+    def embed(self, user_query: str):
+        if self.embedding_function is None:
+            raise ValueError("VectorIndex has no embedding function to embed queries with")
+        return self.embedding_function([user_query])[0]
+
+    def query(self, query_embedding, chunk_type: str, n_results: int) -> list:
+        return [self.metadatas[row] for row in self.search(query_embedding, n_results, {"type": chunk_type})]
+
+    def column_map(self) -> dict:
+        return self._column_map
+
+    @classmethod
+    def from_collection(cls, collection):
+        """Copies ids, metadata and stored embeddings out of a Chroma collection."""
+        results = collection.get(include=["embeddings", "metadatas"])
+        return cls(results["ids"], results["metadatas"], results["embeddings"],
+                   embedding_function=collection._embedding_function)
+
+    @classmethod
+    def from_chunks(cls, chunks: list, embedding_function):
+        """Embeds schema_indexer chunks in one batch."""
+        embeddings = embedding_function([chunk["text"] for chunk in chunks])
+        return cls([chunk["id"] for chunk in chunks], [chunk["metadata"] for chunk in chunks], embeddings,
+                   embedding_function=embedding_function)
+
+    def save(self, path: str = SNAPSHOT_PATH):
+        """Writes the snapshot atomically (temp file + rename)."""
+        spec = None
+        if self.embedding_function is not None:
+            try:
+                spec = {"name": self.embedding_function.name(), "config": self.embedding_function.get_config()}
+            except Exception:
+                pass
+        header = {
+            "version": 1, "count": len(self.ids), "dim": int(self.embeddings.shape[1]) if len(self.ids) else 0,
+            "ids": self.ids, "metadatas": self.metadatas, "embedding": self.embedding, "embedding_function": spec,
+        }
+        encoded = json.dumps(header, ensure_ascii=False).encode()
+        prefix = len(MAGIC) + 8 + len(encoded)
+        padding = -prefix % ALIGNMENT
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded + b"\0" * padding)
+            f.write(np.ascontiguousarray(self.embeddings, dtype="<f4").tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = SNAPSHOT_PATH, embedding_function=None, mmap: bool = True):
+        """Opens a snapshot; the matrix is memory-mapped unless mmap=False."""
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a vector index snapshot")
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length))
+        offset = len(MAGIC) + 8 + length
+        offset += -offset % ALIGNMENT
+        shape = (header["count"], header["dim"])
+        if not header["count"]:
+            embeddings = np.zeros(shape, dtype=np.float32)
+        elif mmap:
+            embeddings = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=shape)
+        else:
+            embeddings = np.fromfile(path, dtype="<f4", offset=offset).reshape(shape)
+
+        if embedding_function is None and header["embedding_function"]:
+            embedding_function = _embedding_function_from(header["embedding_function"])
+        if embedding_function is not None and embedding_key(embedding_function) != header["embedding"]:
+            raise ValueError(f"{path} was built with {header['embedding']}, not {embedding_key(embedding_function)}")
+        return cls(header["ids"], header["metadatas"], embeddings, embedding_function=embedding_function,
+                   embedding=header["embedding"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="write a snapshot of the schema chunks")
+    build.add_argument("--source", choices=["chroma", "db", "metadata"], default="chroma",
+                       help="copy the Chroma collection, or embed chunks reflected from the db / db_setup.metadata")
+    build.add_argument("--output", default=SNAPSHOT_PATH)
+    build.add_argument("--hashing-dim", type=int, default=None,
+                       help="embed with the offline HashingEmbeddingFunction instead of Chroma's default")
+    info = commands.add_parser("info", help="describe a snapshot")
+    info.add_argument("path", nargs="?", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        index = VectorIndex.load(args.path)
+        types = {}
+        for metadata in index.metadatas:
+            types[metadata.get("type")] = types.get(metadata.get("type"), 0) + 1
+        print(json.dumps({"chunks": len(index), "dim": index.embeddings.shape[1], "types": types,
+                          "embedding": index.embedding, "bytes": os.path.getsize(args.path)}))
+        return
+
+    if args.source == "chroma":
+        from sql_agent import get_collection
+        index = VectorIndex.from_collection(get_collection())
+    else:
+        from schema_indexer import declared_schema, reflect_schema, schema_chunks
+        if args.hashing_dim:
+            from local_embedding import HashingEmbeddingFunction
+            embedding_function = HashingEmbeddingFunction(dim=args.hashing_dim)
+        else:
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+            embedding_function = DefaultEmbeddingFunction()
+        metadata = reflect_schema() if args.source == "db" else declared_schema()
+        index = VectorIndex.from_chunks(schema_chunks(metadata), embedding_function)
+    index.save(args.output)
+    print(f"wrote {len(index)} chunks to {args.output} ({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()